@@ -0,0 +1,66 @@
+import sys
+sys.path.append('.')
+
+import numpy as np
+import scipy.sparse as sp
+import argparse
+import glob
+import os
+import pickle
+
+from kga.data import write_bundle, Ragged
+
+
+parser = argparse.ArgumentParser(
+    description='Pack data/<dataset>/bin into a single memory-mappable bundle, see kga.data.Dataset'
+)
+
+parser.add_argument('--dataset', default='fb15k', metavar='',
+                    help='dataset in data/ to be packed (default: fb15k)')
+parser.add_argument('--out', default=None, metavar='',
+                    help='output file (default: data/<dataset>/bin/bundle.kgb)')
+
+args = parser.parse_args()
+
+
+dataset_dir = 'data/{}'.format(args.dataset)
+bin_dir = '{}/bin'.format(dataset_dir)
+out = args.out or '{}/bundle.kgb'.format(bin_dir)
+
+arrays = {}
+
+for path in sorted(glob.glob('{}/*.npy'.format(bin_dir))):
+    name = os.path.basename(path)[:-4]
+    arr = np.load(path, allow_pickle=True)
+
+    # Lists of variable length, e.g. the evaluation filters
+    if arr.dtype == object and arr.ndim == 1 and len(arr) and not isinstance(arr[0], str):
+        arr = Ragged.from_lists(arr)
+
+    arrays[name] = arr
+
+for path in sorted(glob.glob('{}/*.npz'.format(bin_dir))):
+    name = os.path.basename(path)[:-4]
+
+    with np.load(path, allow_pickle=True) as npz:
+        keys = set(npz.keys())
+
+    if {'format', 'shape', 'data'} <= keys:
+        arrays[name] = sp.load_npz(path)
+    else:
+        with np.load(path, allow_pickle=True) as npz:
+            for key in keys:
+                arrays['{}.{}'.format(name, key)] = npz[key]
+
+# Text vocabulary, as the list of words by id
+vocab_path = '{}/vocabulary_text.pickle'.format(dataset_dir)
+if os.path.exists(vocab_path):
+    with open(vocab_path, 'rb') as f:
+        vocabulary = pickle.load(f)
+    arrays['vocabulary'] = np.array(sorted(vocabulary, key=vocabulary.get))
+
+write_bundle(out, arrays)
+
+print('Packed {} arrays into {} ({:.1f} MB)'.format(len(arrays), out, os.path.getsize(out) / 2**20))
+for name in sorted(arrays):
+    print('    {}'.format(name))
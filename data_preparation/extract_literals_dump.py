@@ -0,0 +1,83 @@
+import argparse
+import numpy as np
+import scipy.sparse as sp
+from collections import Counter
+
+from ntriples_literals import *
+
+
+parser = argparse.ArgumentParser(
+    description='Extract the literals of the FB15k entities from local N-Triples dumps'
+)
+
+parser.add_argument('dumps', nargs='+', metavar='FILE',
+                    help='N-Triples files, plain or gzipped, e.g. freebase-rdf-latest.gz')
+parser.add_argument('--n_jobs', type=int, default=None, metavar='',
+                    help='number of processes (default: number of CPUs)')
+parser.add_argument('--chunk_mb', type=int, default=256, metavar='',
+                    help='size of the byte ranges of plain files in MiB (default: 256)')
+parser.add_argument('--language', default='en', metavar='',
+                    help='language of the text literals (default: en)')
+parser.add_argument('--arrays', default=False, action='store_true',
+                    help='also write the sparse entity-level numerical table of prepare_numerical_literals_fb15k.py')
+
+args = parser.parse_args()
+
+
+prefix = 'http://rdf.freebase.com/ns/'
+
+idx2entity = np.load('../data/fb15k/bin/idx2ent.npy')
+idx2entity = np.array([idx[1:].replace('/','.') for idx in idx2entity])
+entities_ = [prefix + entity for entity in idx2entity]
+print('Total Entities:', len(entities_))
+
+numerical_path = '../data/fb15k-literal/fb15k_numerical_triples.txt'
+string_path = '../data/fb15k-literal/fb15k_string_triples.txt'
+
+n_numerical, n_text = extract_literals(
+    args.dumps, entities_, numerical_path, string_path, language=args.language,
+    n_jobs=args.n_jobs, chunk_size=args.chunk_mb << 20
+)
+print('Numerical triples: {}; text triples: {}'.format(n_numerical, n_text))
+
+# Text literal filter of prepare_text_literals_fb15k.py
+predicate_freq = Counter()
+with open(string_path) as f:
+    for line in f:
+        predicate_freq[line.split('\t', 2)[1]] += 1
+
+with open(string_path) as f, open('../data/fb15k-literal/filtered-string-literal-fb15k.txt', 'w') as out:
+    for line in f:
+        p = line.split('\t', 2)[1]
+        if ('http://rdf.freebase.com/ns/common.topic.description' in p or predicate_freq[p] > 5) \
+                and 'http://rdf.freebase.com/ns/common.topic.alias' not in p:
+            out.write(line)
+
+if args.arrays:
+    # Same table as prepare_numerical_literals_fb15k.py, later triples win
+    ent2idx = {entity: i for i, entity in enumerate(idx2entity)}
+    attr2idx = {}
+    literals = {}
+
+    with open(numerical_path) as f:
+        for line in f:
+            s, p, v = line.rstrip('\n').split('\t')
+            row = ent2idx.get(s[len(prefix)+1:-1])
+            if row is None:
+                continue
+            col = attr2idx.setdefault(p, len(attr2idx))
+            literals[row, col] = float(v)
+
+    rows, cols = zip(*literals.keys()) if literals else ((), ())
+
+    # Stored entries are the present literals, values of 0 included
+    X_lit = sp.csr_matrix((np.array(list(literals.values()), dtype=np.float32), (rows, cols)),
+                          shape=(len(idx2entity), len(attr2idx)))
+
+    idx2attr = np.array(sorted(attr2idx, key=attr2idx.get))
+
+    np.save('../data/fb15k-literal/bin/idx2ent.npy', idx2entity)
+    sp.save_npz('../data/fb15k-literal/bin/numerical_literals_raw.npz', X_lit)
+    np.save('../data/fb15k-literal/bin/idx2attr.npy', idx2attr)
+
+    print('Entities: {}; attributes: {}; literals: {}'.format(X_lit.shape[0], X_lit.shape[1], X_lit.nnz))
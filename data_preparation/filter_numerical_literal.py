@@ -1,21 +1,21 @@
-import pandas as pd
-import pdb
+import numpy as np
+import scipy.sparse as sp
 
 
+# Attribute filtering on the sparse entity x attribute table. Written to new
+# files, so that rerunning it never filters an already filtered table.
+X_lit = sp.load_npz('../data/fb15k-literal/bin/numerical_literals_raw.npz').tocsr()
+idx2attr = np.load('../data/fb15k-literal/bin/idx2attr.npy')
 
-literal_data = pd.read_csv('../data/fb15k-literal/entity_numerical_literal.csv',index_col=0)
-literal_count = pd.read_csv('../data/fb15k-literal/frequency-count-numerical.txt', header = None, sep = '\t')
-
-literal_count = literal_count.values
-literal_map = {literal_count[idx,0]:literal_count[idx,1] for idx in range(len(literal_count))}
 ## Literal filtering
-filtered_predicate = {predicate : count for predicate, count in literal_map.items() if (('http://rdf.freebase.com/key/' not in predicate) and count>5)}	
-print('Predicate after filtering', len(filtered_predicate))
-drop_columns = list(set(literal_data.columns) - set(filtered_predicate.keys())-{'Unnamed: 0'})
-literal_data = literal_data.drop(drop_columns, axis=1)
-
-literal_data.to_csv('../data/fb15k-literal/entity_filtered_literal.csv', sep=',')
-df = pd.Series(filtered_predicate)
-df.to_csv('../data/fb15k-literal/filtered-numerical-frequency-count.txt', sep='\t', header=None)
+count = X_lit.getnnz(axis=0)
+is_key = np.array(['http://rdf.freebase.com/key/' in attr for attr in idx2attr], dtype=bool)
+keep = np.where(~is_key & (count > 5))[0]
+print('Predicate after filtering', len(keep))
 
+sp.save_npz('../data/fb15k-literal/bin/numerical_literals_filtered.npz', X_lit[:, keep].tocsr())
+np.save('../data/fb15k-literal/bin/idx2attr_filtered.npy', idx2attr[keep])
 
+with open('../data/fb15k-literal/filtered-numerical-frequency-count.txt', 'w') as f:
+	for attr, c in zip(idx2attr[keep], count[keep]):
+		f.write(attr + '\t' + str(c) + '\n')
@@ -0,0 +1,55 @@
+import sys
+sys.path.append('.')
+
+from kga.synthetic import generate
+import argparse
+
+
+parser = argparse.ArgumentParser(
+    description='Generate synthetic KG with literals for scaling experiments'
+)
+
+parser.add_argument('out_dir', metavar='DIR',
+                    help='dataset directory, files are written to DIR/bin')
+parser.add_argument('--n_e', type=int, default=1000000, metavar='',
+                    help='number of entities (default: 1000000)')
+parser.add_argument('--n_r', type=int, default=1000, metavar='',
+                    help='number of relations (default: 1000)')
+parser.add_argument('--n_triples', type=int, default=10000000, metavar='',
+                    help='number of training triples (default: 10000000)')
+parser.add_argument('--n_val', type=int, default=5000, metavar='',
+                    help='number of validation triples (default: 5000)')
+parser.add_argument('--n_test', type=int, default=5000, metavar='',
+                    help='number of test triples (default: 5000)')
+parser.add_argument('--alpha', type=float, default=1.0, metavar='',
+                    help='power law exponent of entity degrees (default: 1.0)')
+parser.add_argument('--rel_alpha', type=float, default=0.5, metavar='',
+                    help='power law exponent of relation frequencies (default: 0.5)')
+parser.add_argument('--cardinality', type=float, nargs=4, default=[0.1, 0.2, 0.2, 0.5], metavar='',
+                    help='proportion of 1-1, 1-N, N-1, N-N relations (default: 0.1 0.2 0.2 0.5)')
+parser.add_argument('--fanout', type=int, default=10, metavar='',
+                    help='average fanout of 1-N and N-1 relations (default: 10)')
+parser.add_argument('--n_lit', type=int, default=0, metavar='',
+                    help='number of numerical literal attributes, 0 to skip (default: 0)')
+parser.add_argument('--lit_density', type=float, default=0.05, metavar='',
+                    help='fraction of present numerical literals (default: 0.05)')
+parser.add_argument('--text_len', type=int, default=0, metavar='',
+                    help='max tokens of text literals, 0 to skip (default: 0)')
+parser.add_argument('--vocab_size', type=int, default=10000, metavar='',
+                    help='vocabulary size of text literals (default: 10000)')
+parser.add_argument('--image', default=False, action='store_true',
+                    help='whether to generate 512-d image literals')
+parser.add_argument('--chunk_size', type=int, default=1000000, metavar='',
+                    help='number of rows generated at once (default: 1000000)')
+parser.add_argument('--randseed', default=9999, type=int, metavar='',
+                    help='random seed (default: 9999)')
+
+args = parser.parse_args()
+
+generate(
+    args.out_dir, args.n_e, args.n_r, args.n_triples, n_val=args.n_val,
+    n_test=args.n_test, n_lit=args.n_lit, lit_density=args.lit_density,
+    text_len=args.text_len, vocab_size=args.vocab_size, image=args.image,
+    chunk_size=args.chunk_size, alpha=args.alpha, rel_alpha=args.rel_alpha,
+    cardinality=args.cardinality, fanout=args.fanout, seed=args.randseed
+)
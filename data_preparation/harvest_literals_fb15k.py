@@ -0,0 +1,46 @@
+import argparse
+
+from sparql_harvester import *
+
+
+parser = argparse.ArgumentParser(
+    description='Harvest numerical and text literals of the FB15k entities from a SPARQL endpoint'
+)
+
+parser.add_argument('--endpoint', default='http://drogon:8890/sparql', metavar='',
+                    help='SPARQL endpoint, e.g. of sparql_stub.py (default: http://drogon:8890/sparql)')
+parser.add_argument('--cache', default='../data/fb15k-literal/literal_cache.sqlite', metavar='',
+                    help='sqlite cache of the harvested literals (default: ../data/fb15k-literal/literal_cache.sqlite)')
+parser.add_argument('--batch_size', type=int, default=50, metavar='',
+                    help='number of entities per query (default: 50)')
+parser.add_argument('--n_threads', type=int, default=8, metavar='',
+                    help='number of concurrent queries (default: 8)')
+parser.add_argument('--max_rows', type=int, default=10000, metavar='',
+                    help='result row limit of the endpoint (default: 10000)')
+parser.add_argument('--language', default='EN', metavar='',
+                    help='language of the text literals (default: EN)')
+
+args = parser.parse_args()
+
+
+filename = '../data/fb15k/freebase_mtr100_mte100-train.txt'
+entities_ = set()
+with open(filename) as f:
+    for line in f:
+        s, _, o = line.rstrip('\n').split('\t')
+        entities_.update([s, o])
+
+entities_ = ['http://rdf.freebase.com/ns/' + entity[1:].replace('/', '.') for entity in sorted(entities_)]
+print('Total Entities:', len(entities_))
+
+cache = harvest(entities_, args.endpoint, args.cache, batch_size=args.batch_size,
+                n_threads=args.n_threads, max_rows=args.max_rows)
+
+# Literals for FB15K
+n_numerical, n_text = write_literals(
+    cache, entities_, '../data/fb15k-literal/fb15k_numerical_triples.txt',
+    '../data/fb15k-literal/fb15k_string_triples.txt', language=args.language
+)
+cache.close()
+
+print('Numerical triples: {}; text triples: {}'.format(n_numerical, n_text))
@@ -0,0 +1,248 @@
+import numpy as np
+import torch
+import torch.nn as nn
+from torchvision import models
+from torchvision import transforms
+from PIL import Image
+
+import os
+import re
+import unicodedata
+
+
+"""
+Resumable ResNet-18 feature extraction for image literals, shared by
+preprocess_img_yago.py and preprocess_img_ml.py.
+
+Outputs, next to `out_path`:
+    {out_path}                  n_e x 512 memory-mapped .npy, zero for entities without image
+    {out_path}.done.npy         completion bitmap over the manifest entries
+    {out_path}.corrupt.txt      images that could not be decoded
+"""
+
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+
+
+def build_manifest(img_dir, resolve, manifest_path):
+    """
+    Map every image under `img_dir` to an entity id and write the mapping as
+    a TSV of `entity_id<TAB>path`. An existing manifest is reused as is, so
+    that the completion bitmap of a resumed run refers to the same entries.
+
+    Params:
+    -------
+        img_dir: string
+            Directory of the images, walked recursively.
+
+        resolve: function
+            Filename stem (without extension) to entity id, None to skip.
+
+        manifest_path: string
+
+    Returns:
+    --------
+        manifest: list of (int, string)
+    """
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            return [(int(idx), path) for idx, path in (line.rstrip('\n').split('\t', 1) for line in f)]
+
+    manifest = []
+    skipped = 0
+
+    for root, _, files in os.walk(img_dir):
+        for filename in sorted(files):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() not in IMG_EXTENSIONS:
+                continue
+
+            idx = resolve(stem)
+
+            if idx is None:
+                skipped += 1
+            else:
+                manifest.append((idx, os.path.join(root, filename)))
+
+    manifest.sort(key=lambda x: x[1])
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        for idx, path in manifest:
+            f.write('{}\t{}\n'.format(idx, path))
+
+    print('Manifest: {} images; {} without entity'.format(len(manifest), skipped))
+
+    return manifest
+
+
+def entity_name_resolver(idx2ent):
+    """
+    Resolver of filenames named after the entity, in any Unicode normal form.
+    Duplicates suffixed by `-<n>` fall back to the entity without the suffix.
+    """
+    ent2idx = {unicodedata.normalize('NFC', e): idx for idx, e in enumerate(idx2ent)}
+
+    def resolve(stem):
+        stem = unicodedata.normalize('NFC', stem)
+        if stem in ent2idx:
+            return ent2idx[stem]
+        return ent2idx.get(re.sub(r'-\d+$', '', stem))
+
+    return resolve
+
+
+def trailing_number_resolver(offset=-1):
+    """
+    Resolver of filenames ending with a number, e.g. movie ids of ml-100k:
+    the entity id is that number plus `offset`.
+    """
+    def resolve(stem):
+        m = re.search(r'(\d+)$', stem)
+        return None if m is None else int(m.group(1)) + offset
+
+    return resolve
+
+
+class ManifestImages(torch.utils.data.Dataset):
+    """
+    Images of a manifest. Decoding is verified in the DataLoader workers:
+    corrupted images come back as zeros with ok = False instead of failing
+    the whole batch.
+    """
+
+    def __init__(self, manifest, transform):
+        self.manifest = manifest
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def __getitem__(self, index):
+        _, path = self.manifest[index]
+
+        try:
+            with Image.open(path) as img:
+                img.verify()
+            # verify() leaves the file unusable, decode from a fresh handle
+            with Image.open(path) as img:
+                img = self.transform(img.convert('RGB'))
+            ok = True
+        except Exception:
+            img = torch.zeros(3, 224, 224)
+            ok = False
+
+        return img, index, ok
+
+
+def resnet18_features():
+    """
+    Pretrained ResNet-18 without its last fc layer: 512-d features.
+    """
+    try:
+        model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
+    except AttributeError:
+        # torchvision < 0.13
+        model = models.resnet18(pretrained=True)
+
+    return nn.Sequential(*list(model.children())[:-1])
+
+
+def extract_features(manifest, n_e, out_path, batch_size=256, workers=4, threads=None,
+                     fp16=False, shard_size=10000, gpu=False):
+    """
+    Extract the features of all manifest images into row `entity_id` of a
+    memory-mapped n_e x 512 array. Work is done in shards of `shard_size`
+    images: after each shard the array is flushed and the completion bitmap
+    saved, so that an interrupted run resumes from the last complete shard.
+
+    Params:
+    -------
+        manifest: list of (int, string)
+            Entity id and path of every image, as of `build_manifest`.
+
+        n_e: int
+            Number of rows of the output.
+
+        out_path: string
+            .npy file of the features.
+
+        threads: int, default: None
+            Number of intra-op CPU threads. Defaults to torch's choice.
+
+        fp16: bool, default: False
+            Whether to store float16 instead of float32.
+
+    Returns:
+    --------
+        features: np.memmap of n_e x 512
+    """
+    if threads is not None:
+        torch.set_num_threads(threads)
+
+    dtype = np.float16 if fp16 else np.float32
+    done_path = '{}.done.npy'.format(out_path)
+
+    if os.path.exists(out_path) and os.path.exists(done_path):
+        features = np.load(out_path, mmap_mode='r+')
+        done = np.load(done_path)
+        if features.shape != (n_e, 512) or features.dtype != dtype or len(done) != len(manifest):
+            raise ValueError('{} does not match the manifest or dtype, remove it to start over'.format(out_path))
+    else:
+        features = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=(n_e, 512))
+        done = np.zeros(len(manifest), dtype=bool)
+
+    todo = np.where(~done)[0]
+    print('Images: {}; done: {}; to do: {}'.format(len(manifest), int(done.sum()), len(todo)))
+
+    if len(todo) == 0:
+        return features
+
+    model = resnet18_features().eval()
+    model = model.to(memory_format=torch.channels_last)
+    model = model.cuda() if gpu else model
+
+    normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406],
+                                     std=[0.229, 0.224, 0.225])
+
+    dataset = ManifestImages(manifest, transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        normalize,
+    ]))
+
+    corrupt = []
+    ent_idxs = np.array([idx for idx, _ in manifest])
+
+    for start in range(0, len(todo), shard_size):
+        shard = todo[start:start+shard_size]
+
+        loader = torch.utils.data.DataLoader(
+            torch.utils.data.Subset(dataset, shard.tolist()),
+            batch_size=batch_size, shuffle=False,
+            num_workers=workers, pin_memory=gpu
+        )
+
+        with torch.inference_mode():
+            for input, index, ok in loader:
+                input = input.contiguous(memory_format=torch.channels_last)
+                input = input.cuda(non_blocking=True) if gpu else input
+
+                output = model(input).view(-1, 512).float().cpu().numpy()
+
+                index, ok = index.numpy(), ok.numpy()
+                features[ent_idxs[index[ok]]] = output[ok].astype(dtype)
+                corrupt += [manifest[i][1] for i in index[~ok]]
+
+        # Rows first, then the bitmap: a crash never marks unwritten rows done
+        features.flush()
+        done[shard] = True
+        np.save('{}.tmp.npy'.format(done_path[:-4]), done)
+        os.replace('{}.tmp.npy'.format(done_path[:-4]), done_path)
+
+        print('Done: {} / {}'.format(int(done.sum()), len(manifest)))
+
+    if corrupt:
+        with open('{}.corrupt.txt'.format(out_path), 'a', encoding='utf-8') as f:
+            f.write(''.join('{}\n'.format(path) for path in corrupt))
+        print('Corrupted images: {}, listed in {}.corrupt.txt'.format(len(corrupt), out_path))
+
+    return features
@@ -0,0 +1,226 @@
+import gzip
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+
+from sparql_harvester import is_numeric, lang_matches
+
+
+"""
+Streaming extraction of the literals of a set of entities from local
+N-Triples dumps (plain or gzipped), e.g. the Freebase RDF dump, as an offline
+alternative to sparql_harvester.py.
+
+Plain files are split into byte ranges processed by a process pool, gzipped
+files are one task each. Workers only keep a set of 64-bit entity hashes and
+stream their matches to part files, so memory does not grow with the dump.
+"""
+
+_ESCAPE_RE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+_ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+
+def entity_hash(uri):
+    """
+    64-bit blake2b digest of an entity URI, as an int.
+    """
+    if isinstance(uri, str):
+        uri = uri.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(uri, digest_size=8).digest(), 'little')
+
+
+def _unescape(m):
+    if m.group(1) or m.group(2):
+        return chr(int(m.group(1) or m.group(2), 16))
+    return _ESCAPES.get(m.group(3), m.group(0))
+
+
+def parse_literal_triple(line):
+    """
+    Subject, predicate, value, language and datatype of an N-Triples line
+    whose object is a literal, None for any other line. Accepts both space
+    and tab separated triples.
+    """
+    if not line.startswith(b'<'):
+        return None
+
+    s_end = line.find(b'>')
+    rest = line[s_end+1:].lstrip()
+
+    if not rest.startswith(b'<'):
+        return None
+
+    p_end = rest.find(b'>')
+    obj = rest[p_end+1:].strip()
+
+    if not obj.startswith(b'"'):
+        return None
+
+    if obj.endswith(b'.'):
+        obj = obj[:-1].rstrip()
+
+    q = obj.rfind(b'"')
+    suffix = obj[q+1:]
+    value = obj[1:q].decode('utf-8', 'replace')
+
+    if '\\' in value:
+        value = _ESCAPE_RE.sub(_unescape, value)
+
+    lang, datatype = '', ''
+    if suffix.startswith(b'@'):
+        lang = suffix[1:].decode('ascii', 'replace')
+    elif suffix.startswith(b'^^<'):
+        datatype = suffix[3:-1].decode('ascii', 'replace')
+
+    return line[1:s_end].decode('utf-8', 'replace'), rest[1:p_end].decode('utf-8', 'replace'), value, lang, datatype
+
+
+def byte_ranges(paths, chunk_size=1 << 28):
+    """
+    Tasks of (path, start, end): byte ranges of about chunk_size for plain
+    files, whole files for gzipped ones.
+    """
+    tasks = []
+
+    for path in paths:
+        if path.endswith('.gz'):
+            tasks.append((path, 0, None))
+            continue
+
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), chunk_size):
+            tasks.append((path, start, min(start + chunk_size, size)))
+
+    return tasks
+
+
+def _lines(path, start, end):
+    """
+    Lines starting within [start, end) of `path`, all lines if end is None.
+    """
+    if end is None:
+        with gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb') as f:
+            for line in f:
+                yield line
+        return
+
+    with open(path, 'rb') as f:
+        pos = start
+
+        if start > 0:
+            # The line in progress belongs to the previous range
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())
+
+        for line in f:
+            if pos >= end:
+                break
+            pos += len(line)
+            yield line
+
+
+_hashes = None
+
+
+def _init_worker(hashes):
+    global _hashes
+    _hashes = hashes
+
+
+def _extract_range(args):
+    (path, start, end), part_prefix, language = args
+
+    n_numerical, n_text = 0, 0
+
+    with open(part_prefix + '.num', 'w', encoding='utf-8') as f_num, \
+            open(part_prefix + '.txt', 'w', encoding='utf-8') as f_txt:
+        for line in _lines(path, start, end):
+            # Cheapest rejection first: the subject hash
+            if not line.startswith(b'<'):
+                continue
+            if entity_hash(line[1:line.find(b'>')]) not in _hashes:
+                continue
+
+            triple = parse_literal_triple(line)
+            if triple is None:
+                continue
+
+            s, p, value, lang, datatype = triple
+
+            if is_numeric(value):
+                f_num.write('<{}>\t{}\t{}\n'.format(s, p, value.strip()))
+                n_numerical += 1
+            elif not datatype and lang_matches(lang, language):
+                value = value.replace('\n', '.').replace('\t', '')
+                if value:
+                    f_txt.write('<{}>\t{}\t{}\n'.format(s, p, value))
+                    n_text += 1
+
+    return n_numerical, n_text
+
+
+def extract_literals(paths, entities, numerical_path, text_path, language='en',
+                     n_jobs=None, chunk_size=1 << 28, tmp_dir=None):
+    """
+    Stream the N-Triples files `paths` and write the numerical and the text
+    (in `language`) literal triples of `entities`, as `<s>\tp\tvalue` lines.
+
+    Params:
+    -------
+        paths: list of string
+            N-Triples files, '.gz' ones are decompressed on the fly.
+
+        entities: list of string
+            Entity URIs, without angle brackets.
+
+        numerical_path, text_path: string
+            Output files.
+
+        language: string, default: 'en'
+            Language of the text literals.
+
+        n_jobs: int, default: None
+            Number of processes. Defaults to the number of CPUs.
+
+        chunk_size: int, default: 256 MiB
+            Bytes per task of plain files.
+
+        tmp_dir: string, default: None
+            Directory of the part files. Defaults to next to numerical_path.
+
+    Returns:
+    --------
+        n_numerical, n_text: int
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    tmp_dir = tmp_dir or '{}.parts'.format(numerical_path)
+
+    if not os.path.exists(tmp_dir):
+        os.makedirs(tmp_dir)
+
+    hashes = frozenset(entity_hash(e) for e in entities)
+    tasks = [(task, '{}/part-{}'.format(tmp_dir, i), language)
+             for i, task in enumerate(byte_ranges(paths, chunk_size))]
+
+    if n_jobs == 1:
+        _init_worker(hashes)
+        counts = [_extract_range(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(n_jobs, _init_worker, (hashes,))
+        try:
+            counts = pool.map(_extract_range, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+
+    # Concatenate in task order, i.e. in dump order
+    for suffix, out_path in [('.num', numerical_path), ('.txt', text_path)]:
+        with open(out_path, 'wb') as out:
+            for _, part_prefix, _ in tasks:
+                with open(part_prefix + suffix, 'rb') as part:
+                    shutil.copyfileobj(part, out)
+
+    shutil.rmtree(tmp_dir)
+
+    return sum(c[0] for c in counts), sum(c[1] for c in counts)
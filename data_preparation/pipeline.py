@@ -0,0 +1,391 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+"""
+Incremental preprocessing pipeline. Every stage declares the script it runs,
+its inputs and its outputs (paths relative to the repository root). A stage
+is skipped when the content hashes of its inputs, its code and its arguments
+match the ones of its last successful run and its outputs are untouched.
+Stale stages run as soon as the stages producing their inputs are done, in
+parallel when independent.
+
+Since only content hashes matter, a stage rerun with identical outputs does
+not invalidate the stages downstream, and adding a stage, e.g. a new literal
+source, does not touch stages that do not read its outputs.
+
+Run from the repository root:
+
+    python data_preparation/pipeline.py                 # everything
+    python data_preparation/pipeline.py fb15k-literal   # stages of one prefix, and what they need
+    python data_preparation/pipeline.py --dry_run
+"""
+
+STATE_DIR = 'data/.pipeline'
+
+
+class Stage(object):
+
+    def __init__(self, name, script, args=(), inputs=(), outputs=(), cwd='.', code=()):
+        """
+        Params:
+        -------
+            name: string
+                Unique name, `<dataset>/<step>` by convention.
+
+            script: string
+                Script in data_preparation/.
+
+            args: list of string
+                Command line arguments of the script.
+
+            inputs, outputs: list of string
+                Files read and written, relative to the repository root.
+
+            cwd: {'.', 'data_preparation'}
+                Working directory of the script: the root for scripts using
+                `data/...` paths, data_preparation for `../data/...` ones.
+
+            code: list of string
+                Helper modules in data_preparation/ the script imports, so
+                that editing them reruns the stage.
+        """
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.cwd = cwd
+        self.code = ['data_preparation/{}'.format(f) for f in [script] + list(code)]
+
+    def command(self):
+        script = self.script if self.cwd == 'data_preparation' else 'data_preparation/{}'.format(self.script)
+        return [sys.executable, script] + self.args
+
+
+STAGES = [
+    # FB15k
+    Stage('fb15k/kg', 'preprocess_kg.py', ['data/fb15k'],
+          inputs=['data/fb15k/train.txt', 'data/fb15k/valid.txt', 'data/fb15k/test.txt'],
+          outputs=['data/fb15k/bin/idx2ent.npy', 'data/fb15k/bin/idx2rel.npy',
+                   'data/fb15k/bin/train.npy', 'data/fb15k/bin/val.npy', 'data/fb15k/bin/test.npy']),
+
+    # FB15k literals
+    Stage('fb15k-literal/splits', 'split_fb15k_literal.py',
+          inputs=['data/fb15k-literal/bin/idx2ent.npy', 'data/fb15k-literal/bin/idx2rel.npy',
+                  'data/fb15k/bin/idx2ent.npy', 'data/fb15k/bin/idx2rel.npy',
+                  'data/fb15k/bin/train.npy', 'data/fb15k/bin/val.npy', 'data/fb15k/bin/test.npy'],
+          outputs=['data/fb15k-literal/bin/train.npy', 'data/fb15k-literal/bin/val.npy',
+                   'data/fb15k-literal/bin/test.npy']),
+
+    Stage('fb15k-literal/filters', 'create_evaluation_filter.py', ['--dataset', 'fb15k'],
+          inputs=['data/fb15k-literal/bin/idx2ent.npy', 'data/fb15k-literal/bin/train.npy',
+                  'data/fb15k-literal/bin/val.npy', 'data/fb15k-literal/bin/test.npy'],
+          outputs=['data/fb15k-literal/bin/filter_s_val.npy', 'data/fb15k-literal/bin/filter_o_val.npy',
+                   'data/fb15k-literal/bin/filter_s_test.npy', 'data/fb15k-literal/bin/filter_o_test.npy',
+                   'data/fb15k-literal/bin/temp/idx_s_prime_train.npy',
+                   'data/fb15k-literal/bin/temp/idx_o_prime_train.npy',
+                   'data/fb15k-literal/bin/temp/idx_s_prime_val.npy',
+                   'data/fb15k-literal/bin/temp/idx_o_prime_val.npy',
+                   'data/fb15k-literal/bin/temp/idx_s_prime_test.npy',
+                   'data/fb15k-literal/bin/temp/idx_o_prime_test.npy']),
+
+    Stage('fb15k-literal/numerical', 'prepare_numerical_literals_fb15k.py', cwd='data_preparation',
+          inputs=['data/fb15k-literal/fb15k_numerical_triples.txt',
+                  'data/fb15k/bin/idx2ent.npy', 'data/fb15k/bin/idx2rel.npy'],
+          outputs=['data/fb15k-literal/frequency-count-numerical.txt',
+                   'data/fb15k-literal/bin/idx2ent.npy', 'data/fb15k-literal/bin/idx2rel.npy',
+                   'data/fb15k-literal/bin/numerical_literals_raw.npz', 'data/fb15k-literal/bin/idx2attr.npy']),
+
+    Stage('fb15k-literal/numerical_filter', 'filter_numerical_literal.py', cwd='data_preparation',
+          inputs=['data/fb15k-literal/bin/numerical_literals_raw.npz', 'data/fb15k-literal/bin/idx2attr.npy'],
+          outputs=['data/fb15k-literal/bin/numerical_literals_filtered.npz',
+                   'data/fb15k-literal/bin/idx2attr_filtered.npy',
+                   'data/fb15k-literal/filtered-numerical-frequency-count.txt']),
+
+    # Dense table and mask for the experiments loading numerical_literals.npy
+    Stage('fb15k-literal/numerical_table', 'split_numerical_train_val_test_fb15k.py', ['--dense'],
+          cwd='data_preparation',
+          inputs=['data/fb15k-literal/bin/numerical_literals_filtered.npz',
+                  'data/fb15k-literal/bin/idx2attr_filtered.npy', 'data/fb15k-literal/bin/train.npy'],
+          outputs=['data/fb15k-literal/bin/numerical_literals.npz', 'data/fb15k-literal/bin/numerical_literals.npy',
+                   'data/fb15k-literal/bin/numerical_literals_mask.npy',
+                   'data/fb15k-literal/bin/numerical_literals_stats.npz']),
+
+    Stage('fb15k-literal/text', 'prepare_text_lstm.py', code=['text_data_utils.py'],
+          inputs=['data/fb15k-literal/filtered-string-literal-fb15k.txt', 'data/fb15k-literal/bin/idx2ent.npy'],
+          outputs=['data/fb15k-literal/vocabulary_text.pickle',
+                   'data/fb15k-literal/bin/text_tokens.npy', 'data/fb15k-literal/bin/text_lengths.npy']),
+
+    Stage('fb15k-literal/glove', 'prepare_pretrained_text.py', code=['text_data_utils.py'],
+          inputs=['data/fb15k-literal/vocabulary_text.pickle', 'data/fb15k-literal/glove.6B/glove.6B.100d.txt'],
+          outputs=['data/fb15k-literal/bin/pretrained-embedding.npy']),
+
+    Stage('fb15k-literal/bundle', 'build_bundle.py', ['--dataset', 'fb15k-literal'],
+          inputs=['data/fb15k-literal/bin/train.npy', 'data/fb15k-literal/bin/val.npy',
+                  'data/fb15k-literal/bin/test.npy', 'data/fb15k-literal/bin/idx2ent.npy',
+                  'data/fb15k-literal/bin/idx2rel.npy',
+                  'data/fb15k-literal/bin/filter_s_val.npy', 'data/fb15k-literal/bin/filter_o_val.npy',
+                  'data/fb15k-literal/bin/filter_s_test.npy', 'data/fb15k-literal/bin/filter_o_test.npy',
+                  'data/fb15k-literal/bin/numerical_literals.npz',
+                  'data/fb15k-literal/bin/text_tokens.npy', 'data/fb15k-literal/bin/text_lengths.npy',
+                  'data/fb15k-literal/bin/pretrained-embedding.npy'],
+          outputs=['data/fb15k-literal/bin/bundle.kgb']),
+
+    # YAGO3-10 with literals
+    Stage('yago3-10-literal/kg', 'preprocess_kg.py', ['data/yago3-10-literal'],
+          inputs=['data/yago3-10-literal/train.txt', 'data/yago3-10-literal/valid.txt',
+                  'data/yago3-10-literal/test.txt'],
+          outputs=['data/yago3-10-literal/bin/idx2ent.npy', 'data/yago3-10-literal/bin/idx2rel.npy',
+                   'data/yago3-10-literal/bin/train.npy', 'data/yago3-10-literal/bin/val.npy',
+                   'data/yago3-10-literal/bin/test.npy']),
+
+    Stage('yago3-10-literal/filters', 'create_evaluation_filter.py', ['--dataset', 'yago'],
+          inputs=['data/yago3-10-literal/bin/idx2ent.npy', 'data/yago3-10-literal/bin/train.npy',
+                  'data/yago3-10-literal/bin/val.npy', 'data/yago3-10-literal/bin/test.npy'],
+          outputs=['data/yago3-10-literal/bin/filter_s_val.npy', 'data/yago3-10-literal/bin/filter_o_val.npy',
+                   'data/yago3-10-literal/bin/filter_s_test.npy', 'data/yago3-10-literal/bin/filter_o_test.npy',
+                   'data/yago3-10-literal/bin/temp/idx_s_prime_train.npy',
+                   'data/yago3-10-literal/bin/temp/idx_o_prime_train.npy',
+                   'data/yago3-10-literal/bin/temp/idx_s_prime_val.npy',
+                   'data/yago3-10-literal/bin/temp/idx_o_prime_val.npy',
+                   'data/yago3-10-literal/bin/temp/idx_s_prime_test.npy',
+                   'data/yago3-10-literal/bin/temp/idx_o_prime_test.npy']),
+]
+
+
+class FileHasher(object):
+    """
+    sha256 of files, cached by (size, mtime) so that large unchanged inputs
+    are only read once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.cache = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                self.cache = json.load(f)
+
+    def __call__(self, path):
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+
+        cached = self.cache.get(path)
+        if cached is not None and cached[:2] == stamp:
+            return cached[2]
+
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+
+        self.cache[path] = stamp + [h.hexdigest()]
+        return h.hexdigest()
+
+    def save(self):
+        _write_json(self.path, self.cache)
+
+
+def _write_json(path, obj):
+    tmp = '{}.tmp'.format(path)
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def stage_key(stage, hasher):
+    """
+    Hash of everything a stage depends on: its command, its code and the
+    content of its inputs.
+    """
+    key = {
+        'command': stage.command()[1:],
+        'cwd': stage.cwd,
+        'code': {path: hasher(path) for path in stage.code},
+        'inputs': {path: hasher(path) for path in stage.inputs}
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def is_up_to_date(stage, key, state, hasher):
+    last = state.get(stage.name)
+
+    if last is None or last['key'] != key:
+        return False
+
+    # Outputs deleted or edited since the last run
+    for path in stage.outputs:
+        if not os.path.exists(path) or hasher(path) != last['outputs'].get(path):
+            return False
+
+    return True
+
+
+def select(stages, targets):
+    """
+    Stages matching any of the target names or prefixes, and all the stages
+    producing their inputs.
+    """
+    producers = {path: s for s in stages for path in s.outputs}
+    todo = [s for s in stages if not targets or any(s.name == t or s.name.startswith(t.rstrip('/') + '/') for t in targets)]
+    selected = {}
+
+    while todo:
+        stage = todo.pop()
+        if stage.name in selected:
+            continue
+        selected[stage.name] = stage
+        todo += [producers[path] for path in stage.inputs if path in producers]
+
+    return [s for s in stages if s.name in selected]
+
+
+def _run(stage, log_dir):
+    log_path = '{}/{}.log'.format(log_dir, stage.name.replace('/', '_'))
+
+    with open(log_path, 'w') as log:
+        returncode = subprocess.call(stage.command(), cwd=stage.cwd, stdout=log, stderr=subprocess.STDOUT)
+
+    return returncode, log_path
+
+
+def run(stages, n_jobs=4, dry_run=False, force=()):
+    """
+    Run the stale stages of `stages`, each once all stages producing its
+    inputs are done.
+
+    Returns:
+    --------
+    failed: list of string
+        Names of the stages that failed or could not run.
+    """
+    log_dir = '{}/logs'.format(STATE_DIR)
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    state_path = '{}/state.json'.format(STATE_DIR)
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    hasher = FileHasher('{}/hashes.json'.format(STATE_DIR))
+    producers = {path: s.name for s in stages for path in s.outputs}
+
+    pending = list(stages)
+    done, failed = set(), set()
+    running = {}
+    stale = set()
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        while pending or running:
+            progress = True
+
+            while progress:
+                progress = False
+
+                for stage in list(pending):
+                    deps = set(producers[p] for p in stage.inputs if p in producers)
+
+                    if deps & failed:
+                        pending.remove(stage)
+                        failed.add(stage.name)
+                        print('[skipped] {}: upstream failed'.format(stage.name))
+                        progress = True
+                        continue
+
+                    if not deps <= done:
+                        continue
+
+                    pending.remove(stage)
+                    progress = True
+
+                    missing = [p for p in stage.inputs if not os.path.exists(p)]
+
+                    # In a dry run, upstream stages did not actually run
+                    if dry_run and deps & stale:
+                        stale.add(stage.name)
+                        done.add(stage.name)
+                        print('[stale]   {}'.format(stage.name))
+                        continue
+
+                    if missing:
+                        failed.add(stage.name)
+                        print('[missing] {}: {}'.format(stage.name, ', '.join(missing)))
+                        continue
+
+                    key = stage_key(stage, hasher)
+
+                    if stage.name not in force and is_up_to_date(stage, key, state, hasher):
+                        done.add(stage.name)
+                        print('[ok]      {}'.format(stage.name))
+                        continue
+
+                    if dry_run:
+                        stale.add(stage.name)
+                        done.add(stage.name)
+                        print('[stale]   {}'.format(stage.name))
+                        continue
+
+                    print('[run]     {}: {}'.format(stage.name, ' '.join(stage.command()[1:])))
+                    running[pool.submit(_run, stage, log_dir)] = (stage, key)
+
+            if not running:
+                break
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                stage, key = running.pop(future)
+                returncode, log_path = future.result()
+
+                missing = [p for p in stage.outputs if not os.path.exists(p)]
+
+                if returncode != 0 or missing:
+                    failed.add(stage.name)
+                    print('[failed]  {}: see {}'.format(stage.name, log_path))
+                    continue
+
+                state[stage.name] = {'key': key, 'outputs': {p: hasher(p) for p in stage.outputs}}
+                _write_json(state_path, state)
+                done.add(stage.name)
+                print('[done]    {}'.format(stage.name))
+
+    hasher.save()
+
+    return sorted(failed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the stale preprocessing stages')
+    parser.add_argument('targets', nargs='*', metavar='STAGE',
+                        help='stage names or dataset prefixes, e.g. fb15k-literal (default: all)')
+    parser.add_argument('-j', '--jobs', type=int, default=4, metavar='N',
+                        help='number of stages run in parallel (default: 4)')
+    parser.add_argument('--dry_run', default=False, action='store_true',
+                        help='only list the stages that would run')
+    parser.add_argument('--force', nargs='*', default=[], metavar='STAGE',
+                        help='stages to rerun even if up to date')
+    parser.add_argument('--list', default=False, action='store_true',
+                        help='list all stages and exit')
+
+    args = parser.parse_args()
+
+    if args.list:
+        for stage in STAGES:
+            print('{}\n    {}\n    in:  {}\n    out: {}'.format(
+                stage.name, ' '.join(stage.command()[1:]), ', '.join(stage.inputs), ', '.join(stage.outputs)))
+        sys.exit(0)
+
+    failed = run(select(STAGES, args.targets), n_jobs=args.jobs, dry_run=args.dry_run, force=set(args.force))
+
+    if failed:
+        print('Failed: {}'.format(', '.join(failed)))
+        sys.exit(1)
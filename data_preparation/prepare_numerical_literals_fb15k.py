@@ -1,21 +1,16 @@
-import pdb
 import pandas as pd
-from collections import Counter
-import matplotlib.pyplot as plt
 import numpy as np
+import scipy.sparse as sp
 
 
-# Read Literal DataSet
+# Read Literal DataSet, the harvester's fourth column (datatype) is ignored
 filename = '../data/fb15k-literal/fb15k_numerical_triples.txt'
-triples = [line.strip().split('\t') for line in open(filename,'r')]
-all_predicate = list(zip(*triples))[1]
-predicate_freq = Counter(all_predicate)
+triples = pd.read_csv(filename, sep='\t', header=None, usecols=[0, 1, 2], names=['s', 'p', 'v'],
+                      dtype=str, quoting=3)
 
-predicate_ = list(set(all_predicate))
-print('Number of Unique Predicates', len(predicate_))
-with open('../data/fb15k-literal/frequency-count-numerical.txt','w') as f:
-	for entity, freq in predicate_freq.items():
-		f.write(entity + '\t' + str(freq) + '\n')
+predicate_freq = triples['p'].value_counts()
+print('Number of Unique Predicates', len(predicate_freq))
+predicate_freq.to_csv('../data/fb15k-literal/frequency-count-numerical.txt', sep='\t', header=False)
 
 # Prepare literal dataset
 idx2entity = np.load('../data/fb15k/bin/idx2ent.npy')
@@ -23,12 +18,24 @@ idx2rel = np.load('../data/fb15k/bin/idx2rel.npy')
 idx2entity = np.array([idx[1:].replace('/','.') for idx in idx2entity])
 np.save('../data/fb15k-literal/bin/idx2ent.npy',idx2entity)
 np.save('../data/fb15k-literal/bin/idx2rel.npy',idx2rel)
-entity_literal = {ent: np.zeros(len(predicate_)) for ent in idx2entity}
-for triple in triples:
-	s_ = triple[0].replace('<http://rdf.freebase.com/ns/','')[:-1]
-	p_ = triple[1]
-	entity_literal[s_][predicate_.index(p_)] = triple[2]
-
-data = [entity_literal[entity] for entity in entity_literal]
-df = pd.DataFrame(data = data, index = entity_literal.keys(), columns = predicate_)
-df.to_csv('../data/fb15k-literal/entity_numerical_literal.csv')
+
+# Vectorized entity and attribute ids, instead of a dense row per entity
+entities = triples['s'].str.replace('<http://rdf.freebase.com/ns/', '', regex=False).str[:-1]
+rows = pd.Index(idx2entity).get_indexer(entities)
+cols, idx2attr = pd.factorize(triples['p'])
+values = pd.to_numeric(triples['v'], errors='coerce').values
+
+keep = (rows >= 0) & ~np.isnan(values)
+df = pd.DataFrame({'row': rows[keep], 'col': cols[keep], 'val': values[keep]})
+
+# Later triples overwrite earlier ones for the same (entity, attribute)
+df = df.drop_duplicates(['row', 'col'], keep='last')
+
+# Stored entries are the present literals, values of 0 included
+X_lit = sp.csr_matrix((df['val'].values.astype(np.float32), (df['row'].values, df['col'].values)),
+                      shape=(len(idx2entity), len(idx2attr)))
+
+sp.save_npz('../data/fb15k-literal/bin/numerical_literals_raw.npz', X_lit)
+np.save('../data/fb15k-literal/bin/idx2attr.npy', np.array(idx2attr))
+
+print('Entities: {}; attributes: {}; literals: {}'.format(X_lit.shape[0], X_lit.shape[1], X_lit.nnz))
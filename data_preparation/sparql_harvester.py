@@ -0,0 +1,247 @@
+import http.client
+import json
+import sqlite3
+import threading
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit, urlencode
+
+
+"""
+Concurrent, cached harvesting of the literals of many entities from a SPARQL
+endpoint. Entities are queried in batches through VALUES, by a bounded pool
+of threads that each keep one connection alive. Results are cached in sqlite
+per entity, so that an interrupted harvest resumes with the missing ones.
+
+See sparql_stub.py for a local stand-in endpoint.
+"""
+
+QUERY = """SELECT ?s ?p ?o WHERE {{
+    VALUES ?s {{ {} }}
+    ?s ?p ?o .
+    FILTER (isLiteral(?o))
+}}"""
+
+
+class EndpointError(Exception):
+    pass
+
+
+class SparqlClient(object):
+    """
+    Minimal SPARQL JSON client over http.client, with one keep-alive
+    connection per thread and retries with exponential backoff.
+    """
+
+    def __init__(self, address, timeout=60, retries=10, backoff=1.):
+        url = urlsplit(address)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.path = url.path or '/'
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._local = threading.local()
+
+    def _connection(self, fresh=False):
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None or fresh:
+            if conn is not None:
+                conn.close()
+            cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.netloc, timeout=self.timeout)
+
+        return conn
+
+    def query(self, query):
+        body = urlencode({'query': query})
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/sparql-results+json',
+            'Connection': 'keep-alive'
+        }
+
+        for attempt in range(self.retries + 1):
+            try:
+                conn = self._connection(fresh=attempt > 0)
+                conn.request('POST', self.path, body, headers)
+                res = conn.getresponse()
+                data = res.read()
+
+                if res.status == 200:
+                    return json.loads(data.decode('utf-8'))
+
+                error = EndpointError('HTTP {}: {}'.format(res.status, data[:200]))
+
+                # Client errors, e.g. a malformed query, do not go away
+                if 400 <= res.status < 500 and res.status != 429:
+                    raise error
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                error = e
+
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2**attempt * (1 + random.random()) / 2)
+
+        raise error
+
+
+class LiteralCache(object):
+    """
+    sqlite cache of the literal bindings of every harvested entity, including
+    entities without any literal. Only written from the harvesting thread.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS literals (entity TEXT PRIMARY KEY, bindings TEXT)')
+        self.db.commit()
+
+    def __contains__(self, entity):
+        return self.db.execute('SELECT 1 FROM literals WHERE entity = ?', (entity,)).fetchone() is not None
+
+    def entities(self):
+        return set(e for e, in self.db.execute('SELECT entity FROM literals'))
+
+    def put(self, results):
+        self.db.executemany(
+            'INSERT OR REPLACE INTO literals VALUES (?, ?)',
+            ((entity, json.dumps(bindings)) for entity, bindings in results.items())
+        )
+        self.db.commit()
+
+    def get(self, entity):
+        row = self.db.execute('SELECT bindings FROM literals WHERE entity = ?', (entity,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def close(self):
+        self.db.close()
+
+
+def _query_batch(client, batch, max_rows):
+    """
+    Literal bindings of every entity of `batch`, as [p, o, type, lang,
+    datatype] lists. Batches whose result may be truncated by the endpoint
+    row limit are split in halves.
+    """
+    query = QUERY.format(' '.join('<{}>'.format(e) for e in batch))
+    bindings = client.query(query)['results']['bindings']
+
+    if len(bindings) >= max_rows:
+        if len(batch) > 1:
+            half = len(batch) // 2
+            results = _query_batch(client, batch[:half], max_rows)
+            results.update(_query_batch(client, batch[half:], max_rows))
+            return results
+        print('Warning: {} has at least {} literals, result may be truncated'.format(batch[0], max_rows))
+
+    results = {e: [] for e in batch}
+
+    for b in bindings:
+        o = b['o']
+        results[b['s']['value']].append(
+            [b['p']['value'], o['value'], o['type'], o.get('xml:lang', ''), o.get('datatype', '')]
+        )
+
+    return results
+
+
+def harvest(entities, address, cache_path, batch_size=50, n_threads=8, max_rows=10000, timeout=60):
+    """
+    Fetch the literals of all `entities` that are not cached yet.
+
+    Params:
+    -------
+        entities: list of string
+            Entity URIs, without angle brackets.
+
+        address: string
+            SPARQL endpoint URL.
+
+        cache_path: string
+            sqlite cache file.
+
+        batch_size: int, default: 50
+            Number of entities per query.
+
+        n_threads: int, default: 8
+            Number of queries in flight.
+
+        max_rows: int, default: 10000
+            Row limit of the endpoint, e.g. ResultSetMaxRows of Virtuoso.
+
+    Returns:
+    --------
+        cache: LiteralCache
+    """
+    cache = LiteralCache(cache_path)
+    done = cache.entities()
+    todo = [e for e in entities if e not in done]
+
+    print('Entities: {}; cached: {}; to query: {}'.format(len(entities), len(entities) - len(todo), len(todo)))
+
+    client = SparqlClient(address, timeout=timeout)
+    batches = [todo[i:i+batch_size] for i in range(0, len(todo), batch_size)]
+    start = time.time()
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        futures = [pool.submit(_query_batch, client, batch, max_rows) for batch in batches]
+
+        for i, future in enumerate(as_completed(futures)):
+            # Persist as results come in: a failure only loses batches in flight
+            cache.put(future.result())
+
+            if (i+1) % 100 == 0 or i+1 == len(batches):
+                print('Batches: {} / {}; {:.1f} entities/s'
+                      .format(i+1, len(batches), (i+1) * batch_size / (time.time() - start)))
+
+    return cache
+
+
+def is_numeric(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def lang_matches(lang, tag):
+    """
+    SPARQL langMatches: case-insensitive tag or tag prefix before a '-'.
+    """
+    lang, tag = lang.lower(), tag.lower()
+    return lang == tag or lang.startswith(tag + '-')
+
+
+def write_literals(cache, entities, numerical_path, text_path, language='EN'):
+    """
+    Write the numerical and the text literal triples of `entities` in one pass
+    over the cache, in the formats of the former per-entity scripts:
+    `<s>\tp\to[\tdatatype]` for numbers, `<s>\tp\to` for text in `language`.
+
+    Returns:
+    --------
+        n_numerical, n_text: int
+    """
+    n_numerical, n_text = 0, 0
+
+    with open(numerical_path, 'w') as f_num, open(text_path, 'w') as f_txt:
+        for entity in entities:
+            s = '<{}>'.format(entity)
+
+            for p, o, o_type, lang, datatype in cache.get(entity) or []:
+                if is_numeric(o):
+                    triple = [s, p, o] + ([datatype] if o_type == 'typed-literal' else [])
+                    f_num.write('\t'.join(triple) + '\n')
+                    n_numerical += 1
+
+                if o_type == 'literal' and lang_matches(lang, language):
+                    o = o.replace('\n', '.').replace('\t', '')
+                    if o == '':
+                        continue
+                    f_txt.write('\t'.join([s, p, o]) + '\n')
+                    n_text += 1
+
+    return n_numerical, n_text
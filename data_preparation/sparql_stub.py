@@ -0,0 +1,117 @@
+import argparse
+import json
+import random
+import re
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+
+"""
+Local stand-in for a SPARQL endpoint, to run sparql_harvester.py offline.
+Serves the literal triples of an N-Triples file for the harvester query: it
+only understands `VALUES ?s { <...> ... }` and answers with all literals of
+those subjects, in the SPARQL JSON format of Virtuoso.
+
+    python sparql_stub.py sample.nt --port 9890
+    python harvest_literals_fb15k.py --endpoint http://localhost:9890/sparql
+"""
+
+LITERAL_RE = re.compile(r'^<([^>]*)>\s+<([^>]*)>\s+"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9-]+)|\^\^<([^>]*)>)?\s*\.\s*$')
+VALUES_RE = re.compile(r'VALUES\s+\?s\s*\{([^}]*)\}', re.IGNORECASE)
+ESCAPES = {'\\"': '"', '\\\\': '\\', '\\n': '\n', '\\t': '\t', '\\r': '\r'}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer, which needs Python 3.7
+    daemon_threads = True
+
+
+def load_literals(path):
+    literals = {}
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            m = LITERAL_RE.match(line)
+            if m is None:
+                continue
+
+            s, p, o, lang, datatype = m.groups()
+            o = re.sub(r'\\["\\ntr]', lambda e: ESCAPES[e.group(0)], o)
+
+            binding = {'s': {'type': 'uri', 'value': s}, 'p': {'type': 'uri', 'value': p}}
+
+            if datatype:
+                binding['o'] = {'type': 'typed-literal', 'datatype': datatype, 'value': o}
+            else:
+                binding['o'] = {'type': 'literal', 'value': o}
+                if lang:
+                    binding['o']['xml:lang'] = lang
+
+            literals.setdefault(s, []).append(binding)
+
+    return literals
+
+
+def make_handler(literals, fail_rate, max_rows):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _answer(self, query):
+            if random.random() < fail_rate:
+                return self._send(503, b'Service Unavailable')
+
+            m = VALUES_RE.search(query or '')
+            if m is None:
+                return self._send(400, b'Unsupported query')
+
+            subjects = re.findall(r'<([^>]*)>', m.group(1))
+            bindings = [b for s in subjects for b in literals.get(s, [])][:max_rows]
+
+            body = json.dumps({
+                'head': {'vars': ['s', 'p', 'o']},
+                'results': {'bindings': bindings}
+            }).encode('utf-8')
+
+            self._send(200, body, 'application/sparql-results+json')
+
+        def _send(self, status, body, content_type='text/plain'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._answer(parse_qs(urlsplit(self.path).query).get('query', [None])[0])
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            form = parse_qs(self.rfile.read(length).decode('utf-8'))
+            self._answer(form.get('query', [None])[0])
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local SPARQL stub serving the literals of an N-Triples file')
+    parser.add_argument('triples', metavar='FILE',
+                        help='N-Triples file with the literal triples to serve')
+    parser.add_argument('--port', type=int, default=9890, metavar='',
+                        help='port to listen on (default: 9890)')
+    parser.add_argument('--fail_rate', type=float, default=0, metavar='',
+                        help='fraction of queries answered with HTTP 503, to exercise retries (default: 0)')
+    parser.add_argument('--max_rows', type=int, default=10000, metavar='',
+                        help='result row limit, as of Virtuoso ResultSetMaxRows (default: 10000)')
+
+    args = parser.parse_args()
+
+    literals = load_literals(args.triples)
+    print('Serving literals of {} subjects on port {}'.format(len(literals), args.port))
+
+    server = ThreadingHTTPServer(('localhost', args.port), make_handler(literals, args.fail_rate, args.max_rows))
+    server.serve_forever()
@@ -0,0 +1,18 @@
+import numpy as np
+
+# Train/val/test triples of fb15k-literal. Its idx2ent and idx2rel are the
+# ones of FB15k, with the entity ids rewritten by
+# prepare_numerical_literals_fb15k.py but in the same order, so the
+# preprocessed FB15k splits are valid as they are.
+
+n_e = len(np.load('data/fb15k-literal/bin/idx2ent.npy'))
+n_r = len(np.load('data/fb15k-literal/bin/idx2rel.npy'))
+
+assert n_e == len(np.load('data/fb15k/bin/idx2ent.npy')), 'idx2ent differs from the one of FB15k'
+assert n_r == len(np.load('data/fb15k/bin/idx2rel.npy')), 'idx2rel differs from the one of FB15k'
+
+for split in ['train', 'val', 'test']:
+    X = np.load('data/fb15k/bin/{}.npy'.format(split))
+    np.save('data/fb15k-literal/bin/{}.npy'.format(split), X)
+
+    print('{}: {} triples'.format(split, X.shape[0]))
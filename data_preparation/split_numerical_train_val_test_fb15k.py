@@ -1,77 +1,64 @@
-import pdb
-import pandas as pd
-from collections import Counter
-import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
-from scipy.sparse  import save_npz, csc_matrix
+import scipy.sparse as sp
+import argparse
 
-def literal_subject_object(X, idx2literal, literal_data):
-	X_literal_s = []
-	X_literal_o = []
-	for triple in X:
-		idx_s = np.where(idx2literal==triple[0])[0]
-		idx_o = np.where(idx2literal==triple[2])[0]
+# Build the entity-level numerical literal table of FB15k: one row per entity,
+# in the order of idx2ent, so that literals are looked up by entity id for any
+# triple of any split. Input is the sparse table of
+# prepare_numerical_literals_fb15k.py, filtered by filter_numerical_literal.py.
+#
+# Outputs in data/fb15k-literal/bin:
+#     numerical_literals.npz        n_e x n_l CSR, min-max normalized, present literals only
+#     numerical_literals_stats.npz  per-feature min/max fitted on train, column names
+#
+# With --dense, for the scripts loading the dense table, also:
+#     numerical_literals.npy        same as dense float32, 0 if missing
+#     numerical_literals_mask.npy   n_e x n_l bool, True if the literal is present
 
-		X_literal_s.append(literal_data[idx_s].reshape(-1,))
-		X_literal_o.append(literal_data[idx_o].reshape(-1,))
-	X_literal_s = np.array(X_literal_s)
-	X_literal_o = np.array(X_literal_o)
+parser = argparse.ArgumentParser(
+    description='Normalize the FB15k numerical literals and build the entity-level table'
+)
+
+parser.add_argument('--dense', default=False, action='store_true',
+                    help='also write the dense n_e x n_l table and its mask as .npy (default: False)')
+
+args = parser.parse_args()
 
-	return X_literal_s, X_literal_o
-# Prepare training, validation and test file for literal dataset
 # Load Literal dataset
-literal_data = pd.read_csv('../data/fb15k-literal/entity_numerical_literal.csv')
-idx2entity = np.load('../data/fb15k-literal/bin/idx2ent.npy')
-literal_data = literal_data.values
-entity_literal = literal_data[:,0]
-idx2literal = np.array([np.where(entity==idx2entity)[0] for entity in entity_literal])
-idx2literal = idx2literal.reshape(-1,)
-np.save('../data/fb15k-literal/bin/idx2literal.npy',idx2literal) 
-literal_data = literal_data[:,1:] 
+X_lit = sp.load_npz('../data/fb15k-literal/bin/numerical_literals_filtered.npz').tocsr()
+idx2attr = np.load('../data/fb15k-literal/bin/idx2attr_filtered.npy')
+
+n_e, n_l = X_lit.shape
 
-# Training Set
-X = np.load('../data/fb15k-literal/bin/train.npy')
-train_literal_s, train_literal_o = literal_subject_object(X, idx2literal, literal_data)
-scaler1 = MinMaxScaler()
-scaler1.fit(train_literal_s)
-train_literal_s = scaler1.transform(train_literal_s)
-scaler2 = MinMaxScaler()
-scaler2.fit(train_literal_o)
-train_literal_o = scaler2.transform(train_literal_o)
-train_literal_s = csc_matrix(train_literal_s)
-train_literal_o = csc_matrix(train_literal_o)
+# Normalization stats only from present values of entities seen in training
+X_train = np.load('../data/fb15k-literal/bin/train.npy')
+train_ents = np.unique(X_train[:, [0, 2]])
 
-#np.save('data/fb15k-literal/bin/train_literal_s.npy',train_literal_s)
-#np.save('data/fb15k-literal/bin/train_literal_o.npy',train_literal_o)
-save_npz('../data/fb15k-literal/bin/train_literal_s.npz',train_literal_s)
-save_npz('../data/fb15k-literal/bin/train_literal_o.npz',train_literal_o)
+X_seen = X_lit[train_ents].tocoo()
+lit_min = np.full(n_l, np.inf)
+lit_max = np.full(n_l, -np.inf)
+np.minimum.at(lit_min, X_seen.col, X_seen.data)
+np.maximum.at(lit_max, X_seen.col, X_seen.data)
 
-#Validation Set
-X = np.load('../data/fb15k-literal/bin/val.npy')
-val_literal_s, val_literal_o = literal_subject_object(X, idx2literal, literal_data)
-val_literal_s = scaler1.transform(val_literal_s)
-val_literal_o = scaler2.transform(val_literal_o)
+# Attributes never seen in training are left as is
+unseen = np.isinf(lit_min)
+lit_min[unseen] = 0
+lit_max[unseen] = 1
+lit_range = np.where(lit_max > lit_min, lit_max - lit_min, 1)
 
-val_literal_s = csc_matrix(val_literal_s)
-val_literal_o = csc_matrix(val_literal_o)
+# Normalize the stored values only, explicit zeros stay present
+X_lit.data = ((X_lit.data - lit_min[X_lit.indices]) / lit_range[X_lit.indices]).astype(np.float32)
 
-#np.save('data/fb15k-literal/bin/val_literal_s.npy',val_literal_s)
-#np.save('data/fb15k-literal/bin/val_literal_o.npy',val_literal_o)
-save_npz('../data/fb15k-literal/bin/val_literal_s.npz',val_literal_s)
-save_npz('../data/fb15k-literal/bin/val_literal_o.npz',val_literal_o)
+sp.save_npz('../data/fb15k-literal/bin/numerical_literals.npz', X_lit)
 
-#Test Set
-X = np.load('../data/fb15k-literal/bin/test.npy')
-test_literal_s, test_literal_o = literal_subject_object(X, idx2literal, literal_data)
-test_literal_s = scaler1.transform(test_literal_s)
-test_literal_o = scaler2.transform(test_literal_o)
+if args.dense:
+    mask = sp.csr_matrix((np.ones(X_lit.nnz, dtype=bool), X_lit.indices, X_lit.indptr), shape=X_lit.shape)
 
-test_literal_s = csc_matrix(test_literal_s)
-test_literal_o = csc_matrix(test_literal_o)
+    np.save('../data/fb15k-literal/bin/numerical_literals.npy', X_lit.toarray())
+    np.save('../data/fb15k-literal/bin/numerical_literals_mask.npy', mask.toarray())
 
-#np.save('data/fb15k-literal/bin/test_literal_s.npy',test_literal_s)
-#np.save('data/fb15k-literal/bin/test_literal_o.npy',test_literal_o)
+np.savez('../data/fb15k-literal/bin/numerical_literals_stats.npz',
+         min=lit_min, max=lit_max, columns=idx2attr)
 
-save_npz('../data/fb15k-literal/bin/test_literal_s.npz',test_literal_s)
-save_npz('../data/fb15k-literal/bin/test_literal_o.npz',test_literal_o)
\ No newline at end of file
+print('Entities with literals: {}; features: {}; density: {:.4f}'
+      .format(int((X_lit.getnnz(axis=1) > 0).sum()), n_l, X_lit.nnz / float(n_e * n_l)))
@@ -1,34 +1,44 @@
 import re
+import os
+import json
+import hashlib
 import sys
 import itertools
+import multiprocessing
 import numpy as np
-from collections import Counter
-import pdb
+from collections import Counter, deque
 
 """
 Adapted from https://github.com/dennybritz/cnn-text-classification-tf
 """
 
 
+# All cleaning rules of `clean_str` as one alternation, applied in a single
+# pass: (1) characters to drop, (2) contractions to split off, (3) punctuation
+# to pad with spaces. The alternatives never match the same characters, so
+# this is equivalent to applying the rules one after the other.
+_CLEAN_RE = re.compile(r"([^A-Za-z0-9(),!?\'\`])|(\'s|\'ve|n\'t|\'re|\'d|\'ll)|([,!()?])")
+
+# Replacements of the original rules, including their literal backslashes
+_PUNCT = {',': ' , ', '!': ' ! ', '(': ' \\( ', ')': ' \\) ', '?': ' \\? '}
+
+
+def _clean_match(m):
+    if m.lastindex == 1:
+        return ' '
+    if m.lastindex == 2:
+        return ' ' + m.group(2)
+    return _PUNCT[m.group(3)]
+
+
 def clean_str(string):
     """
     Tokenization/string cleaning for all datasets except for SST.
     Original taken from https://github.com/yoonkim/CNN_sentence/blob/master/process_data.py
     """
-    string = re.sub(r"[^A-Za-z0-9(),!?\'\`]", " ", string)
-    string = re.sub(r"\'s", " \'s", string)
-    string = re.sub(r"\'ve", " \'ve", string)
-    string = re.sub(r"n\'t", " n\'t", string)
-    string = re.sub(r"\'re", " \'re", string)
-    string = re.sub(r"\'d", " \'d", string)
-    string = re.sub(r"\'ll", " \'ll", string)
-    string = re.sub(r",", " , ", string)
-    string = re.sub(r"!", " ! ", string)
-    string = re.sub(r"\(", " \( ", string)
-    string = re.sub(r"\)", " \) ", string)
-    string = re.sub(r"\?", " \? ", string)
-    string = re.sub(r"\s{2,}", " ", string)
-    return string.strip().lower()
+    string = _CLEAN_RE.sub(_clean_match, string)
+    # Only spaces are left as whitespace: collapse runs and strip
+    return ' '.join(string.split()).lower()
 
 
 def preprocess_text(text_data):
@@ -68,11 +78,307 @@ def prepare_vocab(text_data, max_len = None):
     vocabulary = {x: i for i, x in enumerate(vocabulary_inv)}        
     return vocabulary
 
-def build_data(text_data, vocabulary, max_len=None):
+def build_data(text_data, vocabulary, max_len=None, return_lengths=False):
 
     text_data = preprocess_text(text_data)
     text_data = [s.split(" ") for s in text_data]
     text_padded = pad_sentences(text_data, max_len)
+    # Number of real (non padding) tokens, after truncation
+    lengths = np.array([len(text) for text in text_data])
+    if max_len is not None:
+        lengths = np.minimum(lengths, max_len)
     text_data = np.array([[vocabulary[word] for word in text] for text in text_padded])
 
-    return text_data
\ No newline at end of file
+    if return_lengths:
+        return text_data, lengths
+
+    return text_data
+
+
+PAD = "<PAD/>"
+
+
+def tokenize(text):
+    """
+    Tokens of one raw text, as in `build_data`.
+    """
+    return clean_str(text.strip()).split(" ")
+
+
+def token_dtype(vocabulary):
+    """
+    Smallest dtype able to hold the token ids of `vocabulary`.
+    """
+    return np.uint16 if len(vocabulary) <= np.iinfo(np.uint16).max + 1 else np.int32
+
+
+def _shards(texts, shard_size):
+    texts = iter(texts)
+    while True:
+        shard = list(itertools.islice(texts, shard_size))
+        if not shard:
+            return
+        yield shard
+
+
+def _imap(fn, shards, n_jobs, initializer=None, initargs=()):
+    """
+    Ordered map of `fn` over `shards` in a process pool. At most 2 * n_jobs
+    shards are in flight, so the input is consumed lazily and memory stays
+    bounded by the shard size.
+    """
+    n_jobs = n_jobs or os.cpu_count()
+
+    if n_jobs == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for shard in shards:
+            yield fn(shard)
+        return
+
+    pool = multiprocessing.Pool(n_jobs, initializer, initargs)
+
+    try:
+        pending = deque()
+
+        for shard in shards:
+            pending.append(pool.apply_async(fn, (shard,)))
+            if len(pending) >= 2 * n_jobs:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+
+def _count_shard(args):
+    shard, max_len = args
+    counts = Counter()
+    lengths = np.empty(len(shard), dtype=np.int32)
+
+    for i, text in enumerate(shard):
+        tokens = tokenize(text)[:max_len]
+        counts.update(tokens)
+        lengths[i] = len(tokens)
+
+    return counts, lengths
+
+
+def build_vocab(texts, max_len=None, n_jobs=None, shard_size=10000):
+    """
+    Vocabulary of `texts` in a single streaming pass, same as `prepare_vocab`
+    up to the order of words with equal counts.
+
+    Params:
+    -------
+        texts: iterable of string
+            Raw texts, may be a generator.
+
+        max_len: int, default: None
+            Only count the first max_len tokens of each text, as the padded
+            texts of `prepare_vocab`. Defaults to the longest text.
+
+        n_jobs: int, default: None
+            Number of tokenizer processes. Defaults to the number of CPUs.
+
+        shard_size: int, default: 10000
+            Number of texts per task.
+
+    Returns:
+    --------
+        vocabulary: dict
+            Word to id, by decreasing count. Includes the padding word.
+    """
+    word_counts = Counter()
+    n_texts, n_tokens, longest = 0, 0, 0
+
+    shards = ((shard, max_len) for shard in _shards(texts, shard_size))
+
+    for counts, lengths in _imap(_count_shard, shards, n_jobs):
+        word_counts.update(counts)
+        n_texts += len(lengths)
+        n_tokens += int(lengths.sum())
+        longest = max(longest, int(lengths.max()))
+
+    # Padding words of all texts padded to the same length
+    n_pad = n_texts * (longest if max_len is None else max_len) - n_tokens
+    if n_pad > 0:
+        word_counts[PAD] += n_pad
+
+    vocabulary_inv = [x[0] for x in word_counts.most_common()]
+    vocabulary = {x: i for i, x in enumerate(vocabulary_inv)}
+
+    # Always present, so that it can be used for padding
+    vocabulary.setdefault(PAD, len(vocabulary))
+
+    return vocabulary
+
+
+_vocabulary = None
+
+
+def _init_encoder(vocabulary):
+    global _vocabulary
+    _vocabulary = vocabulary
+
+
+def _encode_shard(args):
+    shard, max_len, dtype = args
+    pad = _vocabulary[PAD]
+
+    ids = np.full([len(shard), max_len], pad, dtype=dtype)
+    lengths = np.empty(len(shard), dtype=np.int32)
+
+    for i, text in enumerate(shard):
+        tokens = tokenize(text)[:max_len]
+        ids[i, :len(tokens)] = [_vocabulary.get(word, pad) for word in tokens]
+        lengths[i] = len(tokens)
+
+    return ids, lengths
+
+
+def encode(texts, vocabulary, max_len, n_texts=None, out=None, rows=None, n_jobs=None, shard_size=10000):
+    """
+    Token ids of `texts`, padded or truncated to max_len, written directly
+    into a preallocated matrix. Same ids as `build_data`, words missing from
+    the vocabulary map to the padding word.
+
+    Params:
+    -------
+        texts: iterable of string
+            Raw texts, may be a generator.
+
+        vocabulary: dict
+            Word to id, as of `build_vocab`.
+
+        max_len: int
+            Number of tokens per text.
+
+        n_texts: int, default: None
+            Number of texts, needed if `texts` has no len() and `out` is not
+            given.
+
+        out: np.array of n x max_len, default: None
+            Matrix to write into, e.g. a np.memmap. Defaults to a new one of
+            `token_dtype(vocabulary)`, filled with the padding id.
+
+        rows: np.array of int, default: None
+            Row of `out` for every text. Defaults to consecutive rows.
+
+        n_jobs: int, default: None
+            Number of tokenizer processes. Defaults to the number of CPUs.
+
+        shard_size: int, default: 10000
+            Number of texts per task.
+
+    Returns:
+    --------
+        ids: np.array of n x max_len
+            `out`, if given.
+
+        lengths: np.array of n_texts
+            Number of real (non padding) tokens of every text, after
+            truncation.
+    """
+    if out is None:
+        n_texts = len(texts) if n_texts is None else n_texts
+        out = np.full([n_texts, max_len], vocabulary[PAD], dtype=token_dtype(vocabulary))
+
+    lengths = []
+    start = 0
+
+    shards = ((shard, max_len, out.dtype) for shard in _shards(texts, shard_size))
+
+    for ids, shard_lengths in _imap(_encode_shard, shards, n_jobs, _init_encoder, (vocabulary,)):
+        end = start + len(ids)
+        if rows is None:
+            out[start:end] = ids
+        else:
+            out[rows[start:end]] = ids
+        lengths.append(shard_lengths)
+        start = end
+
+    lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int32)
+
+    return out, lengths
+
+
+def _vocab_hash(vocabulary):
+    words = sorted(vocabulary, key=vocabulary.get)
+    return hashlib.sha1('\n'.join(words).encode('utf-8')).hexdigest()
+
+
+def _file_id(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def glove_matrix(vocabulary, glove_path, out_path, randseed=9999):
+    """
+    Vocabulary-aligned pretrained embedding matrix: row i is the GloVe vector
+    of the word with id i, or uniform(-0.25, 0.25) if GloVe misses it.
+
+    The GloVe file is streamed once, only the vectors of vocabulary words are
+    parsed. The result is saved as float32 .npy at `out_path`, so that it can
+    be memory-mapped, with a `out_path`.json sidecar keyed by the vocabulary
+    and the GloVe file: reruns with the same inputs just reuse it.
+
+    Params:
+    -------
+        vocabulary: dict
+            Word to id, as of `build_vocab`.
+
+        glove_path: string
+            GloVe text file, e.g. glove.6B.100d.txt.
+
+        out_path: string
+            Where to write the matrix.
+
+        randseed: int, default: 9999
+            Seed of the init of words missing from GloVe.
+
+    Returns:
+    --------
+        embeddings: np.memmap of len(vocabulary) x embedding_dim
+    """
+    key = {'vocab': _vocab_hash(vocabulary), 'glove': _file_id(glove_path), 'randseed': randseed}
+    key_path = out_path + '.json'
+
+    if os.path.exists(out_path) and os.path.exists(key_path):
+        with open(key_path) as f:
+            if json.load(f) == key:
+                return np.load(out_path, mmap_mode='r')
+
+    embeddings = None
+    found = np.zeros(len(vocabulary), dtype=bool)
+
+    with open(glove_path, 'rb') as f:
+        for line in f:
+            sep = line.find(b' ')
+            idx = vocabulary.get(line[:sep].decode('utf-8', 'replace'))
+            if idx is None:
+                continue
+
+            vector = np.array(line[sep+1:].split(), dtype=np.float32)
+
+            if embeddings is None:
+                embeddings = np.empty([len(vocabulary), len(vector)], dtype=np.float32)
+
+            embeddings[idx] = vector
+            found[idx] = True
+
+    if embeddings is None:
+        raise ValueError('No vocabulary word found in {}'.format(glove_path))
+
+    rng = np.random.RandomState(randseed)
+    embeddings[~found] = rng.uniform(-0.25, 0.25, [int((~found).sum()), embeddings.shape[1]])
+
+    # Sidecar last: an interrupted run is never mistaken for a cached one
+    np.save(out_path, embeddings)
+    with open(key_path, 'w') as f:
+        json.dump(key, f)
+
+    print('Pretrained embeddings: {} / {} words found in {}'.format(int(found.sum()), len(vocabulary), glove_path))
+
+    return np.load(out_path, mmap_mode='r')
@@ -0,0 +1,164 @@
+import sys
+sys.path.append('.')
+
+from kga.models.base import *
+from kga.models.literals import *
+from kga.export import TripleScorer, script_scorer, compile_scorer, export, export_path, load
+import numpy as np
+import torch
+import argparse
+from time import time
+
+
+parser = argparse.ArgumentParser(
+    description='CPU latency of eager vs. exported (TorchScript) scoring'
+)
+
+parser.add_argument('--model', default='distmult', metavar='',
+                    help='model to run: {rescal, distmult, ermlp, transe, distmult_literal, erlmlp} (default: distmult)')
+parser.add_argument('--dataset', default='fb15k-literal', metavar='',
+                    help='dataset to be used (default: fb15k-literal)')
+parser.add_argument('--k', type=int, default=100, metavar='',
+                    help='embedding dim (default: 100)')
+parser.add_argument('--checkpoint', default=None, metavar='',
+                    help='state dict to load, its scorer is exported next to it (default: None, random weights)')
+parser.add_argument('--batch_sizes', default='1,32,1024', metavar='',
+                    help='comma separated batch sizes (default: 1,32,1024)')
+parser.add_argument('--score_all_sizes', default='1,32,128', metavar='',
+                    help='comma separated numbers of triples scored against all entities (default: 1,32,128)')
+parser.add_argument('--n_iter', type=int, default=200, metavar='',
+                    help='timed calls per batch size (default: 200)')
+parser.add_argument('--n_threads', type=int, default=1, metavar='',
+                    help='torch intra-op threads (default: 1)')
+parser.add_argument('--compile', default=False, action='store_true',
+                    help='also time torch.compile (default: False)')
+parser.add_argument('--randseed', default=9999, type=int, metavar='',
+                    help='random seed (default: 9999)')
+
+args = parser.parse_args()
+
+
+np.random.seed(args.randseed)
+torch.manual_seed(args.randseed)
+torch.set_num_threads(args.n_threads)
+
+
+def load_bin(name):
+    return np.load('data/{}/bin/{}.npy'.format(args.dataset, name))
+
+
+n_e = len(load_bin('idx2ent'))
+n_r = len(load_bin('idx2rel'))
+
+X_test = load_bin('test').astype(int)
+
+literals = []
+
+if args.model in ('distmult_literal', 'erlmlp'):
+    X_lit = load_bin('numerical_literals').astype(np.float32)
+    n_l = X_lit.shape[1]
+    literals = [X_lit] if args.model == 'distmult_literal' else [X_lit, None, None]
+
+models = {
+    'rescal': lambda: RESCAL(n_e=n_e, n_r=n_r, k=args.k, lam=0),
+    'distmult': lambda: DistMult(n_e=n_e, n_r=n_r, k=args.k, lam=0),
+    'ermlp': lambda: ERMLP(n_e=n_e, n_r=n_r, k=args.k, h_dim=100, p=0, lam=0),
+    'transe': lambda: TransE(n_e=n_e, n_r=n_r, k=args.k, gamma=1),
+    'distmult_literal': lambda: DistMultLiteral(n_e=n_e, n_r=n_r, n_l=n_l, k=args.k),
+    'erlmlp': lambda: ERLMLP(n_ent=n_e, n_rel=n_r, n_lit=n_l, k=args.k, h_dim=100, num_lit=True)
+}
+
+model = models[args.model]()
+
+if args.checkpoint is not None:
+    model.load_state_dict(torch.load(args.checkpoint, map_location=lambda storage, loc: storage))
+
+model.eval()
+
+
+def eager_numpy(X):
+    # As evaluation calls it: NumPy triples and per-triple literals
+    args_lit = []
+    for table in literals:
+        args_lit += [None, None] if table is None else [table[X[:, 0]], table[X[:, 2]]]
+    return model.forward(X, *args_lit)
+
+
+eager = TripleScorer(model, literals).eval()
+
+if args.checkpoint is not None:
+    path = export_path(args.checkpoint)
+    export(model, path, literals)
+    scripted = load(path)
+    print('Exported to {}'.format(path))
+else:
+    scripted = script_scorer(model, literals)
+
+scorers = [('eager (numpy)', eager_numpy, False), ('eager (tensor)', eager, True), ('torchscript', scripted, True)]
+
+if args.compile:
+    scorers.append(('torch.compile', compile_scorer(model, literals), True))
+
+
+def timeit(fn, X):
+    with torch.no_grad():
+        for _ in range(10):
+            fn(X)
+
+        start = time()
+        for _ in range(args.n_iter):
+            fn(X)
+
+    return (time() - start) / args.n_iter
+
+
+X_mb = X_test[:1]
+
+with torch.no_grad():
+    y = eager_numpy(X_mb).view(-1)
+    for name, fn, tensor in scorers[1:]:
+        diff = float((fn(torch.from_numpy(X_mb)).view(-1) - y).abs().max())
+        print('{}: max. score difference to eager: {:.2e}'.format(name, diff))
+
+print('Model: {}; threads: {}'.format(args.model, args.n_threads))
+
+for mb_size in [int(b) for b in args.batch_sizes.split(',')]:
+    X_mb = X_test[np.random.randint(X_test.shape[0], size=mb_size)]
+    X_mb_t = torch.from_numpy(X_mb)
+
+    times = [timeit(fn, X_mb_t if tensor else X_mb) for _, fn, tensor in scorers]
+
+    print('forward, batch {}: '.format(mb_size) + '; '.join(
+        '{} {:.3f}ms ({:.2f}x)'.format(name, 1000 * t, times[0] / t)
+        for (name, _, _), t in zip(scorers, times)
+    ))
+
+kwargs_lit = {'X_lit': X_lit} if literals else {}
+
+
+def predict_all_loop(X):
+    # As eval_embeddings_vertical scores: one triple at a time
+    for i in range(X.size(0)):
+        model.predict_all(X[i:i+1], **kwargs_lit)
+
+
+X_mb_t = torch.from_numpy(X_test[:1])
+
+with torch.no_grad():
+    y_s, y_o = model.predict_all(X_mb_t, **kwargs_lit)
+    for name, fn, _ in scorers[1:]:
+        y_s_fn, y_o_fn = fn.score_all(X_mb_t)
+        diff = max(float((y_s_fn.view(-1) - y_s).abs().max()), float((y_o_fn.view(-1) - y_o).abs().max()))
+        print('{}: max. score_all difference to predict_all: {:.2e}'.format(name, diff))
+
+# All-entity scoring of M test triples, against M predict_all calls
+for M in [int(m) for m in args.score_all_sizes.split(',')]:
+    X_mb_t = torch.from_numpy(X_test[np.random.randint(X_test.shape[0], size=M)])
+
+    t_predict_all = timeit(predict_all_loop, X_mb_t)
+    t_eager = timeit(eager.score_all, X_mb_t)
+    t_scripted = timeit(scripted.score_all, X_mb_t)
+
+    print('score_all, {} triples: predict_all x{} {:.3f}ms; eager {:.3f}ms ({:.2f}x); torchscript {:.3f}ms ({:.2f}x)'
+          .format(M, M, 1000 * t_predict_all, 1000 * t_eager, t_predict_all / t_eager,
+                  1000 * t_scripted, t_predict_all / t_scripted))
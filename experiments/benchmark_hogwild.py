@@ -0,0 +1,61 @@
+import sys
+sys.path.append('.')
+
+from kga.models.base import *
+from kga.hogwild import scaling_report
+import numpy as np
+import argparse
+
+
+parser = argparse.ArgumentParser(
+    description='Scaling efficiency of Hogwild training from 1 to N cores'
+)
+
+parser.add_argument('--model', default='distmult', metavar='',
+                    help='model to run: {rescal, distmult, ermlp, transe} (default: distmult)')
+parser.add_argument('--dataset', default='wordnet', metavar='',
+                    help='dataset to be used (default: wordnet)')
+parser.add_argument('--k', type=int, default=100, metavar='',
+                    help='embedding dim (default: 100)')
+parser.add_argument('--mbsize', type=int, default=100, metavar='',
+                    help='size of minibatch (default: 100)')
+parser.add_argument('--negative_samples', type=int, default=10, metavar='',
+                    help='number of negative samples per positive sample (default: 10)')
+parser.add_argument('--max_workers', type=int, default=8, metavar='',
+                    help='benchmark 1, 2, 4, ... up to this many workers (default: 8)')
+parser.add_argument('--max_batches', type=int, default=200, metavar='',
+                    help='minibatches per worker in each run (default: 200)')
+
+args = parser.parse_args()
+
+
+idx2ent = np.load('data/{}/bin/idx2ent.npy'.format(args.dataset))
+idx2rel = np.load('data/{}/bin/idx2rel.npy'.format(args.dataset))
+
+n_e = len(idx2ent)
+n_r = len(idx2rel)
+
+X_train = np.load('data/{}/bin/train.npy'.format(args.dataset)).astype(int)
+
+
+def make_model():
+    models = {
+        'rescal': lambda: RESCAL(n_e=n_e, n_r=n_r, k=args.k, lam=0),
+        'distmult': lambda: DistMult(n_e=n_e, n_r=n_r, k=args.k, lam=0),
+        'ermlp': lambda: ERMLP(n_e=n_e, n_r=n_r, k=args.k, h_dim=100, p=0, lam=0),
+        'transe': lambda: TransE(n_e=n_e, n_r=n_r, k=args.k, gamma=1)
+    }
+
+    return models[args.model]()
+
+
+workers = [1]
+while workers[-1] * 2 <= args.max_workers:
+    workers.append(workers[-1] * 2)
+if workers[-1] != args.max_workers:
+    workers.append(args.max_workers)
+
+scaling_report(
+    make_model, X_train, n_e, workers=workers, max_batches=args.max_batches,
+    mb_size=args.mbsize, C=args.negative_samples, energy_based=args.model == 'transe'
+)
@@ -0,0 +1,153 @@
+import sys
+sys.path.append('.')
+
+from kga.models.base import *
+from kga.models.literals import *
+from kga.util import sample_negatives
+import numpy as np
+import os
+import torch
+import argparse
+from time import time
+
+
+parser = argparse.ArgumentParser(
+    description='Unique-entity ratio of training minibatches and speedup of batch-level unique lookup'
+)
+
+parser.add_argument('--model', default='distmult', metavar='',
+                    help='model to run: {rescal, distmult, ermlp, transe, distmult_literal, erlmlp} (default: distmult)')
+parser.add_argument('--dataset', default='fb15k-literal', metavar='',
+                    help='dataset to be used: {fb15k-literal, yago3-10-literal} (default: fb15k-literal)')
+parser.add_argument('--k', type=int, default=100, metavar='',
+                    help='embedding dim (default: 100)')
+parser.add_argument('--mbsize', type=int, default=100, metavar='',
+                    help='size of minibatch (default: 100)')
+parser.add_argument('--negative_samples', type=int, default=10, metavar='',
+                    help='number of negative samples per positive sample (default: 10)')
+parser.add_argument('--img_dim', type=int, default=512, metavar='',
+                    help='dim of the image features of erlmlp, random if data/<dataset>/bin/image_features.npy does not exist (default: 512)')
+parser.add_argument('--n_batches', type=int, default=200, metavar='',
+                    help='minibatches timed per mode (default: 200)')
+parser.add_argument('--use_gpu', default=False, action='store_true',
+                    help='whether to run in the GPU (default: False)')
+parser.add_argument('--randseed', default=9999, type=int, metavar='',
+                    help='random seed (default: 9999)')
+
+args = parser.parse_args()
+
+
+# Set random seed
+np.random.seed(args.randseed)
+torch.manual_seed(args.randseed)
+
+if args.use_gpu:
+    torch.cuda.manual_seed(args.randseed)
+
+
+def load(name):
+    return np.load('data/{}/bin/{}.npy'.format(args.dataset, name))
+
+
+n_e = len(load('idx2ent'))
+n_r = len(load('idx2rel'))
+
+X_train = load('train').astype(int)
+
+literal_models = ('distmult_literal', 'erlmlp')
+
+if args.model in literal_models:
+    X_lit = load('numerical_literals').astype(np.float32)
+    n_l = X_lit.shape[1]
+
+if args.model == 'erlmlp':
+    img_path = 'data/{}/bin/image_features.npy'.format(args.dataset)
+
+    if os.path.exists(img_path):
+        X_img = np.load(img_path).astype(np.float32)
+    else:
+        X_img = np.random.randn(n_e, args.img_dim).astype(np.float32)
+
+
+models = {
+    'rescal': lambda: RESCAL(n_e=n_e, n_r=n_r, k=args.k, lam=0, gpu=args.use_gpu),
+    'distmult': lambda: DistMult(n_e=n_e, n_r=n_r, k=args.k, lam=0, gpu=args.use_gpu),
+    'ermlp': lambda: ERMLP(n_e=n_e, n_r=n_r, k=args.k, h_dim=100, p=0, lam=0, gpu=args.use_gpu),
+    'transe': lambda: TransE(n_e=n_e, n_r=n_r, k=args.k, gamma=1, gpu=args.use_gpu),
+    'distmult_literal': lambda: DistMultLiteral(n_e=n_e, n_r=n_r, n_l=n_l, k=args.k, gpu=args.use_gpu),
+    'erlmlp': lambda: ERLMLP(n_ent=n_e, n_rel=n_r, n_lit=n_l, k=args.k, h_dim=100, gpu=args.use_gpu,
+                             num_lit=True, img_lit=True)
+}
+
+model = models[args.model]()
+
+
+def forward(X):
+    s, o = X[:, 0], X[:, 2]
+
+    if args.model == 'distmult_literal':
+        return model.forward(X, X_lit[s], X_lit[o])
+    if args.model == 'erlmlp':
+        return model.forward(X, X_lit[s], X_lit[o], X_img[s], X_img[o], None, None)
+
+    return model.forward(X)
+
+
+# Same minibatches for both modes: [m positives; C blocks of m negatives]
+batches = []
+
+for _ in range(args.n_batches):
+    X_mb = X_train[np.random.randint(X_train.shape[0], size=args.mbsize)]
+    X_neg_mb = np.vstack([sample_negatives(X_mb, n_e) for _ in range(args.negative_samples)])
+    batches.append(np.vstack([X_mb, X_neg_mb]))
+
+n_ents = np.array([2 * X.shape[0] for X in batches])
+n_unique = np.array([len(np.unique(X[:, [0, 2]])) for X in batches])
+
+print('Dataset: {}; batch: {} triples; unique entities per batch: {:.1f} of {} ({:.1f}%)'
+      .format(args.dataset, batches[0].shape[0], n_unique.mean(), n_ents[0],
+              100. * n_unique.sum() / n_ents.sum()))
+
+
+def sync():
+    if args.use_gpu:
+        torch.cuda.synchronize()
+
+
+def run(unique):
+    model.set_unique_lookup(unique)
+    model.zero_grad()
+
+    # Warm up
+    for X in batches[:5]:
+        forward(X).sum().backward()
+
+    sync()
+    start = time()
+
+    for X in batches:
+        forward(X).sum().backward()
+
+    sync()
+
+    return (time() - start) / len(batches)
+
+
+# Same scores in both modes
+model.eval()
+
+with torch.no_grad():
+    model.set_unique_lookup(False)
+    y = forward(batches[0])
+    model.set_unique_lookup(True)
+    y_unique = forward(batches[0])
+
+print('Max. score difference: {:.2e}'.format(float((y - y_unique).abs().max())))
+
+model.train()
+
+t_per_triple = run(False)
+t_unique = run(True)
+
+print('Model: {}; forward+backward per batch: {:.2f}ms per-triple, {:.2f}ms unique; speedup: {:.2f}x'
+      .format(args.model, 1000 * t_per_triple, 1000 * t_unique, t_per_triple / t_unique))
@@ -0,0 +1,78 @@
+import sys
+sys.path.append('.')
+
+from kga.models.literals import *
+import numpy as np
+import argparse
+from time import time
+
+
+parser = argparse.ArgumentParser(
+    description='LSTM cost of padded vs. length-aware (packed) text literal encoding'
+)
+
+parser.add_argument('--dataset', default='fb15k-literal', metavar='',
+                    help='dataset with bin/text_tokens.npy and bin/text_lengths.npy (default: fb15k-literal)')
+parser.add_argument('--k', type=int, default=50, metavar='',
+                    help='embedding dim, i.e. LSTM hidden size (default: 50)')
+parser.add_argument('--dim_text', type=int, default=300, metavar='',
+                    help='word embedding dim (default: 300)')
+parser.add_argument('--mbsize', type=int, default=100, metavar='',
+                    help='size of minibatch (default: 100)')
+parser.add_argument('--negative_samples', type=int, default=10, metavar='',
+                    help='number of negative samples per positive sample  (default: 10)')
+parser.add_argument('--n_batches', type=int, default=50, metavar='',
+                    help='number of timed training batches (default: 50)')
+
+args = parser.parse_args()
+
+
+text_tokens = np.load('data/{}/bin/text_tokens.npy'.format(args.dataset))
+text_lengths = np.load('data/{}/bin/text_lengths.npy'.format(args.dataset))
+
+n_e, text_length = text_tokens.shape
+vocab_size = int(text_tokens.max()) + 1
+embeddings = np.random.randn(vocab_size, args.dim_text).astype(np.float32)
+
+# Multiply-adds of one LSTM step: 4 gates over [x, h]
+step_flops = 2 * 4 * args.k * (args.dim_text + args.k)
+
+padded_steps = n_e * text_length
+packed_steps = int(text_lengths.sum())
+
+print('Entities: {}; with text: {}; mean length: {:.1f} / {}'
+      .format(n_e, int((text_lengths > 0).sum()), text_lengths.mean(), text_length))
+print('LSTM GFLOPs to encode all entities: padded {:.2f}; packed {:.2f} ({:.1f}% saved)'
+      .format(padded_steps * step_flops / 1e9, packed_steps * step_flops / 1e9,
+              100 * (1 - packed_steps / padded_steps)))
+
+
+def make_model(lengths):
+    return ERMLP_literal2(
+        n_e, 1, args.k, 100, 0, 0, 0, vocab_size, args.dim_text, embeddings,
+        text_tokens, lengths, numeric=False, text=True
+    )
+
+
+models = [('padded', make_model(None)), ('packed', make_model(text_lengths))]
+batch_size = args.mbsize * (1 + args.negative_samples)
+
+for name, model in models:
+    # Eval: all descriptions once
+    model.eval()
+    start = time()
+    model.text_cache()
+    t_eval = time() - start
+
+    # Training: forward + backward of the text encoder on random batches
+    model.train()
+    start = time()
+
+    for _ in range(args.n_batches):
+        ents = torch.from_numpy(np.random.randint(n_e, size=batch_size)).long()
+        h = model.text_features(ents, 's')
+        h.sum().backward()
+
+    t_train = (time() - start) / args.n_batches
+
+    print('{}: encode all entities {:.2f}s; training batch {:.4f}s'.format(name, t_eval, t_train))
@@ -10,7 +10,6 @@ import os
 from time import time
 from sklearn.utils import shuffle as skshuffle
 import pdb
-from scipy.sparse import load_npz
 
 C = 5 #negative samples
 nepoch = 20
@@ -45,20 +44,17 @@ n_r = len(idx2relation)
 X_train = np.load('data/fb15k-literal/bin/train.npy')
 X_val = np.load('data/fb15k-literal/bin/val.npy')
 
-# Load Literals
-train_literal_s = load_npz('data/fb15k-literal/bin/train_literal_s.npz').todense().astype(np.float32)
-train_literal_o = load_npz('data/fb15k-literal/bin/train_literal_o.npz').todense().astype(np.float32)
-val_literal_s = load_npz('data/fb15k-literal/bin/val_literal_s.npz').todense().astype(np.float32)
-val_literal_o = load_npz('data/fb15k-literal/bin/val_literal_o.npz').todense().astype(np.float32)
+# Load Literals, one row per entity
+X_lit, _ = load_literals('data/fb15k-literal/bin')
 
-n_l = train_literal_s.shape[1]
+n_l = X_lit.shape[1]
 M_train = X_train.shape[0]
 M_val = X_val.shape[0]
 
 
 # Initialize model
 embedding_size = 50
-model = DistMult_literal(n_e, n_r, n_l, embedding_size, lam=embeddings_lambda, gpu=use_gpu)
+model = DistMultLiteral(n_e, n_r, n_l, embedding_size, gpu=use_gpu)
 # Training params
 #solver = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
 solver = torch.optim.Adam(model.parameters(), lr=lr, weight_decay=weight_decay)
@@ -98,8 +94,8 @@ for epoch in range(n_epoch):
 
         X_train_mb = np.vstack([X_mb, X_neg_mb])
         y_true_mb = np.vstack([np.ones([m, 1]), np.zeros([m, 1])])
-        train_literal_s_mb = train_literal_s[X_train_mb[:,0]]
-        train_literal_o_mb = train_literal_o[X_train_mb[:,2]]
+        train_literal_s_mb = X_lit[X_train_mb[:,0]].astype(np.float32)
+        train_literal_o_mb = X_lit[X_train_mb[:,2]].astype(np.float32)
         if loss_type =='logloss':
             X_train_mb, y_true_mb, train_literal_s_mb, train_literal_o_mb = skshuffle(X_train_mb, y_true_mb, train_literal_s_mb, train_literal_o_mb)
         # Training step
@@ -122,7 +118,7 @@ for epoch in range(n_epoch):
         # Training logs
         if it % print_every == 0:
             if loss_type =='logloss':
-                pred = model.predict(X_train_mb, val_literal_s, val_literal_o, sigmoid=True)
+                pred = model.predict(X_train_mb, train_literal_s_mb, train_literal_o_mb, sigmoid=True)
                 train_acc = accuracy(pred, y_true_mb)
                 # Per class training accuracy
                 pos_acc = accuracy(pred[:m], y_true_mb[:m])
@@ -145,7 +141,7 @@ for epoch in range(n_epoch):
             else:
                 n_sample = 100
                 k = 10
-                mr, mrr, hits10 = eval_embeddings(model, X_val, n_e, k, n_sample, val_literal_s, val_literal_o)
+                mr, mrr, hits10 = eval_embeddings(model, X_val, n_e, k, n_sample, X_lit, X_lit)
             # For TransE, show loss, mrr & hits@10
             print('Iter-{}; loss: {:.4f}; val_mr: {:.4f}; val_mrr: {:.4f}; val_hits@{}: {:.4f}; time per batch: {:.2f}s'
                   .format(it, loss.data[0], mr, mrr, k, hits10, end-start))
@@ -4,6 +4,7 @@ sys.path.append('.')
 from kga.models.literals import *
 from kga.metrics import *
 from kga.util import *
+from kga.async_eval import AsyncEvaluator, vertical_eval, format_result
 import numpy as np
 import torch.optim
 import argparse
@@ -43,6 +44,10 @@ parser.add_argument('--normalize_embed', default=False, type=bool, metavar='',
                     help='whether to normalize embeddings to unit euclidean ball (default: False)')
 parser.add_argument('--log_interval', type=int, default=9999, metavar='',
                     help='interval between training status logs (default: 9999)')
+parser.add_argument('--async_eval', default=False, action='store_true',
+                    help='evaluate on the validation set in a separate process instead of inline (default: False)')
+parser.add_argument('--patience', type=int, default=-1, metavar='',
+                    help='with --async_eval, stop after n evaluations without val MRR improvement, -1 to never stop (default: -1)')
 parser.add_argument('--checkpoint_dir', default='models/', metavar='',
                     help='directory to save model checkpoint, saved every epoch (default: models/)')
 parser.add_argument('--use_gpu', default=False, action='store_true',
@@ -59,6 +64,8 @@ parser.add_argument('--use_image_lit', default=False, action='store_true',
                     help='whether to use images literals (default: False)')
 parser.add_argument('--use_text_lit', default=False, action='store_true',
                     help='whether to use texts literals (default: False)')
+parser.add_argument('--sparse_lit', default=False, action='store_true',
+                    help='whether to feed numerical literals as sparse (attribute, value) bags (default: False)')
 
 args = parser.parse_args()
 
@@ -89,7 +96,10 @@ X_test = np.load('data/fb15k-literal/bin/test.npy').astype(int)
 
 
 # Load literals
-X_lit = np.load('data/fb15k-literal/bin/numerical_literals.npy').astype('float32')
+if args.sparse_lit:
+    X_lit = load_sparse_literals('data/fb15k-literal/bin')
+else:
+    X_lit = np.load('data/fb15k-literal/bin/numerical_literals.npy').astype('float32')
 
 M_train = X_train.shape[0]
 M_val = X_val.shape[0]
@@ -102,7 +112,7 @@ lam = args.embeddings_lambda
 C = args.negative_samples
 
 # Initialize model
-model = ERLMLP(n_ent, n_rel, n_lit, k, h_dim, args.use_gpu, args.use_num_lit, args.use_image_lit, args.use_text_lit)
+model = ERLMLP(n_ent, n_rel, n_lit, k, h_dim, args.use_gpu, args.use_num_lit, args.use_image_lit, args.use_text_lit, args.sparse_lit)
 
 # Training params
 lr = args.lr
@@ -155,6 +165,16 @@ if args.test:
 Train mode: Train model from scratch
 ====================================
 """
+evaluator = None
+
+if args.async_eval and print_every != -1:
+    evaluator = AsyncEvaluator(
+        model, vertical_eval(X_val, n_ent, filter_s_val, filter_o_val, n_sample=500,
+                             X_lit=X_lit, X_lit_img=None, X_lit_txt=None),
+        patience=args.patience if args.patience != -1 else None,
+        best_path='{}/{}_lr{}_wd{}.best.bin'.format(checkpoint_dir, model_name, lr, wd)
+    )
+
 # Begin training
 for epoch in range(n_epoch):
     print('Epoch-{}'.format(epoch+1))
@@ -183,8 +203,12 @@ for epoch in range(n_epoch):
         y_true_mb = np.vstack([np.ones([m, 1]), np.zeros([m, 1])])
 
         # Numerical lit
-        X_lit_s_mb = X_lit[X_train_mb[:, 0]]
-        X_lit_o_mb = X_lit[X_train_mb[:, 2]]
+        if args.sparse_lit:
+            X_lit_s_mb = literal_bags(X_lit, X_train_mb[:, 0])
+            X_lit_o_mb = literal_bags(X_lit, X_train_mb[:, 2])
+        else:
+            X_lit_s_mb = X_lit[X_train_mb[:, 0]]
+            X_lit_o_mb = X_lit[X_train_mb[:, 2]]
         # Image lit
         # X_lit_s_img_mb = X_lit_img[X_train_mb[:, 0]]
         # X_lit_o_img_mb = X_lit_img[X_train_mb[:, 2]]
@@ -215,18 +239,35 @@ for epoch in range(n_epoch):
         end = time()
 
         # Training logs
-        if print_every != -1 and it % print_every == 0:
+        if print_every != -1 and it % print_every == 0 and evaluator is not None:
+            # Snapshot only, evaluated while training goes on
+            evaluator.publish('{}-{}'.format(epoch+1, it))
+
+            print('Iter-{}; loss: {:.4f}; time per batch: {:.2f}s'
+                  .format(it, loss.item(), end-start))
+        elif print_every != -1 and it % print_every == 0:
+            model.eval()
+
             hits_ks = [1, 3, 10]
 
             mr, mrr, hits = eval_embeddings_vertical(
-                model, X_test, n_ent, hits_ks, filter_s_test, filter_o_test, n_sample=500,
+                model, X_val, n_ent, hits_ks, filter_s_val, filter_o_val, n_sample=500,
                 X_lit=X_lit, X_lit_img=None, X_lit_txt=None
             )
 
             hits1, hits3, hits10 = hits
 
             print('Iter-{}; loss: {:.4f}; val_mr: {:.4f}; val_mrr: {:.4f}; val_hits@1: {:.4f}; val_hits@3: {:.4f}; val_hits@10: {:.4f}; time per batch: {:.2f}s'
-                  .format(it, loss.data[0], mr, mrr, hits1, hits3, hits10, end-start))
+                  .format(it, loss.item(), mr, mrr, hits1, hits3, hits10, end-start))
+
+            model.train()
+
+        if evaluator is not None:
+            for result in evaluator.poll():
+                print(format_result(result))
+
+            if evaluator.should_stop:
+                break
 
         it += 1
 
@@ -234,3 +275,14 @@ for epoch in range(n_epoch):
 
     # Checkpoint every epoch
     torch.save(model.state_dict(), checkpoint_path)
+
+    if evaluator is not None and evaluator.should_stop:
+        print('Early stopping: no val MRR improvement in {} evaluations'.format(args.patience))
+        break
+
+if evaluator is not None:
+    for result in evaluator.close():
+        print(format_result(result))
+
+    if evaluator.best is not None:
+        print('Best val_mrr: {:.4f} at {}'.format(evaluator.best, evaluator.best_step))
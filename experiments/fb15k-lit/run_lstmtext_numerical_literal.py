@@ -10,7 +10,6 @@ import os
 from time import time
 from sklearn.utils import shuffle as skshuffle
 import pdb
-from scipy.sparse import load_npz
 import argparse
 import pickle
 
@@ -89,11 +88,8 @@ n_r = len(idx2relation)
 X_train = np.load('data/fb15k-literal/bin/train.npy')
 X_val = np.load('data/fb15k-literal/bin/val.npy')
 
-# Load Numerical Literals
-train_literal_s = load_npz('data/fb15k-literal/bin/train_literal_s.npz').todense().astype(np.float32)
-train_literal_o = load_npz('data/fb15k-literal/bin/train_literal_o.npz').todense().astype(np.float32)
-val_literal_s = load_npz('data/fb15k-literal/bin/val_literal_s.npz').todense().astype(np.float32)
-val_literal_o = load_npz('data/fb15k-literal/bin/val_literal_o.npz').todense().astype(np.float32)
+# Load Numerical Literals, one row per entity
+X_lit = np.load('data/fb15k-literal/bin/numerical_literals.npy').astype(np.float32)
 
 # Load Text Vocabulary
 with open('data/fb15k-literal/vocabulary_text.pickle', 'rb') as f:
@@ -101,31 +97,22 @@ with open('data/fb15k-literal/vocabulary_text.pickle', 'rb') as f:
 
 vocab_size_text = len(vocabulary)
 
-# Pretrained-Embeddings-for-text
-with open('data/fb15k-literal/bin/pretrained-embedding.pickle', 'rb') as f:
-    embedding_weights = pickle.load(f)
+# Pretrained-Embeddings-for-text, rows aligned with the vocabulary ids
+embedding_weights = np.load('data/fb15k-literal/bin/pretrained-embedding.npy', mmap_mode='r')
 
-# Load Text Literals
-train_text_s = load_npz('data/fb15k-literal/bin/train_text_s.npz').toarray()
-train_text_o = load_npz('data/fb15k-literal/bin/train_text_o.npz').toarray()
-
-val_text_s = load_npz('data/fb15k-literal/bin/val_text_s.npz').toarray()
-val_text_o = load_npz('data/fb15k-literal/bin/val_text_o.npz').toarray()
-
-embedding_weights = np.array(list(embedding_weights.values()))
+# Load Text Literals, one description per entity
+text_tokens = np.load('data/fb15k-literal/bin/text_tokens.npy')
+text_lengths = np.load('data/fb15k-literal/bin/text_lengths.npy')
 
 dim_text = embedding_weights.shape[1]
-n_numeric = train_literal_s.shape[1]
+n_numeric = X_lit.shape[1]
 M_train = X_train.shape[0]
 M_val = X_val.shape[0]
 
 # Initialize model
-batch_size = mb_size + C*mb_size
-text_length = 50
-
 model = ERMLP_literal2(
     n_e, n_r, embedding_size, h_dim, p, embeddings_lambda, n_numeric,
-    vocab_size_text, dim_text, embedding_weights, batch_size, text_length,
+    vocab_size_text, dim_text, embedding_weights, text_tokens, text_lengths,
     numeric=True, text=True, gpu=use_gpu
 )
 
@@ -148,7 +135,7 @@ for epoch in range(n_epoch):
     # Shuffle and chunk data into minibatches
     mb_iter = get_minibatches(X_train, mb_size, shuffle=True)
     # Anneal learning rate
-    lr = lr * (0.5 ** (epoch // lr_decay_every))
+    lr = args.lr * (0.5 ** (epoch // lr_decay_every))
     for param_group in solver.param_groups:
         param_group['lr'] = lr
 
@@ -162,15 +149,11 @@ for epoch in range(n_epoch):
         X_neg_mb = np.vstack([sample_negatives(X_mb, n_e) for _ in range(C)])
 
         X_train_mb = np.vstack([X_mb, X_neg_mb])
-        y_true_mb = np.vstack([np.ones([m, 1]), np.zeros([m, 1])])
-        train_literal_s_mb = train_literal_s[X_train_mb[:,0]]
-        train_literal_o_mb = train_literal_o[X_train_mb[:,2]]
+        train_literal_s_mb = X_lit[X_train_mb[:, 0]]
+        train_literal_o_mb = X_lit[X_train_mb[:, 2]]
 
-        train_text_s_mb = train_text_s[X_train_mb[:,0]]
-        train_text_o_mb = train_text_o[X_train_mb[:,2]]
-
-        # Training step
-        y = model.forward(X_train_mb, train_literal_s_mb, train_literal_o_mb, train_text_s_mb, train_text_o_mb)
+        # Training step, descriptions are looked up inside the model
+        y = model.forward(X_train_mb, train_literal_s_mb, train_literal_o_mb)
 
         y_pos, y_neg = y[:m], y[m:]
         loss = model.ranking_loss(
@@ -185,12 +168,15 @@ for epoch in range(n_epoch):
 
         # Training logs
         if it % print_every == 0:
-            n_sample = 100
-            k = 10
-            mr, mrr, hits10 = eval_embeddings(model, X_val, n_e, k, n_sample, val_literal_s, val_literal_o, val_text_s, val_text_o)
+            model.eval()
+
+            # Descriptions are encoded once for the whole evaluation
+            mr, mrr, hits = eval_embeddings_vertical(model, X_val, n_e, [1, 3, 10], n_sample=100, X_lit=X_lit)
 
             print('Iter-{}; loss: {:.4f}; val_mrr: {:.4f}; val_hits@10: {:.4f}; time per batch: {:.2f}s'
-                  .format(it, loss.data[0], mrr, hits10, end-start))
+                  .format(it, loss.item(), mrr, hits[2], end-start))
+
+            model.train()
 
         it += 1
 
@@ -10,7 +10,6 @@ import argparse
 import os
 from time import time
 from sklearn.utils import shuffle as skshuffle
-from scipy.sparse import load_npz
 
 
 parser = argparse.ArgumentParser(
@@ -79,14 +78,13 @@ X_train = np.load('data/fb15k-literal/bin/train.npy').astype(int)
 X_val = np.load('data/fb15k-literal/bin/val.npy').astype(int)
 X_test = np.load('data/fb15k-literal/bin/test.npy').astype(int)
 
-# Load literals
-X_lit_s_train = load_npz('data/fb15k-literal/bin/train_literal_s.npz').todense().astype(np.float32)
-X_lit_o_train = load_npz('data/fb15k-literal/bin/train_literal_o.npz').todense().astype(np.float32)
+# Load literals, one sparse row per entity
+X_lit = load_sparse_literals('data/fb15k-literal/bin')
 
 M_train = X_train.shape[0]
 M_val = X_val.shape[0]
 
-n_lit = X_lit_s_train.shape[1]
+n_lit = X_lit.shape[1]
 
 k = args.k
 h_dim = args.mlp_h
@@ -174,23 +172,25 @@ for epoch in range(n_epoch):
 
         m_total = X_train_mb.shape[0]
 
-        # Random attribute to predict for users and movies in X_train_mb
-        s_attr = np.random.randint(n_lit, size=m_total)
-        o_attr = np.random.randint(n_lit, size=m_total)
+        # Random present attribute to predict for entities in X_train_mb,
+        # with ground truth literals
+        s_attr, y_true_lit_s, has_lit_s = sample_literals(X_lit, X_train_mb[:, 0])
+        o_attr, y_true_lit_o, has_lit_o = sample_literals(X_lit, X_train_mb[:, 2])
 
-        # Ground truth literals
-        y_true_lit_s = X_lit_s_train[X_train_mb[:, 0], s_attr]
-        y_true_lit_o = X_lit_o_train[X_train_mb[:, 2], o_attr]
+        # Entities without literals do not contribute to the attribute loss
+        has_lit_s = has_lit_s.astype(np.float32)
+        has_lit_o = has_lit_o.astype(np.float32)
 
         if args.use_gpu:
             y_true_lit_s = torch.from_numpy(y_true_lit_s).cuda()
             y_true_lit_o = torch.from_numpy(y_true_lit_o).cuda()
+            has_lit_s = torch.from_numpy(has_lit_s).cuda()
+            has_lit_o = torch.from_numpy(has_lit_o).cuda()
         else:
             y_true_lit_s = torch.from_numpy(y_true_lit_s)
             y_true_lit_o = torch.from_numpy(y_true_lit_o)
-
-        y_true_lit_s = Variable(y_true_lit_s)
-        y_true_lit_o = Variable(y_true_lit_o)
+            has_lit_s = torch.from_numpy(has_lit_s)
+            has_lit_o = torch.from_numpy(has_lit_o)
 
         # Training step
         y_er, y_lit_s, y_lit_o = model.forward(X_train_mb, s_attr, o_attr)
@@ -205,8 +205,8 @@ for epoch in range(n_epoch):
             loss_total = loss_er
         else:
             # Attribute nets update
-            loss_lit_s = F.mse_loss(y_lit_s, y_true_lit_s)
-            loss_lit_o = F.mse_loss(y_lit_o, y_true_lit_o)
+            loss_lit_s = torch.sum(has_lit_s * (y_lit_s.view(-1) - y_true_lit_s)**2) / max(float(has_lit_s.sum()), 1)
+            loss_lit_o = torch.sum(has_lit_o * (y_lit_o.view(-1) - y_true_lit_o)**2) / max(float(has_lit_o.sum()), 1)
             loss_lit = loss_lit_s + loss_lit_o
 
             loss_total = loss_er + loss_lit
@@ -10,7 +10,6 @@ import os
 from time import time
 from sklearn.utils import shuffle as skshuffle
 import pdb
-from scipy.sparse import load_npz
 import argparse
 
 
@@ -88,11 +87,8 @@ n_r = len(idx2relation)
 X_train = np.load('data/fb15k-literal/bin/train.npy')
 X_val = np.load('data/fb15k-literal/bin/val.npy')
 
-# Load Numerical Literals
-train_literal_s = load_npz('data/fb15k-literal/bin/train_literal_s.npz').todense().astype(np.float32)
-train_literal_o = load_npz('data/fb15k-literal/bin/train_literal_o.npz').todense().astype(np.float32)
-val_literal_s = load_npz('data/fb15k-literal/bin/val_literal_s.npz').todense().astype(np.float32)
-val_literal_o = load_npz('data/fb15k-literal/bin/val_literal_o.npz').todense().astype(np.float32)
+# Load Numerical Literals, one row per entity
+X_lit = np.load('data/fb15k-literal/bin/numerical_literals.npy').astype(np.float32)
 
 # Load Text Literals
 textliteral_id = np.load('data/fb15k-literal/entity2stringliteral.npy')
@@ -100,67 +96,22 @@ textliteral_reprsn = np.load('data/fb15k-literal/entity_string_literal_reprsn.np
 
 n_text = textliteral_reprsn.shape[1]
 dim_text = textliteral_reprsn.shape[2]
-empty = len(idx2entity)+1
 
+# Entity-level text table built once, zeros for entities without text
+entity2row = {entity: i for i, entity in enumerate(textliteral_id)}
+rows = np.array([entity2row.get(entity, -1) for entity in idx2entity])
 
-def idx2array(textliteral_reprsn, idx):
-    data = [textliteral_reprsn[el] if el < len(idx2entity) else np.zeros((n_text,dim_text)) for el in idx]
-    data = np.array(data, dtype='float32')
-    return data
+text_literals = np.zeros([n_e, n_text, dim_text], dtype=np.float32)
+text_literals[rows >= 0] = textliteral_reprsn[rows[rows >= 0]]
 
-
-# Split Text literals
-train_text_s = []
-train_text_o = []
-
-for triple in X_train:
-    idx_s = np.where(idx2entity[triple[0]] == textliteral_id)[0]
-    idx_o = np.where(idx2entity[triple[2]] == textliteral_id)[0]
-
-    if idx_s:
-        train_text_s.append(idx_s[0])
-    else:
-        train_text_s.append(empty)
-
-    if idx_o:
-        train_text_o.append(idx_o[0])
-    else:
-        train_text_o.append(empty)
-
-train_text_s = np.array(train_text_s)
-train_text_o = np.array(train_text_o)
-
-val_text_s = []
-val_text_o = []
-
-for triple in X_val:
-    idx_s = np.where(idx2entity[triple[0]] == textliteral_id)[0]
-    idx_o = np.where(idx2entity[triple[2]] == textliteral_id)[0]
-
-    if idx_s:
-        val_text_s.append(idx_s[0])
-    else:
-        val_text_s.append(empty)
-
-    if idx_o:
-        val_text_o.append(idx_o[0])
-    else:
-        val_text_o.append(empty)
-
-val_text_s = np.array(val_text_s)
-val_text_o = np.array(val_text_o)
-
-val_text_s = idx2array(textliteral_reprsn, val_text_s)
-val_text_o = idx2array(textliteral_reprsn, val_text_o)
-
-n_numeric = train_literal_s.shape[1]
+n_numeric = X_lit.shape[1]
 M_train = X_train.shape[0]
 M_val = X_val.shape[0]
 
 # Initialize model
 model = ERMLP_literal1(
     n_e, n_r, embedding_size, h_dim, p, embeddings_lambda, n_numeric, n_text,
-    dim_text, numeric=True, text=True, gpu=use_gpu
+    dim_text, text_literals, numeric=True, text=True, gpu=use_gpu
 )
 
 # Training params
@@ -184,7 +135,7 @@ for epoch in range(n_epoch):
     mb_iter = get_minibatches(X_train, mb_size, shuffle=True)
 
     # Anneal learning rate
-    lr = lr * (0.5 ** (epoch // lr_decay_every))
+    lr = args.lr * (0.5 ** (epoch // lr_decay_every))
     for param_group in solver.param_groups:
         param_group['lr'] = lr
 
@@ -195,18 +146,14 @@ for epoch in range(n_epoch):
         m = X_mb.shape[0]
 
         # C x M negative samples
-        X_neg_mb = np.vstack([sample_negatives(X_mb, n_e) for _ in range(C)])\
+        X_neg_mb = np.vstack([sample_negatives(X_mb, n_e) for _ in range(C)])
 
         X_train_mb = np.vstack([X_mb, X_neg_mb])
-        y_true_mb = np.vstack([np.ones([m, 1]), np.zeros([m, 1])])
-        train_literal_s_mb = train_literal_s[X_train_mb[:, 0]]
-        train_literal_o_mb = train_literal_o[X_train_mb[:, 2]]
+        train_literal_s_mb = X_lit[X_train_mb[:, 0]]
+        train_literal_o_mb = X_lit[X_train_mb[:, 2]]
 
-        train_text_s_mb = idx2array(textliteral_reprsn, train_text_s[X_train_mb[:, 0]])
-        train_text_o_mb = idx2array(textliteral_reprsn, train_text_o[X_train_mb[:, 2]])
-
-        # Training step
-        y = model.forward(X_train_mb, train_literal_s_mb, train_literal_o_mb, train_text_s_mb, train_text_o_mb)
+        # Training step, text literals are pooled inside the model
+        y = model.forward(X_train_mb, train_literal_s_mb, train_literal_o_mb)
 
         y_pos, y_neg = y[:m], y[m:]
 
@@ -222,12 +169,15 @@ for epoch in range(n_epoch):
 
         # Training logs
         if it % print_every == 0:
-            n_sample = 100
-            k = 10
-            mr, mrr, hits10 = eval_embeddings(model, X_val, n_e, k, n_sample, val_literal_s, val_literal_o, val_text_s, val_text_o)
+            model.eval()
+
+            # Pooled text of all entities is computed once for the evaluation
+            mr, mrr, hits = eval_embeddings_vertical(model, X_val, n_e, [1, 3, 10], n_sample=100, X_lit=X_lit)
 
             print('Iter-{}; loss: {:.4f}; val_mrr: {:.4f}; val_hits@10: {:.4f}; time per batch: {:.2f}s'
-                  .format(it, loss.data[0], mrr, hits10, end-start))
+                  .format(it, loss.item(), mrr, hits[2], end-start))
+
+            model.train()
 
         it += 1
 
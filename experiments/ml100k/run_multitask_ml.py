@@ -203,9 +203,6 @@ for epoch in range(n_epoch):
             y_true_lit_usr = torch.from_numpy(y_true_lit_usr)
             y_true_lit_mov = torch.from_numpy(y_true_lit_mov)
 
-        y_true_lit_usr = Variable(y_true_lit_usr)
-        y_true_lit_mov = Variable(y_true_lit_mov)
-
         # Training step
         y_er, y_lit_usr, y_lit_mov = model.forward(X_train_mb, usr_attr, mov_attr)
         y_er_pos, y_er_neg = y_er[:m], y_er[m:]
@@ -0,0 +1,95 @@
+import sys
+sys.path.append('.')
+
+from kga.models.base import *
+from kga.models.literals import *
+from kga.quantize import QuantizedModel, accuracy_report
+import numpy as np
+import os
+import torch
+import argparse
+
+
+parser = argparse.ArgumentParser(
+    description='Memory and filtered MRR/Hits@k of fp16/int8 quantized models vs. the fp32 checkpoint'
+)
+
+parser.add_argument('--model', default='distmult', metavar='',
+                    help='model to run: {rescal, distmult, ermlp, transe, distmult_literal, erlmlp} (default: distmult)')
+parser.add_argument('--dataset', default='fb15k-literal', metavar='',
+                    help='dataset to be used (default: fb15k-literal)')
+parser.add_argument('--k', type=int, default=100, metavar='',
+                    help='embedding dim (default: 100)')
+parser.add_argument('--transe_metric', default='l2', metavar='',
+                    help='whether to use `l1` or `l2` metric for TransE (default: l2)')
+parser.add_argument('--checkpoint', required=True, metavar='',
+                    help='fp32 state dict of the model')
+parser.add_argument('--dtypes', default='fp16,int8', metavar='',
+                    help='comma separated storage types to compare (default: fp16,int8)')
+parser.add_argument('--n_sample', type=int, default=None, metavar='',
+                    help='number of test triples, all if not set (default: None)')
+parser.add_argument('--chunk_size', type=int, default=4096, metavar='',
+                    help='entities dequantized at once in all-entity scoring (default: 4096)')
+parser.add_argument('--save', default=False, action='store_true',
+                    help='write the quantized models next to the checkpoint, as <name>.<dtype>.pt (default: False)')
+parser.add_argument('--use_gpu', default=False, action='store_true',
+                    help='whether to run in the GPU (default: False)')
+parser.add_argument('--randseed', default=9999, type=int, metavar='',
+                    help='random seed (default: 9999)')
+
+args = parser.parse_args()
+
+
+def load_bin(name, allow_pickle=False):
+    return np.load('data/{}/bin/{}.npy'.format(args.dataset, name), allow_pickle=allow_pickle)
+
+
+n_e = len(load_bin('idx2ent'))
+n_r = len(load_bin('idx2rel'))
+
+X_test = load_bin('test')
+
+# Filters are object arrays of per-triple lists
+try:
+    filter_s_test = load_bin('filter_s_test', allow_pickle=True)
+    filter_o_test = load_bin('filter_o_test', allow_pickle=True)
+except FileNotFoundError:
+    filter_s_test = None
+    filter_o_test = None
+
+literals = {}
+
+if args.model in ('distmult_literal', 'erlmlp'):
+    literals['X_lit'] = load_bin('numerical_literals').astype(np.float32)
+    n_l = literals['X_lit'].shape[1]
+
+models = {
+    'rescal': lambda: RESCAL(n_e=n_e, n_r=n_r, k=args.k, lam=0, gpu=args.use_gpu),
+    'distmult': lambda: DistMult(n_e=n_e, n_r=n_r, k=args.k, lam=0, gpu=args.use_gpu),
+    'ermlp': lambda: ERMLP(n_e=n_e, n_r=n_r, k=args.k, h_dim=100, p=0, lam=0, gpu=args.use_gpu),
+    'transe': lambda: TransE(n_e=n_e, n_r=n_r, k=args.k, gamma=1, d=args.transe_metric, gpu=args.use_gpu),
+    'distmult_literal': lambda: DistMultLiteral(n_e=n_e, n_r=n_r, n_l=n_l, k=args.k, gpu=args.use_gpu),
+    'erlmlp': lambda: ERLMLP(n_ent=n_e, n_rel=n_r, n_lit=n_l, k=args.k, h_dim=100, gpu=args.use_gpu,
+                             num_lit=True)
+}
+
+model = models[args.model]()
+model.load_state_dict(torch.load(args.checkpoint, map_location=lambda storage, loc: storage))
+model.eval()
+
+qmodels = {}
+
+for dtype in args.dtypes.split(','):
+    qmodels[dtype] = QuantizedModel.from_model(
+        model, dtype, literals, chunk_size=args.chunk_size, gpu=args.use_gpu
+    )
+
+    if args.save:
+        path = '{}.{}.pt'.format(os.path.splitext(args.checkpoint)[0], dtype)
+        qmodels[dtype].save(path)
+        print('Saved {}'.format(path))
+
+print(accuracy_report(
+    model, qmodels, X_test, n_e, filter_s_test, filter_o_test, k=[1, 3, 10],
+    descending=args.model != 'transe', n_sample=args.n_sample, literals=literals, randseed=args.randseed
+))
@@ -4,6 +4,10 @@ sys.path.append('.')
 from kga.models.base import *
 from kga.metrics import *
 from kga.util import *
+from kga.hogwild import HogwildTrainer
+from kga.checkpoint import CheckpointManager
+from kga.data import Dataset
+from kga.async_eval import AsyncEvaluator, vertical_eval, format_result
 import numpy as np
 import torch.optim
 import argparse
@@ -52,12 +56,30 @@ parser.add_argument('--normalize_embed', default=False, type=bool, metavar='',
                     help='whether to normalize embeddings to unit euclidean ball (default: False)')
 parser.add_argument('--log_interval', type=int, default=100, metavar='',
                     help='interval between training status logs (default: 100)')
+parser.add_argument('--async_eval', default=False, action='store_true',
+                    help='evaluate on the validation set in a separate process instead of inline (default: False)')
+parser.add_argument('--patience', type=int, default=-1, metavar='',
+                    help='with --async_eval, stop after n evaluations without val MRR improvement, -1 to never stop (default: -1)')
 parser.add_argument('--checkpoint_dir', default='models/', metavar='',
                     help='directory to save model checkpoint, saved every epoch (default: models/)')
 parser.add_argument('--use_gpu', default=False, action='store_true',
                     help='whether to run in the GPU')
+parser.add_argument('--loss', default='margin', metavar='',
+                    help='loss of positive vs. negative scores: {margin, logistic} (default: margin)')
+parser.add_argument('--adversarial_temperature', type=float, default=None, metavar='',
+                    help='self-adversarial weighting of the negatives, e.g. 1.0; none if not given')
+parser.add_argument('--sampler', default='uniform', metavar='',
+                    help='negative sampler: {uniform, bern, bern_freq, nscaching} (default: uniform)')
+parser.add_argument('--n_workers', type=int, default=0, metavar='',
+                    help='number of Hogwild worker processes, 0 to train in a single process (default: 0)')
 parser.add_argument('--randseed', default=9999, type=int, metavar='',
-                    help='resume the training from latest checkpoint (default: False')
+                    help='random seed (default: 9999)')
+parser.add_argument('--bundle', default=False, action='store_true',
+                    help='load data/<dataset>/bin/bundle.kgb of build_bundle.py instead of the separate files')
+parser.add_argument('--resume', default=False, action='store_true',
+                    help='resume the training from latest checkpoint')
+parser.add_argument('--keep_best', type=int, default=3, metavar='',
+                    help='number of best checkpoints by val MRR to keep (default: 3)')
 parser.add_argument('--test', default=False, action='store_true',
                     help='Activate test mode: gather results on test set only with trained model.')
 parser.add_argument('--test_model', default=None, metavar='',
@@ -65,6 +87,13 @@ parser.add_argument('--test_model', default=None, metavar='',
 
 args = parser.parse_args()
 
+# Hogwild workers keep their optimizer states in their own processes, and
+# evaluate after every epoch in the parent
+if args.n_workers > 0 and args.resume:
+    parser.error('--resume is not supported with --n_workers')
+if args.n_workers > 0 and args.async_eval:
+    parser.error('--async_eval is not supported with --n_workers')
+
 
 # Set random seed
 np.random.seed(args.randseed)
@@ -74,16 +103,25 @@ if args.use_gpu:
     torch.cuda.manual_seed(args.randseed)
 
 
+# Memory-mapped arrays of the bundle, read on first access
+ds = Dataset('data/{}/bin/bundle.kgb'.format(args.dataset)) if args.bundle else None
+
 # Load dictionary lookups
-idx2ent = np.load('data/{}/bin/idx2ent.npy'.format(args.dataset))
-idx2rel = np.load('data/{}/bin/idx2rel.npy'.format(args.dataset))
+if ds is not None:
+    idx2ent, idx2rel = ds.idx2ent, ds.idx2rel
+else:
+    idx2ent = np.load('data/{}/bin/idx2ent.npy'.format(args.dataset))
+    idx2rel = np.load('data/{}/bin/idx2rel.npy'.format(args.dataset))
 
 n_e = len(idx2ent)
 n_r = len(idx2rel)
 
 # Load dataset
-X_train = np.load('data/{}/bin/train.npy'.format(args.dataset))
-X_val = np.load('data/{}/bin/val.npy'.format(args.dataset))
+if ds is not None:
+    X_train, X_val = ds.train, ds.val
+else:
+    X_train = np.load('data/{}/bin/train.npy'.format(args.dataset))
+    X_val = np.load('data/{}/bin/val.npy'.format(args.dataset))
 
 M_train = X_train.shape[0]
 M_val = X_val.shape[0]
@@ -103,31 +141,42 @@ models = {
 
 model = models[args.model]
 
+# Per-relation statistics and negative caches are built once, up front
+sampler_kwargs = {'refresh_every': C, 'energy_based': args.model == 'transe'} if args.sampler == 'nscaching' else {}
+sampler = make_sampler(args.sampler, X_train, n_e, n_r, model=model, **sampler_kwargs)
+
 # Training params
 solver = torch.optim.Adam(model.parameters(), lr=lr, weight_decay=wd)
 n_epoch = args.nepoch
 mb_size = args.mbsize  # 2x with negative sampling
 print_every = args.log_interval
 checkpoint_dir = '{}/{}'.format(args.checkpoint_dir.rstrip('/'), args.dataset)
-checkpoint_path = '{}/{}_lr{}_wd{}.bin'.format(checkpoint_dir, args.model, lr, wd)
+checkpoint_name = '{}_lr{}_wd{}'.format(args.model, lr, wd)
 
 if not os.path.exists(checkpoint_dir):
     os.makedirs(checkpoint_dir)
 
+checkpoints = CheckpointManager(checkpoint_dir, checkpoint_name, keep_best=args.keep_best)
+
 
 """
 Test mode: Evaluate trained model on test set
 =============================================
 """
 if args.test:
-    X_test = np.load('data/{}/bin/test.npy'.format(args.dataset))
-
-    try:
-        filter_s_test = np.load('data/{}/bin/filter_s_test.npy'.format(args.dataset))
-        filter_o_test = np.load('data/{}/bin/filter_o_test.npy'.format(args.dataset))
-    except:
-        filter_s_test = None
-        filter_o_test = None
+    if ds is not None:
+        X_test = ds.test
+        filter_s_test = ds.get('filter_s_test')
+        filter_o_test = ds.get('filter_o_test')
+    else:
+        X_test = np.load('data/{}/bin/test.npy'.format(args.dataset))
+
+        try:
+            filter_s_test = np.load('data/{}/bin/filter_s_test.npy'.format(args.dataset))
+            filter_o_test = np.load('data/{}/bin/filter_o_test.npy'.format(args.dataset))
+        except:
+            filter_s_test = None
+            filter_o_test = None
 
     model_name = '{}/{}.bin'.format(checkpoint_dir, args.test_model)
     state = torch.load(model_name, map_location=lambda storage, loc: storage)
@@ -139,7 +188,8 @@ if args.test:
 
     # Use entire test set
     mr, mrr, hits = eval_embeddings_vertical(
-        model, X_test, n_e, hits_ks, filter_s_test, filter_o_test, n_sample=None
+        model, X_test, n_e, hits_ks, filter_s_test, filter_o_test,
+        descending=args.model != 'transe', n_sample=None
     )
 
     hits1, hits3, hits10 = hits
@@ -155,12 +205,66 @@ if args.test:
 Train mode: Train model from scratch
 ====================================
 """
+if args.n_workers > 0:
+    def eval_fn(model, epoch):
+        lr_epoch = lr * (0.5 ** (epoch // args.lr_decay_every))
+
+        if args.log_interval == -1:
+            checkpoints.save(model, [], epoch, lr=lr_epoch)
+            return None
+
+        hits_ks = [1, 3, 10]
+
+        mr, mrr, hits = eval_embeddings_vertical(
+            model, X_val, n_e, hits_ks, descending=args.model != 'transe', n_sample=500
+        )
+
+        hits1, hits3, hits10 = hits
+
+        print('Epoch-{}; val_mr: {:.4f}; val_mrr: {:.4f}; val_hits@1: {:.4f}; val_hits@3: {:.4f}; val_hits@10: {:.4f}'
+              .format(epoch+1, mr, mrr, hits1, hits3, hits10))
+
+        # Model only, the optimizer states live in the workers
+        checkpoints.save(model, [], epoch, lr=lr_epoch, val_mrr=mrr)
+
+        return mrr
+
+    trainer = HogwildTrainer(
+        model, X_train, n_e, args.n_workers, mb_size=mb_size, C=C, lr=lr,
+        lr_decay_every=args.lr_decay_every, weight_decay=wd,
+        margin=args.transe_gamma, average_loss=args.average_loss, loss=args.loss,
+        energy_based=args.model == 'transe', adversarial_temperature=args.adversarial_temperature,
+        normalize_embed=args.normalize_embed, sampler=sampler, randseed=args.randseed
+    )
+    trainer.train(n_epoch, eval_fn=eval_fn)
+
+    checkpoints.wait()
+
+    # Quit immediately
+    exit(0)
+
+start_epoch = 0
+
+if args.resume:
+    start_epoch = checkpoints.resume(model, [solver])
+    print('Resuming from epoch {}'.format(start_epoch+1))
+
+evaluator = None
+
+if args.async_eval and args.log_interval != -1:
+    evaluator = AsyncEvaluator(
+        model, vertical_eval(X_val, n_e, descending=args.model != 'transe', n_sample=500),
+        patience=args.patience if args.patience != -1 else None,
+        best_path='{}/{}.best.bin'.format(checkpoint_dir, checkpoint_name)
+    )
+
 # Begin training
-for epoch in range(n_epoch):
+for epoch in range(start_epoch, n_epoch):
     print('Epoch-{}'.format(epoch+1))
     print('----------------')
 
     it = 0
+    val_mrr = None
 
     # Shuffle and chunk data into minibatches
     mb_iter = get_minibatches(X_train, mb_size, shuffle=True)
@@ -177,7 +281,7 @@ for epoch in range(n_epoch):
         m = X_mb.shape[0]
 
         # C x M negative samples
-        X_neg_mb = np.vstack([sample_negatives(X_mb, n_e) for _ in range(C)])
+        X_neg_mb = np.vstack([sampler(X_mb) for _ in range(C)])
 
         X_train_mb = np.vstack([X_mb, X_neg_mb])
         y_true_mb = np.vstack([np.ones([m, 1]), np.zeros([m, 1])])
@@ -187,8 +291,10 @@ for epoch in range(n_epoch):
 
         y_pos, y_neg = y[:m], y[m:]
 
-        loss = model.ranking_loss(
-            y_pos, y_neg, margin=args.transe_gamma, C=C, average=args.average_loss
+        loss = model.negative_loss(
+            args.loss, y_pos, y_neg, margin=args.transe_gamma, C=C,
+            energy_based=args.model == 'transe', average=args.average_loss,
+            adversarial_temperature=args.adversarial_temperature
         )
 
         loss.backward()
@@ -201,25 +307,64 @@ for epoch in range(n_epoch):
         end = time()
 
         # Training logs
-        if args.log_interval != -1 and it % print_every == 0:
+        if args.log_interval != -1 and it % print_every == 0 and evaluator is not None:
+            # Snapshot only, evaluated while training goes on
+            evaluator.publish('{}-{}'.format(epoch+1, it))
+
+            print('Iter-{}; loss: {:.4f}; time per batch: {:.2f}s'
+                  .format(it, loss.item(), end-start))
+        elif args.log_interval != -1 and it % print_every == 0:
             model.eval()
 
             hits_ks = [1, 3, 10]
 
             # Only use 100 samples of X_val
-            mr, mrr, hits = eval_embeddings_vertical(model, X_val, n_e, hits_ks, n_sample=500)
+            mr, mrr, hits = eval_embeddings_vertical(
+                model, X_val, n_e, hits_ks, descending=args.model != 'transe', n_sample=500
+            )
 
             hits1, hits3, hits10 = hits
+            val_mrr = mrr
 
             # For TransE, show loss, mrr & hits@10
             print('Iter-{}; loss: {:.4f}; val_mr: {:.4f}; val_mrr: {:.4f}; val_hits@1: {:.4f}; val_hits@3: {:.4f}; val_hits@10: {:.4f}; time per batch: {:.2f}s'
-                    .format(it, loss.data[0], mr, mrr, hits1, hits3, hits10, end-start))
+                    .format(it, loss.item(), mr, mrr, hits1, hits3, hits10, end-start))
 
             model.train()
 
+        if evaluator is not None:
+            for result in evaluator.poll():
+                print(format_result(result))
+
+            if evaluator.should_stop:
+                break
+
         it += 1
 
+    # Amortized cost of the negative cache refreshes
+    if hasattr(sampler, 'report'):
+        print(sampler.report())
+
     print()
 
-    # Checkpoint every epoch
-    torch.save(model.state_dict(), checkpoint_path)
+    # The latest evaluated snapshot; the exact best one is written by the
+    # evaluator to {name}.best.bin
+    if evaluator is not None:
+        val_mrr = evaluator.latest
+
+    # Checkpoint every epoch, ranked by the last val MRR of the epoch
+    checkpoints.save(model, [solver], epoch, it, lr, val_mrr=val_mrr)
+
+    if evaluator is not None and evaluator.should_stop:
+        print('Early stopping: no val MRR improvement in {} evaluations'.format(args.patience))
+        break
+
+checkpoints.wait()
+
+if evaluator is not None:
+    for result in evaluator.close():
+        print(format_result(result))
+
+    if evaluator.best is not None:
+        print('Best val_mrr: {:.4f} at {}'.format(evaluator.best, evaluator.best_step))
+
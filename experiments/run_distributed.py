@@ -0,0 +1,132 @@
+import sys
+sys.path.append('.')
+
+from kga.models.base import *
+from kga.metrics import *
+from kga.util import *
+from kga.distributed import init_process, DistributedTrainer
+import numpy as np
+import torch.multiprocessing as mp
+import argparse
+import os
+
+
+parser = argparse.ArgumentParser(
+    description='Data-parallel training of baselines over torch.distributed (gloo)'
+)
+
+parser.add_argument('--model', default='ermlp', metavar='',
+                    help='model to run: {rescal, distmult, ermlp, transe} (default: ermlp)')
+parser.add_argument('--dataset', default='fb15k', metavar='',
+                    help='dataset to be used: {wordnet, fb15k} (default: fb15k)')
+parser.add_argument('--k', type=int, default=100, metavar='',
+                    help='embedding dim (default: 100)')
+parser.add_argument('--transe_gamma', type=float, default=1, metavar='',
+                    help='TransE loss margin (default: 1)')
+parser.add_argument('--mlp_h', type=int, default=100, metavar='',
+                    help='size of ER-MLP hidden layer (default: 100)')
+parser.add_argument('--mlp_dropout_p', type=float, default=0, metavar='',
+                    help='Probability of dropping out neuron in dropout (default: 0)')
+parser.add_argument('--mbsize', type=int, default=100, metavar='',
+                    help='size of minibatch per rank (default: 100)')
+parser.add_argument('--negative_samples', type=int, default=10, metavar='',
+                    help='number of negative samples per positive sample  (default: 10)')
+parser.add_argument('--nepoch', type=int, default=5, metavar='',
+                    help='number of training epoch (default: 5)')
+parser.add_argument('--average_loss', default=False, action='store_true',
+                    help='whether to average or sum the loss over minibatch')
+parser.add_argument('--lr', type=float, default=0.001, metavar='',
+                    help='learning rate (default: 0.001)')
+parser.add_argument('--lr_decay_every', type=int, default=10, metavar='',
+                    help='decaying learning rate every n epoch (default: 10)')
+parser.add_argument('--weight_decay', type=float, default=1e-4, metavar='',
+                    help='L2 weight decay of the dense weights (default: 1e-4)')
+parser.add_argument('--embeddings_lambda', type=float, default=1e-2, metavar='',
+                    help='prior strength for embeddings (default: 1e-2)')
+parser.add_argument('--log_interval', type=int, default=100, metavar='',
+                    help='evaluate on validation set after every epoch unless -1 (default: 100)')
+parser.add_argument('--checkpoint_dir', default='models/', metavar='',
+                    help='directory to save model checkpoint, saved every epoch by rank 0 (default: models/)')
+parser.add_argument('--randseed', default=9999, type=int, metavar='',
+                    help='random seed (default: 9999)')
+parser.add_argument('--rank', type=int, default=int(os.environ.get('RANK', 0)), metavar='',
+                    help='rank of this process (default: $RANK or 0)')
+parser.add_argument('--world_size', type=int, default=int(os.environ.get('WORLD_SIZE', 1)), metavar='',
+                    help='total number of ranks (default: $WORLD_SIZE or 1)')
+parser.add_argument('--master_addr', default=os.environ.get('MASTER_ADDR', '127.0.0.1'), metavar='',
+                    help='address of rank 0 (default: $MASTER_ADDR or 127.0.0.1)')
+parser.add_argument('--master_port', type=int, default=int(os.environ.get('MASTER_PORT', 29500)), metavar='',
+                    help='port of rank 0 (default: $MASTER_PORT or 29500)')
+parser.add_argument('--local_ranks', type=int, default=0, metavar='',
+                    help='spawn this many ranks on the local machine, ignoring --rank/--world_size (default: 0)')
+
+args = parser.parse_args()
+
+
+def run(rank, world_size):
+    init_process(rank, world_size, args.master_addr, args.master_port)
+
+    # Same initialization everywhere, rank 0 broadcasts it anyway
+    np.random.seed(args.randseed)
+    torch.manual_seed(args.randseed)
+
+    # Load dictionary lookups
+    idx2ent = np.load('data/{}/bin/idx2ent.npy'.format(args.dataset))
+    idx2rel = np.load('data/{}/bin/idx2rel.npy'.format(args.dataset))
+
+    n_e = len(idx2ent)
+    n_r = len(idx2rel)
+
+    # Load dataset
+    X_train = np.load('data/{}/bin/train.npy'.format(args.dataset))
+    X_val = np.load('data/{}/bin/val.npy'.format(args.dataset))
+
+    lr = args.lr
+    wd = args.weight_decay
+    lam = args.embeddings_lambda
+
+    models = {
+        'rescal': lambda: RESCAL(n_e=n_e, n_r=n_r, k=args.k, lam=lam),
+        'distmult': lambda: DistMult(n_e=n_e, n_r=n_r, k=args.k, lam=lam),
+        'ermlp': lambda: ERMLP(n_e=n_e, n_r=n_r, k=args.k, h_dim=args.mlp_h, p=args.mlp_dropout_p, lam=lam),
+        'transe': lambda: TransE(n_e=n_e, n_r=n_r, k=args.k, gamma=args.transe_gamma)
+    }
+
+    model = models[args.model]()
+
+    # Same naming as run_baselines.py, so that its --test mode can be used
+    checkpoint_dir = '{}/{}'.format(args.checkpoint_dir.rstrip('/'), args.dataset)
+    checkpoint_path = '{}/{}_lr{}_wd{}.bin'.format(checkpoint_dir, args.model, lr, wd)
+
+    if rank == 0 and not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+
+    def eval_fn(model, epoch):
+        if args.log_interval == -1:
+            return
+
+        hits_ks = [1, 3, 10]
+
+        mr, mrr, hits = eval_embeddings_vertical(
+            model, X_val, n_e, hits_ks, descending=args.model != 'transe', n_sample=500
+        )
+
+        hits1, hits3, hits10 = hits
+
+        print('Epoch-{}; val_mr: {:.4f}; val_mrr: {:.4f}; val_hits@1: {:.4f}; val_hits@3: {:.4f}; val_hits@10: {:.4f}'
+              .format(epoch+1, mr, mrr, hits1, hits3, hits10))
+
+    trainer = DistributedTrainer(
+        model, X_train, n_e, rank, world_size, mb_size=args.mbsize,
+        C=args.negative_samples, lr=lr, lr_decay_every=args.lr_decay_every,
+        weight_decay=wd, margin=args.transe_gamma, energy_based=args.model == 'transe',
+        average_loss=args.average_loss, randseed=args.randseed
+    )
+    trainer.train(args.nepoch, checkpoint_path=checkpoint_path, eval_fn=eval_fn)
+
+
+if __name__ == '__main__':
+    if args.local_ranks > 0:
+        mp.spawn(run, args=(args.local_ranks,), nprocs=args.local_ranks)
+    else:
+        run(args.rank, args.world_size)
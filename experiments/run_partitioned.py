@@ -0,0 +1,124 @@
+import sys
+sys.path.append('.')
+
+from kga.models.base import *
+from kga.models.literals import DistMultLiteral
+from kga.metrics import *
+from kga.util import *
+from kga.partition import PartitionedEmbeddingStore, PartitionedTrainer, PartitionedScorer, bucket_triples
+import numpy as np
+import argparse
+import os
+
+
+parser = argparse.ArgumentParser(
+    description='Out-of-core training with partitioned entity embeddings'
+)
+
+parser.add_argument('--model', default='distmult', metavar='',
+                    help='model to run: {distmult, transe, distmult_lit} (default: distmult)')
+parser.add_argument('--dataset', default='fb15k', metavar='',
+                    help='dataset to be used: {wordnet, fb15k} (default: fb15k)')
+parser.add_argument('--k', type=int, default=100, metavar='',
+                    help='embedding dim (default: 100)')
+parser.add_argument('--n_parts', type=int, default=4, metavar='',
+                    help='number of entity partitions (default: 4)')
+parser.add_argument('--store_dir', default='models/partitioned/', metavar='',
+                    help='directory of the partitioned embeddings and triple shards (default: models/partitioned/)')
+parser.add_argument('--transe_gamma', type=float, default=1, metavar='',
+                    help='TransE loss margin (default: 1)')
+parser.add_argument('--mbsize', type=int, default=100, metavar='',
+                    help='size of minibatch (default: 100)')
+parser.add_argument('--negative_samples', type=int, default=10, metavar='',
+                    help='number of negative samples per positive sample  (default: 10)')
+parser.add_argument('--nepoch', type=int, default=5, metavar='',
+                    help='number of training epoch (default: 5)')
+parser.add_argument('--average_loss', default=False, action='store_true',
+                    help='whether to average or sum the loss over minibatch')
+parser.add_argument('--lr', type=float, default=0.1, metavar='',
+                    help='learning rate (default: 0.1)')
+parser.add_argument('--weight_decay', type=float, default=0, metavar='',
+                    help='L2 weight decay of the in-memory weights (default: 0)')
+parser.add_argument('--n_sample', type=int, default=500, metavar='',
+                    help='number of validation triples evaluated after every epoch (default: 500)')
+parser.add_argument('--resume', default=False, action='store_true',
+                    help='continue from the existing store instead of re-initializing it')
+parser.add_argument('--randseed', default=9999, type=int, metavar='',
+                    help='random seed (default: 9999)')
+
+args = parser.parse_args()
+
+
+# Set random seed
+np.random.seed(args.randseed)
+torch.manual_seed(args.randseed)
+
+# Load dictionary lookups, memory-mapped as they may be large
+idx2ent = np.load('data/{}/bin/idx2ent.npy'.format(args.dataset), mmap_mode='r')
+idx2rel = np.load('data/{}/bin/idx2rel.npy'.format(args.dataset))
+
+n_e = len(idx2ent)
+n_r = len(idx2rel)
+
+X_train = np.load('data/{}/bin/train.npy'.format(args.dataset), mmap_mode='r')
+X_val = np.load('data/{}/bin/val.npy'.format(args.dataset))
+
+X_lit = None
+forward_fn = None
+
+if args.model == 'distmult_lit':
+    X_lit = np.load('data/{}/bin/numerical_literals.npy'.format(args.dataset), mmap_mode='r')
+
+    def forward_fn(model, X, X_global):
+        s_lit = np.asarray(X_lit[X_global[:, 0]], dtype=np.float32)
+        o_lit = np.asarray(X_lit[X_global[:, 2]], dtype=np.float32)
+        return model.forward(X, s_lit, o_lit)
+
+# The entity table of the model is replaced by the store, keep it tiny
+models = {
+    'distmult': lambda: DistMult(n_e=1, n_r=n_r, k=args.k, lam=0),
+    'transe': lambda: TransE(n_e=1, n_r=n_r, k=args.k, gamma=args.transe_gamma),
+    'distmult_lit': lambda: DistMultLiteral(n_e=1, n_r=n_r, n_l=0 if X_lit is None else X_lit.shape[1], k=args.k)
+}
+
+model = models[args.model]()
+
+store_dir = '{}/{}/{}'.format(args.store_dir.rstrip('/'), args.dataset, args.model)
+shard_dir = '{}/shards'.format(store_dir)
+
+if args.resume:
+    store = PartitionedEmbeddingStore(store_dir)
+else:
+    store = PartitionedEmbeddingStore.create(store_dir, n_e, args.k, args.n_parts, args.randseed)
+
+if not os.path.exists(shard_dir):
+    counts = bucket_triples(X_train, store, shard_dir)
+    print('Shard sizes: min {}; max {}'.format(counts.min(), counts.max()))
+
+trainer = PartitionedTrainer(
+    model, store, shard_dir, mb_size=args.mbsize, C=args.negative_samples,
+    lr=args.lr, weight_decay=args.weight_decay, margin=args.transe_gamma,
+    energy_based=args.model == 'transe', average_loss=args.average_loss,
+    forward_fn=forward_fn
+)
+
+scorer = PartitionedScorer(model, store, X_lit=X_lit)
+
+for epoch in range(args.nepoch):
+    print('Epoch-{}'.format(epoch+1))
+    print('----------------')
+
+    model.train()
+    trainer.train_epoch()
+
+    model.eval()
+    mr, mrr, hits = eval_embeddings_vertical(
+        scorer, X_val, n_e, [1, 3, 10], n_sample=args.n_sample,
+        descending=args.model != 'transe'
+    )
+
+    print('val_mr: {:.4f}; val_mrr: {:.4f}; val_hits@1: {:.4f}; val_hits@3: {:.4f}; val_hits@10: {:.4f}'
+          .format(mr, mrr, *hits))
+
+# Relation embeddings and dense weights, the entities live in the store
+torch.save(model.state_dict(), '{}/model.bin'.format(store_dir))
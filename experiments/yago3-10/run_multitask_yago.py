@@ -208,9 +208,6 @@ for epoch in range(n_epoch):
             y_true_lit_s = torch.from_numpy(y_true_lit_s)
             y_true_lit_o = torch.from_numpy(y_true_lit_o)
 
-        y_true_lit_s = Variable(y_true_lit_s)
-        y_true_lit_o = Variable(y_true_lit_o)
-
         # Training step
         y_er, y_lit_s, y_lit_o = model.forward(X_train_mb, s_attr, o_attr)
         y_er_pos, y_er_neg = y_er[:m], y_er[m:]
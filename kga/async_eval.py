@@ -0,0 +1,317 @@
+import copy
+import os
+import queue
+import traceback
+import torch
+import torch.multiprocessing as mp
+from time import time
+
+from kga.metrics import eval_embeddings_vertical
+
+
+def vertical_eval(X_val, n_e, filter_h=None, filter_t=None, k=[1, 3, 10], descending=True, n_sample=500, **kwargs):
+    """
+    Evaluation function of `AsyncEvaluator`: filtered `eval_embeddings_vertical`
+    on X_val, kwargs are passed to it, e.g. X_lit for the literal models.
+    descending=False for energies, e.g. TransE; the metrics keep their
+    direction, MRR is higher is better either way.
+
+    Returns:
+    --------
+    eval_fn: function (model) -> dict of 'mr', 'mrr' and 'hits@k'
+    """
+    def eval_fn(model):
+        mr, mrr, hits = eval_embeddings_vertical(
+            model, X_val, n_e, k, filter_h, filter_t, descending=descending, n_sample=n_sample, **kwargs
+        )
+        metrics = {'mr': mr, 'mrr': mrr}
+        metrics.update(('hits@{}'.format(r), h) for r, h in zip(k, hits))
+        return metrics
+
+    return eval_fn
+
+
+def format_result(result):
+    """
+    One log line of an evaluation result of `AsyncEvaluator.poll`.
+    """
+    return 'Eval {}; {}; eval time: {:.2f}s{}'.format(
+        result['step'], '; '.join('val_{}: {:.4f}'.format(k, v) for k, v in result['metrics'].items()),
+        result['time'], ' (best)' if result['best'] else ''
+    )
+
+
+def _improved(value, best, higher_is_better):
+    if best is None:
+        return True
+    return value > best if higher_is_better else value < best
+
+
+def _save_state(model, path):
+    tmp = '{}.tmp'.format(path)
+    torch.save(model.state_dict(), tmp)
+    os.replace(tmp, path)
+
+
+def _worker(slots, locks, tags, requests, results, eval_fn, metric, higher_is_better, best_path, n_threads):
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+
+    best = None
+    done = False
+
+    while not done:
+        request = requests.get()
+        if request is None:
+            break
+
+        # Latest snapshot wins: requests queued meanwhile are stale
+        while True:
+            try:
+                newer = requests.get_nowait()
+            except queue.Empty:
+                break
+            if newer is None:
+                done = True
+                break
+            request = newer
+
+        slot, tag, info = request
+
+        with locks[slot]:
+            # Overwritten since, a newer request for it is queued
+            if tags[slot].value != tag:
+                continue
+
+            # The models drop their eval-mode caches, e.g. the text
+            # encodings of ERMLP_literal2, in train(): the ones of this
+            # process were computed from the previous snapshot
+            slots[slot].eval()
+
+            start = time()
+            try:
+                metrics = eval_fn(slots[slot])
+            except Exception:
+                results.put({'tag': tag, 'error': traceback.format_exc()})
+                return
+
+            improved = _improved(metrics[metric], best, higher_is_better)
+            if improved:
+                best = metrics[metric]
+                if best_path is not None:
+                    _save_state(slots[slot], best_path)
+
+        results.put(dict(info, tag=tag, metrics=metrics, best=improved, time=time() - start))
+
+
+class AsyncEvaluator(object):
+    """
+    Validation of parameter snapshots in a separate process, so that the
+    training loop never waits for an evaluation.
+
+    `publish` copies the parameters into one of two snapshot models in
+    shared memory and queues it, the evaluator process scores it with
+    `eval_fn` and reports back through a queue, read without blocking by
+    `poll`. The process holds the lock of the snapshot it evaluates; the
+    trainer writes the other one, so publishing is a plain memory copy.
+    Snapshots published while the evaluator is busy replace each other:
+    only the latest one is evaluated.
+
+    The best snapshot by `metric` is written by the evaluator to `best_path`,
+    and `should_stop` implements early stopping after `patience` reported
+    evaluations without improvement.
+
+    The process is forked and evaluates on the CPU, so that closures, e.g.
+    over the validation set and literals, need not be picklable.
+
+    Example usage:
+    --------------
+    evaluator = AsyncEvaluator(model, vertical_eval(X_val, n_e, filter_s_val, filter_o_val),
+                               best_path='models/fb15k/distmult.best.bin', patience=5)
+
+    for it, X_mb in enumerate(mb_iter):
+        ...
+        if it % log_interval == 0:
+            evaluator.publish(it, loss=loss.item())
+
+        for res in evaluator.poll():
+            print(res['step'], res['metrics'])
+
+        if evaluator.should_stop:
+            break
+
+    evaluator.close()
+    """
+
+    def __init__(self, model, eval_fn, metric='mrr', higher_is_better=None, patience=None, best_path=None,
+                 n_threads=None, context='fork'):
+        """
+        Params:
+        -------
+        model: kga.models.base.Model
+            Model being trained.
+
+        eval_fn: function (model) -> dict
+            Metrics of a snapshot, e.g. `vertical_eval(...)`.
+
+        metric: string, default: 'mrr'
+            Key of the metric to optimize, for best_path and patience.
+
+        higher_is_better: bool, default: None
+            Direction of `metric`. None to infer it: only 'mr' is lower is
+            better.
+
+        patience: int, default: None
+            Number of reported evaluations without improvement after which
+            `should_stop` is set. None to never stop.
+
+        best_path: string, default: None
+            Where to write the state dict of the best snapshot.
+
+        n_threads: int, default: None
+            torch threads of the evaluator process.
+
+        context: string, default: 'fork'
+            torch.multiprocessing start method.
+        """
+        self.metric = metric
+        self.higher_is_better = metric != 'mr' if higher_is_better is None else higher_is_better
+        self.patience = patience
+        self.best = None
+        self.best_step = None
+        self.latest = None
+        self.n_bad = 0
+        self.n_published = 0
+        self.n_skipped = 0
+
+        ctx = mp.get_context(context)
+
+        # Two CPU snapshots in shared memory
+        self.slots = []
+        for _ in range(2):
+            snapshot = copy.deepcopy(model).cpu()
+            snapshot.gpu = False
+            snapshot.eval()
+            snapshot.share_memory()
+            self.slots.append(snapshot)
+
+        self.locks = [ctx.Lock() for _ in self.slots]
+        self.tags = [ctx.Value('q', -1) for _ in self.slots]
+        self.requests = ctx.Queue()
+        self.results = ctx.Queue()
+
+        self.process = ctx.Process(
+            target=_worker,
+            args=(self.slots, self.locks, self.tags, self.requests, self.results,
+                  eval_fn, metric, self.higher_is_better, best_path, n_threads)
+        )
+        self.process.daemon = True
+        self.process.start()
+
+        self.model = model
+
+    def publish(self, tag=None, **info):
+        """
+        Queue a snapshot of the current parameters for evaluation. `tag`, e.g.
+        the iteration, and `info` are returned with its result.
+
+        Returns:
+        --------
+        published: bool
+            False if both snapshots were locked, which can only happen while
+            another thread publishes.
+        """
+        for i in sorted(range(len(self.slots)), key=lambda i: self.tags[i].value):
+            if not self.locks[i].acquire(False):
+                continue
+
+            try:
+                # Copies in place, into the shared memory
+                self.slots[i].load_state_dict(self.model.state_dict())
+
+                seq = self.n_published
+                self.tags[i].value = seq
+            finally:
+                self.locks[i].release()
+
+            self.n_published += 1
+            self.requests.put((i, seq, dict(info, step=tag)))
+
+            return True
+
+        self.n_skipped += 1
+        return False
+
+    def _check_alive(self):
+        if not self.process.is_alive() and self.process.exitcode not in (0, None):
+            raise RuntimeError('Evaluator process died with exit code {}'.format(self.process.exitcode))
+
+    def _update(self, result):
+        if 'error' in result:
+            raise RuntimeError('Evaluation failed:\n{}'.format(result['error']))
+
+        self.latest = result['metrics'][self.metric]
+
+        if _improved(self.latest, self.best, self.higher_is_better):
+            self.best = self.latest
+            self.best_step = result['step']
+            self.n_bad = 0
+        else:
+            self.n_bad += 1
+
+        return result
+
+    def poll(self):
+        """
+        Results evaluated since the last poll, without blocking. Each result
+        is a dict with 'step' (the published tag), 'metrics', 'best' (whether
+        it improved `metric`), 'time' and the published info.
+        """
+        results = []
+
+        while True:
+            try:
+                results.append(self._update(self.results.get_nowait()))
+            except queue.Empty:
+                break
+
+        if not results:
+            self._check_alive()
+
+        return results
+
+    @property
+    def should_stop(self):
+        return self.patience is not None and self.n_bad >= self.patience
+
+    def close(self, wait=True):
+        """
+        Stop the evaluator. With wait, the latest published snapshot is
+        evaluated first.
+
+        Returns:
+        --------
+        results: list of dict
+            Results not polled yet.
+        """
+        if not wait:
+            self.process.terminate()
+            self.process.join()
+            return []
+
+        self.requests.put(None)
+
+        # Drain while waiting, the process only exits once its results are
+        # flushed to the queue
+        results = []
+
+        while True:
+            try:
+                results.append(self._update(self.results.get(timeout=0.1)))
+            except queue.Empty:
+                if not self.process.is_alive():
+                    break
+
+        self.process.join()
+
+        return results + self.poll()
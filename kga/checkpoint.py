@@ -0,0 +1,242 @@
+import json
+import numpy as np
+import os
+import random
+import threading
+import torch
+
+
+def _to_cpu(obj):
+    """
+    Deep copy of a (nested) state dict with all tensors moved to the CPU, so
+    that it can be written while training keeps updating the originals.
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return type(obj)((k, _to_cpu(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return obj
+
+
+def get_rng_state():
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state()
+    }
+
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def atomic_save(obj, path):
+    """
+    `torch.save` to a temporary file next to `path`, then rename it, so that
+    `path` always holds either the previous or the new complete file.
+    """
+    tmp = '{}.tmp'.format(path)
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+class CheckpointManager(object):
+    """
+    Resumable checkpoints of a training run. Each checkpoint holds the model,
+    the optimizer states (Adam moments), epoch and iteration counters, the
+    current learning rate and the Python/NumPy/torch RNG states, so that a
+    resumed run continues exactly as the uninterrupted one would.
+
+    Saving first snapshots everything to CPU memory, then writes it from a
+    background thread: training only pays for the copy.
+
+    Files in `checkpoint_dir`:
+        {name}.bin          model.state_dict() only, as loaded by `--test`
+        {name}.last.ckpt    latest full checkpoint, used by `resume`
+        {name}.ep{n}.ckpt   best `keep_best` full checkpoints by val MRR
+        {name}.best.json    index of the above
+
+    Example usage:
+    --------------
+    ckpt = CheckpointManager(checkpoint_dir, 'distmult_lr0.1_wd0')
+    start_epoch = ckpt.resume(model, [solver]) if args.resume else 0
+
+    for epoch in range(start_epoch, n_epoch):
+        ...
+        ckpt.save(model, [solver], epoch, it, lr, val_mrr=mrr)
+
+    ckpt.wait()
+    """
+
+    def __init__(self, checkpoint_dir, name, keep_best=3, background=True):
+        """
+        Params:
+        -------
+            checkpoint_dir: string
+                Where to write the checkpoints.
+
+            name: string
+                Prefix of the checkpoint files.
+
+            keep_best: int, default: 3
+                Number of best checkpoints by validation MRR to keep. Zero to
+                only keep the latest one.
+
+            background: bool, default: True
+                Whether to write from a background thread.
+        """
+        self.checkpoint_dir = checkpoint_dir.rstrip('/')
+        self.name = name
+        self.keep_best = keep_best
+        self.background = background
+
+        self._thread = None
+        self._error = None
+
+        # Counters of the resumed checkpoint, see `resume`
+        self.it = 0
+        self.lr = None
+
+        if not os.path.exists(self.checkpoint_dir):
+            os.makedirs(self.checkpoint_dir)
+
+        self.model_path = self._path('bin')
+        self.last_path = self._path('last.ckpt')
+        self.index_path = self._path('best.json')
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.best = json.load(f)
+        else:
+            self.best = []
+
+    def _path(self, suffix):
+        return '{}/{}.{}'.format(self.checkpoint_dir, self.name, suffix)
+
+    def wait(self):
+        """
+        Block until the pending write, if any, is done. Re-raises errors of
+        the background thread.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _write(self, state, val_mrr):
+        try:
+            atomic_save(state['model'], self.model_path)
+            atomic_save(state, self.last_path)
+
+            if self.keep_best > 0 and val_mrr is not None:
+                self._update_best(state, val_mrr)
+        except Exception as e:
+            self._error = e
+
+    def _update_best(self, state, val_mrr):
+        if len(self.best) >= self.keep_best and val_mrr <= self.best[-1]['val_mrr']:
+            return
+
+        path = self._path('ep{}.ckpt'.format(state['epoch']+1))
+        atomic_save(state, path)
+
+        self.best.append({'epoch': state['epoch'], 'val_mrr': val_mrr, 'path': path})
+        self.best.sort(key=lambda c: -c['val_mrr'])
+
+        for c in self.best[self.keep_best:]:
+            if os.path.exists(c['path']):
+                os.remove(c['path'])
+
+        self.best = self.best[:self.keep_best]
+
+        tmp = '{}.tmp'.format(self.index_path)
+        with open(tmp, 'w') as f:
+            json.dump(self.best, f, indent=2)
+        os.replace(tmp, self.index_path)
+
+    def save(self, model, solvers, epoch, it=0, lr=None, val_mrr=None):
+        """
+        Checkpoint the end of `epoch`.
+
+        Params:
+        -------
+        model: kga.models.base.Model
+
+        solvers: list of torch.optim.Optimizer
+
+        epoch: int
+            Epoch just finished, resuming starts from epoch + 1.
+
+        it: int, default: 0
+            Iteration counter, restored as `it` on resume.
+
+        lr: float, default: None
+            Current (annealed) learning rate.
+
+        val_mrr: float, default: None
+            Validation MRR of this epoch, used to keep the best checkpoints.
+        """
+        # Only one write in flight, also surfaces errors of the previous one
+        self.wait()
+
+        state = _to_cpu({
+            'model': model.state_dict(),
+            'solvers': [solver.state_dict() for solver in solvers],
+            'epoch': epoch,
+            'it': it,
+            'lr': lr,
+            'val_mrr': val_mrr,
+            'rng': get_rng_state()
+        })
+
+        if self.background:
+            self._thread = threading.Thread(target=self._write, args=(state, val_mrr))
+            self._thread.start()
+        else:
+            self._write(state, val_mrr)
+            self.wait()
+
+    def resume(self, model, solvers, path=None):
+        """
+        Load the latest (or the given) checkpoint into `model` and `solvers`
+        and restore the RNG states.
+
+        Returns:
+        --------
+        start_epoch: int
+            First epoch to run, 0 if there is no checkpoint yet.
+        """
+        path = self.last_path if path is None else path
+
+        if not os.path.exists(path):
+            return 0
+
+        # The NumPy RNG state is an ndarray, not loadable with weights_only
+        state = torch.load(path, map_location=lambda storage, loc: storage, weights_only=False)
+
+        model.load_state_dict(state['model'])
+
+        for solver, solver_state in zip(solvers, state['solvers']):
+            solver.load_state_dict(solver_state)
+
+        set_rng_state(state['rng'])
+
+        self.it = state['it']
+        self.lr = state['lr']
+
+        return state['epoch'] + 1
@@ -0,0 +1,188 @@
+import json
+import numpy as np
+import os
+import scipy.sparse as sp
+import struct
+
+
+MAGIC = b'KGBUNDLE'
+ALIGN = 64
+PAGE = 4096
+
+
+def _align(n, to):
+    return (n + to - 1) // to * to
+
+
+class Ragged(object):
+    """
+    List of variable-length int arrays, stored as CSR offsets and values, e.g.
+    the evaluation filters of create_evaluation_filter.py. `ragged[i]` are the
+    values of row i, so it can be used wherever the original list of lists
+    was indexed.
+    """
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_lists(cls, lists):
+        lengths = np.array([len(l) for l in lists], dtype=np.int64)
+        indptr = np.zeros(len(lists)+1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.fromiter((x for l in lists for x in l), dtype=np.int64, count=int(indptr[-1]))
+        return cls(indptr, indices)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, i):
+        # Small copy: writable, so that torch can index with it without warnings
+        return np.array(self.indices[self.indptr[i]:self.indptr[i+1]])
+
+
+def write_bundle(path, arrays):
+    """
+    Write a dataset bundle: one file with a JSON manifest followed by the raw,
+    uncompressed arrays, each aligned to 64 bytes so that it can be
+    memory-mapped in place.
+
+    Params:
+    -------
+    path: string
+        Output file.
+
+    arrays: dict
+        Name to np.array (numeric or fixed-width string), scipy sparse matrix
+        (stored as CSR) or Ragged.
+    """
+    manifest = {}
+    blobs = []
+    offset = 0
+
+    def add(arr):
+        nonlocal offset
+        arr = np.ascontiguousarray(arr)
+        if arr.dtype == object:
+            arr = arr.astype(str)
+        offset = _align(offset, ALIGN)
+        entry = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        blobs.append((offset, arr))
+        offset += arr.nbytes
+        return entry
+
+    for name, arr in arrays.items():
+        if sp.issparse(arr):
+            arr = arr.tocsr()
+            manifest[name] = {
+                'kind': 'csr', 'shape': list(arr.shape),
+                'data': add(arr.data), 'indices': add(arr.indices), 'indptr': add(arr.indptr)
+            }
+        elif isinstance(arr, Ragged):
+            manifest[name] = {'kind': 'ragged', 'indptr': add(arr.indptr), 'indices': add(arr.indices)}
+        else:
+            manifest[name] = dict(kind='array', **add(arr))
+
+    header = json.dumps(manifest).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header), PAGE)
+
+    tmp = '{}.tmp'.format(path)
+
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+
+        for blob_offset, arr in blobs:
+            f.seek(data_start + blob_offset)
+            f.write(arr.tobytes())
+
+        f.truncate(data_start + offset)
+
+    os.replace(tmp, path)
+
+
+class Dataset(object):
+    """
+    Read-only view of a dataset bundle written by `write_bundle`. Opening it
+    only reads the manifest; every array is memory-mapped on first access and
+    cached. All processes opening the same bundle, e.g. training, evaluation
+    and serving, share its pages in the OS page cache.
+
+    Example usage:
+    --------------
+    ds = Dataset('data/fb15k/bin/bundle.kgb')
+    X_train = ds.train            # np.memmap of M x 3
+    filter_s = ds['filter_s_test'] # Ragged, filter_s[i] as before
+    X_lit = ds.numerical_literals  # scipy.sparse.csr_matrix if stored as CSR
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('{} is not a dataset bundle'.format(path))
+
+            header_len, = struct.unpack('<Q', f.read(8))
+            self.manifest = json.loads(f.read(header_len).decode('utf-8'))
+
+        self._data_start = _align(len(MAGIC) + 8 + header_len, PAGE)
+        self._cache = {}
+
+    def _map(self, entry):
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+
+        if int(np.prod(shape)) == 0:
+            return np.empty(shape, dtype=dtype)
+
+        return np.memmap(self.path, dtype=dtype, mode='r',
+                         offset=self._data_start + entry['offset'], shape=shape)
+
+    def keys(self):
+        return self.manifest.keys()
+
+    def __contains__(self, name):
+        return name in self.manifest
+
+    def __getitem__(self, name):
+        if name not in self._cache:
+            if name not in self.manifest:
+                raise KeyError('{} has no array {}'.format(self.path, name))
+
+            entry = self.manifest[name]
+
+            if entry['kind'] == 'csr':
+                value = sp.csr_matrix(
+                    (self._map(entry['data']), self._map(entry['indices']), self._map(entry['indptr'])),
+                    shape=tuple(entry['shape']), copy=False
+                )
+            elif entry['kind'] == 'ragged':
+                value = Ragged(self._map(entry['indptr']), self._map(entry['indices']))
+            else:
+                value = self._map(entry)
+
+            self._cache[name] = value
+
+        return self._cache[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name in ('path', 'manifest'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(str(e))
+
+    def get(self, name, default=None):
+        return self[name] if name in self.manifest else default
+
+    @property
+    def n_e(self):
+        return self.manifest['idx2ent']['shape'][0]
+
+    @property
+    def n_r(self):
+        return self.manifest['idx2rel']['shape'][0]
@@ -0,0 +1,244 @@
+import os
+import numpy as np
+import torch
+import torch.distributed as dist
+from time import time
+
+from kga.hogwild import default_forward, make_solvers
+from kga.util import get_minibatches, sample_negatives
+
+
+def init_process(rank, world_size, master_addr='127.0.0.1', master_port=29500, backend='gloo'):
+    """
+    Join the process group. With `master_addr` on the local host, several
+    ranks can be launched on a single machine.
+    """
+    os.environ['MASTER_ADDR'] = master_addr
+    os.environ['MASTER_PORT'] = str(master_port)
+
+    dist.init_process_group(backend, rank=rank, world_size=world_size)
+
+
+def partition(X, rank, world_size, randseed=9999):
+    """
+    Return the partition of the triples owned by `rank`. All partitions have
+    the same size (up to world_size - 1 triples are dropped) so that every
+    rank runs the same number of steps per epoch.
+    """
+    rng = np.random.RandomState(randseed)
+    X = X[rng.permutation(X.shape[0])]
+
+    size = X.shape[0] // world_size
+
+    return X[rank*size:(rank+1)*size]
+
+
+def broadcast_parameters(model, src=0):
+    """
+    Make all ranks start from the parameters of rank `src`.
+    """
+    for p in model.state_dict().values():
+        dist.broadcast(p, src)
+
+
+def allreduce_dense_gradients(model, world_size):
+    """
+    Average gradients of the dense weights over all ranks with a single
+    all-reduce over a flattened buffer.
+    """
+    params = [p for p in model.dense_parameters() if p.requires_grad]
+
+    for p in params:
+        if p.grad is None:
+            p.grad = torch.zeros_like(p)
+
+    buf = torch.cat([p.grad.view(-1) for p in params])
+    dist.all_reduce(buf)
+    buf /= world_size
+
+    offset = 0
+    for p in params:
+        n = p.numel()
+        p.grad.copy_(buf[offset:offset+n].view_as(p))
+        offset += n
+
+
+def allreduce_sparse_gradients(model, world_size):
+    """
+    Average gradients of the embedding tables over all ranks, exchanging only
+    the touched rows: every rank gathers (row index, gradient row) pairs of
+    all ranks instead of all-reducing the full n x k table.
+
+    Returns:
+    --------
+    n_rows: int
+        Number of rows sent by this rank, for bookkeeping.
+    """
+    n_rows = 0
+
+    for p in model.sparse_parameters():
+        dim = p.size(1)
+
+        if p.grad is None:
+            idx = torch.zeros(0, dtype=torch.long)
+            val = torch.zeros(0, dim, dtype=p.dtype)
+        else:
+            g = p.grad.coalesce()
+            idx = g._indices()[0]
+            val = g._values()
+
+        n_rows += idx.size(0)
+
+        # gloo all_gather needs equal sizes: exchange sizes, then pad
+        sizes = [torch.zeros(1, dtype=torch.long) for _ in range(world_size)]
+        dist.all_gather(sizes, torch.tensor([idx.size(0)]))
+        sizes = [int(s) for s in sizes]
+        max_size = max(sizes)
+
+        idx_pad = torch.zeros(max_size, dtype=torch.long)
+        idx_pad[:idx.size(0)] = idx
+        val_pad = torch.zeros(max_size, dim, dtype=p.dtype)
+        val_pad[:idx.size(0)] = val
+
+        idxs = [torch.zeros_like(idx_pad) for _ in range(world_size)]
+        vals = [torch.zeros_like(val_pad) for _ in range(world_size)]
+        dist.all_gather(idxs, idx_pad)
+        dist.all_gather(vals, val_pad)
+
+        idx = torch.cat([i[:n] for i, n in zip(idxs, sizes)])
+        val = torch.cat([v[:n] for v, n in zip(vals, sizes)]) / world_size
+
+        p.grad = torch.sparse_coo_tensor(idx.unsqueeze(0), val, p.size()).coalesce()
+
+    return n_rows
+
+
+class DistributedTrainer(object):
+    """
+    Synchronous data-parallel trainer over `torch.distributed`. Each rank owns
+    a partition of the training triples and samples its negatives locally.
+    After the backward pass, the dense weights are all-reduced and the touched
+    embedding rows are exchanged sparsely, then every rank applies the same
+    update, so the replicas stay identical.
+
+    Checkpoints and evaluation happen on rank 0 only and use the usual
+    `state_dict` format.
+    """
+
+    def __init__(self, model, X_train, n_e, rank, world_size, mb_size=100, C=10, lr=0.01, lr_decay_every=20, weight_decay=0, margin=1, energy_based=False, average_loss=False, forward_fn=None, randseed=9999):
+        """
+        Params:
+        -------
+            model: kga.models.base.Model
+                Model to be trained, on CPU.
+
+            X_train: np.array of M x 3
+                Full training set, partitioned by rank internally.
+
+            rank, world_size: int
+                Position in the process group, see `init_process`.
+
+            energy_based: bool, default: False
+                Whether lower scores are better, e.g. for TransE.
+
+            forward_fn: function (model, X) -> scores, default: None
+                How to score a batch of triples, e.g. to gather the literals
+                of the batch. Defaults to `model.forward(X)`.
+
+            The remaining params are the usual training hyperparameters.
+        """
+        self.model = model
+        self.n_e = n_e
+        self.rank = rank
+        self.world_size = world_size
+        self.mb_size = mb_size
+        self.C = C
+        self.lr = lr
+        self.lr_decay_every = lr_decay_every
+        self.margin = margin
+        self.energy_based = energy_based
+        self.average_loss = average_loss
+        self.forward_fn = forward_fn if forward_fn is not None else default_forward
+
+        self.X_train = partition(X_train, rank, world_size, randseed)
+
+        # Different negatives on every rank
+        np.random.seed(randseed + rank)
+        torch.manual_seed(randseed + rank)
+
+        self.model.set_sparse_embeddings(True)
+        broadcast_parameters(self.model)
+
+        self.solvers = make_solvers(self.model, lr, weight_decay, sparse_adam=True)
+
+    def step(self, X_mb):
+        m = X_mb.shape[0]
+        X_neg_mb = np.vstack([sample_negatives(X_mb, self.n_e) for _ in range(self.C)])
+        X_train_mb = np.vstack([X_mb, X_neg_mb])
+
+        y = self.forward_fn(self.model, X_train_mb)
+        y_pos, y_neg = y[:m], y[m:]
+
+        loss = self.model.ranking_loss(
+            y_pos, y_neg, margin=self.margin, C=self.C,
+            energy_based=self.energy_based, average=self.average_loss
+        )
+
+        for solver in self.solvers:
+            solver.zero_grad()
+
+        loss.backward()
+
+        allreduce_dense_gradients(self.model, self.world_size)
+        n_rows = allreduce_sparse_gradients(self.model, self.world_size)
+
+        for solver in self.solvers:
+            solver.step()
+
+        return loss.item(), n_rows
+
+    def train(self, n_epoch, checkpoint_path=None, eval_fn=None, verbose=True):
+        """
+        Params:
+        -------
+        n_epoch: int
+            Number of passes over the partitions.
+
+        checkpoint_path: string, default: None
+            Where rank 0 saves `model.state_dict()` after every epoch.
+
+        eval_fn: function (model, epoch) -> any, default: None
+            Called on rank 0 after every epoch, the other ranks wait.
+        """
+        for epoch in range(n_epoch):
+            start = time()
+            it = 0
+            loss_sum = 0
+            rows_sum = 0
+
+            # Anneal learning rate
+            lr = self.lr * (0.5 ** (epoch // self.lr_decay_every))
+            for solver in self.solvers:
+                for param_group in solver.param_groups:
+                    param_group['lr'] = lr
+
+            for X_mb in get_minibatches(self.X_train, self.mb_size, shuffle=True):
+                loss, n_rows = self.step(X_mb)
+                loss_sum += loss
+                rows_sum += n_rows
+                it += 1
+
+            if self.rank == 0:
+                if verbose:
+                    print('Epoch-{}; loss: {:.4f}; embedding rows sent per step: {:.0f}; time: {:.2f}s'
+                          .format(epoch+1, loss_sum / max(it, 1), rows_sum / max(it, 1), time()-start))
+
+                if eval_fn is not None:
+                    self.model.eval()
+                    eval_fn(self.model, epoch)
+                    self.model.train()
+
+                if checkpoint_path is not None:
+                    torch.save(self.model.state_dict(), checkpoint_path)
+
+            dist.barrier()
@@ -0,0 +1,236 @@
+import numpy as np
+import os
+import torch
+import torch.nn as nn
+
+
+class TripleScorer(nn.Module):
+    """
+    Inference wrapper of a trained model that takes triples only: the
+    entity-level literal tables are held as buffers and gathered for the
+    heads and tails of every batch, in the order of the model's forward.
+
+    Tracing it bakes the Python branching on the literal flags of the model
+    (num_lit, img_lit, txt_lit, ...) into a static graph, specialized for
+    its literal configuration.
+
+    Example usage:
+    --------------
+    # ERLMLP(X, X_lit_s, X_lit_o, X_lit_s_img, X_lit_o_img, X_lit_s_txt, X_lit_o_txt)
+    scorer = TripleScorer(model, literals=[X_lit, X_lit_img, None])
+    y = scorer(X)             # M
+    y_s, y_o = scorer.score_all(X)  # M x n_e each
+    """
+
+    def __init__(self, model, literals=(), n_e=None, chunk_size=1024):
+        """
+        Params:
+        -------
+        model: kga.models.base.Model
+            Trained model, scoring triples with forward(X, *literals).
+
+        literals: list of np.array of n_e x ... or None, default: ()
+            Entity-level literal tables, one per (s, o) pair of arguments of
+            model.forward, e.g. [X_lit] for DistMultLiteral. None passes
+            None for both, e.g. for the text of an ERLMLP without txt_lit.
+
+        n_e: int, default: None
+            Number of entities. Defaults to model.n_e, or model.n_ent.
+
+        chunk_size: int, default: 1024
+            Entities scored at once by `score_all` for the models without an
+            entity matrix, i.e. M * chunk_size triples per forward.
+        """
+        super(TripleScorer, self).__init__()
+
+        self.model = model
+        self.n_e = n_e or getattr(model, 'n_e', None) or model.n_ent
+        self.chunk_size = chunk_size
+        self.n_tables = len(literals)
+
+        device = next(model.parameters()).device
+
+        for i, table in enumerate(literals):
+            if table is not None:
+                table = torch.from_numpy(np.ascontiguousarray(table)).to(device)
+            self.register_buffer('table{}'.format(i), table)
+
+    def forward(self, X):
+        """
+        Scores of the triples X, LongTensor of M x 3, as a vector of M.
+        """
+        s, o = X[:, 0], X[:, 2]
+        args = []
+
+        for i in range(self.n_tables):
+            table = getattr(self, 'table{}'.format(i))
+            args += [None, None] if table is None else [table[s], table[o]]
+
+        return self.model(X, *args).view(-1)
+
+    def score_all(self, X):
+        """
+        Scores of (e, r, o) and (s, r, e) for every entity e, as two matrices
+        of M x n_e, i.e. batched `predict_all`.
+
+        DistMult, DistMultLiteral, RESCAL and TransE score the M queries
+        against their n_e x k entity matrix, one matmul (distance for TransE)
+        per side. Other models run forward on every (triple, entity) pair,
+        `chunk_size` entities at a time.
+        """
+        y = self._score_all_matrix(X)
+
+        if y is not None:
+            return y
+
+        y_s, y_o = [], []
+
+        for start in range(0, self.n_e, self.chunk_size):
+            ents = torch.arange(start, min(start + self.chunk_size, self.n_e), device=X.device)
+            n = ents.size(0)
+
+            X_s = X.unsqueeze(1).repeat(1, n, 1)
+            X_s[:, :, 0] = ents
+
+            X_o = X.unsqueeze(1).repeat(1, n, 1)
+            X_o[:, :, 2] = ents
+
+            y_s.append(self.forward(X_s.view(-1, 3)).view(-1, n))
+            y_o.append(self.forward(X_o.view(-1, 3)).view(-1, n))
+
+        return torch.cat(y_s, 1), torch.cat(y_o, 1)
+
+    def _score_all_matrix(self, X):
+        # M x n_e scores against the entity matrix, None if the model has none
+        model = self.model
+        kind = type(model).__name__
+
+        s, p, o = X[:, 0], X[:, 1], X[:, 2]
+
+        if kind == 'DistMult':
+            E = model.emb_E.weight
+            W = model.emb_R(p)
+
+            return torch.mm(W * E[o], E.t()), torch.mm(E[s] * W, E.t())
+
+        if kind == 'DistMultLiteral' and not model.sparse_lit:
+            E = model.emb_E_lit(torch.cat([model.emb_E.weight, self.table0], 1))
+            W = model.emb_R(p)
+
+            return torch.mm(W * E[o], E.t()), torch.mm(E[s] * W, E.t())
+
+        if kind == 'RESCAL':
+            E = model.emb_E.weight
+            W = model.emb_R(p).view(-1, model.k, model.k)
+
+            # W o and s^T W, M x k each
+            W_o = torch.bmm(W, E[o].unsqueeze(2)).squeeze(2)
+            s_W = torch.bmm(E[s].unsqueeze(1), W).squeeze(1)
+
+            return torch.mm(W_o, E.t()), torch.mm(s_W, E.t())
+
+        if kind == 'TransE':
+            E = model.emb_E.weight
+            r = model.emb_R(p)
+            norm = 1 if model.d == 'l1' else 2
+
+            # |e + r - o| = |(o - r) - e| and |s + r - e|
+            return torch.cdist(E[o] - r, E, p=norm), torch.cdist(E[s] + r, E, p=norm)
+
+        return None
+
+
+def export_path(checkpoint_path):
+    """
+    Path of the exported scorer of a checkpoint, e.g.
+    models/fb15k/distmult.bin -> models/fb15k/distmult.jit.pt
+    """
+    return '{}.jit.pt'.format(os.path.splitext(checkpoint_path)[0])
+
+
+def script_scorer(model, literals=(), n_e=None, example=None):
+    """
+    TorchScript scorer of a trained model: `forward` and `score_all` of
+    `TripleScorer`, traced for its literal configuration and frozen, i.e.
+    with the weights folded in as constants.
+
+    Params:
+    -------
+    model: kga.models.base.Model
+
+    literals: list of np.array or None, default: ()
+        See `TripleScorer`.
+
+    n_e: int, default: None
+        See `TripleScorer`.
+
+    example: LongTensor of M x 3, default: None
+        Triples to trace with. Defaults to two triples of entity and
+        relation 0.
+
+    Returns:
+    --------
+    scorer: torch.jit.ScriptModule
+    """
+    training = model.training
+    model.eval()
+
+    scorer = TripleScorer(model, literals, n_e).eval()
+
+    if example is None:
+        device = next(model.parameters()).device
+        example = torch.zeros(2, 3, dtype=torch.long, device=device)
+
+    with torch.no_grad():
+        traced = torch.jit.trace_module(scorer, {'forward': example, 'score_all': example}, check_trace=False)
+
+    traced = torch.jit.freeze(traced, preserved_attrs=['score_all'])
+
+    model.train(training)
+
+    return traced
+
+
+def export(model, path, literals=(), n_e=None, example=None):
+    """
+    Write the TorchScript scorer of `model`, see `script_scorer`, e.g. to
+    `export_path(checkpoint_path)`. The file is loaded with `load` or
+    `torch.jit.load`, without the Python model classes.
+
+    Returns:
+    --------
+    scorer: torch.jit.ScriptModule
+    """
+    scorer = script_scorer(model, literals, n_e, example)
+
+    tmp = '{}.tmp'.format(path)
+    torch.jit.save(scorer, tmp)
+    os.replace(tmp, path)
+
+    return scorer
+
+
+def load(path, gpu=False):
+    """
+    Exported scorer: scorer(X) and scorer.score_all(X) for LongTensors X of
+    M x 3, on the GPU if gpu is set.
+    """
+    return torch.jit.load(path, map_location='cuda' if gpu else 'cpu')
+
+
+def compile_scorer(model, literals=(), n_e=None, **kwargs):
+    """
+    In-process alternative to `script_scorer` for evaluation: `TripleScorer`
+    with forward and score_all compiled by torch.compile (PyTorch >= 2.0),
+    kwargs are passed to it. Unlike the exported scorer, it can not be saved.
+    """
+    if not hasattr(torch, 'compile'):
+        raise RuntimeError('torch.compile requires PyTorch >= 2.0, use script_scorer instead')
+
+    model.eval()
+    scorer = TripleScorer(model, literals, n_e).eval()
+
+    scorer.forward = torch.compile(scorer.forward, **kwargs)
+    scorer.score_all = torch.compile(scorer.score_all, **kwargs)
+
+    return scorer
@@ -0,0 +1,324 @@
+import copy
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from functools import partial
+from time import time
+
+from kga.util import get_minibatches, sample_negatives
+
+
+def default_forward(model, X):
+    return model.forward(X)
+
+
+def make_solvers(model, lr, weight_decay=0, sparse_adam=False):
+    """
+    Build one optimizer for the sparse embedding tables (plain SGD, as the
+    lock-free updates then only touch the looked-up rows) and one Adam for
+    the dense weights.
+
+    Params:
+    -------
+    sparse_adam: bool, default: False
+        Use `torch.optim.SparseAdam` instead of SGD for the embedding tables.
+        It only keeps moments of the touched rows up to date.
+
+    Returns:
+    --------
+    solvers: list of torch.optim.Optimizer
+    """
+    solvers = []
+
+    sparse = model.sparse_parameters()
+    dense = model.dense_parameters()
+
+    if sparse and sparse_adam:
+        solvers.append(torch.optim.SparseAdam(sparse, lr=lr))
+    elif sparse:
+        solvers.append(torch.optim.SGD(sparse, lr=lr))
+    if dense:
+        solvers.append(torch.optim.Adam(dense, lr=lr, weight_decay=weight_decay))
+
+    return solvers
+
+
+def _worker(rank, model, X_shard, n_e, n_epoch, mb_size, C, lr, lr_decay_every, weight_decay, loss, loss_kwargs, normalize_embed, forward_fn, sampler, randseed, queue, max_batches):
+    # One intra-op thread per worker, otherwise workers fight over the cores
+    torch.set_num_threads(1)
+    np.random.seed(randseed + rank)
+    torch.manual_seed(randseed + rank)
+
+    solvers = make_solvers(model, lr, weight_decay)
+
+    for epoch in range(n_epoch):
+        start = time()
+        it = 0
+        loss_sum = 0
+
+        # Anneal learning rate
+        lr_epoch = lr * (0.5 ** (epoch // lr_decay_every))
+        for solver in solvers:
+            for param_group in solver.param_groups:
+                param_group['lr'] = lr_epoch
+
+        for X_mb in get_minibatches(X_shard, mb_size, shuffle=True):
+            if max_batches is not None and it >= max_batches:
+                break
+
+            m = X_mb.shape[0]
+            X_neg_mb = np.vstack([sampler(X_mb) for _ in range(C)])
+            X_train_mb = np.vstack([X_mb, X_neg_mb])
+
+            y = forward_fn(model, X_train_mb)
+            y_pos, y_neg = y[:m], y[m:]
+
+            loss_mb = model.negative_loss(loss, y_pos, y_neg, C=C, **loss_kwargs)
+
+            for solver in solvers:
+                solver.zero_grad()
+
+            loss_mb.backward()
+
+            # Lock-free update of the shared parameters
+            for solver in solvers:
+                solver.step()
+
+            if normalize_embed:
+                model.normalize_embeddings()
+
+            loss_sum += loss_mb.item()
+            it += 1
+
+        # Timestamps of the worker, so that spawning is not counted as training
+        queue.put((rank, epoch, it, it * mb_size, start, time(), loss_sum / max(it, 1)))
+
+
+class HogwildTrainer(object):
+    """
+    Hogwild-style trainer: the model parameters live in shared memory and
+    `n_workers` processes update them without locking, each one on a disjoint
+    shard of the training triples.
+
+    Embedding tables are switched to sparse gradients so that a worker only
+    writes the rows of its minibatch. Evaluation runs in the parent process on
+    a snapshot of the parameters taken after every epoch, so the workers keep
+    training in the meantime.
+
+    Only CPU models are supported.
+
+    Example usage for models with literals:
+    ---------------------------------------
+    def forward_fn(model, X):
+        return model.forward(X, X_lit[X[:, 0]], X_lit[X[:, 2]])
+
+    trainer = HogwildTrainer(model, X_train, n_e, n_workers=8, forward_fn=forward_fn)
+    trainer.train(n_epoch=20, eval_fn=lambda model, epoch: ...)
+    """
+
+    def __init__(self, model, X_train, n_e, n_workers, mb_size=100, C=10, lr=0.01, lr_decay_every=20, weight_decay=0, margin=1, average_loss=False, loss='margin', energy_based=False, adversarial_temperature=None, normalize_embed=False, forward_fn=None, sampler=None, randseed=9999):
+        """
+        Params:
+        -------
+            model: kga.models.base.Model
+                Model to be trained. Must not be on the GPU.
+
+            X_train: np.array of M x 3
+                Training triples.
+
+            n_e: int
+                Number of entities, used for negative sampling.
+
+            n_workers: int
+                Number of worker processes.
+
+            loss: {'margin', 'logistic'}, default: 'margin'
+                Loss of the positives vs. their negatives, see
+                `Model.negative_loss`.
+
+            energy_based: bool, default: False
+                Whether lower scores are better, e.g. for TransE.
+
+            adversarial_temperature: float, default: None
+                Self-adversarial weighting of the negatives, none if None.
+
+            normalize_embed: bool, default: False
+                Renormalize the embeddings to the unit ball after every step,
+                see `Model.normalize_embeddings`.
+
+            forward_fn: function (model, X) -> scores, default: None
+                How to score a batch of triples, e.g. to gather the literals
+                of the batch. Defaults to `model.forward(X)`.
+
+            sampler: function X -> X_corr, default: None
+                Picklable negative sampler, e.g. `kga.util.BernSampler`.
+                Defaults to `sample_negatives(X, n_e)`.
+
+            The remaining params are the usual training hyperparameters.
+        """
+        if model.gpu:
+            raise ValueError('Hogwild training only supports CPU models.')
+
+        self.model = model
+        self.n_e = n_e
+        self.n_workers = n_workers
+        self.mb_size = mb_size
+        self.C = C
+        self.lr = lr
+        self.lr_decay_every = lr_decay_every
+        self.weight_decay = weight_decay
+        self.margin = margin
+        self.average_loss = average_loss
+        self.loss = loss
+        self.energy_based = energy_based
+        self.adversarial_temperature = adversarial_temperature
+        self.normalize_embed = normalize_embed
+        self.forward_fn = forward_fn if forward_fn is not None else default_forward
+        self.sampler = sampler if sampler is not None else partial(sample_negatives, n_e=n_e)
+        self.randseed = randseed
+
+        # Disjoint shards, each worker reshuffles its own shard every epoch
+        rng = np.random.RandomState(randseed)
+        self.shards = np.array_split(X_train[rng.permutation(X_train.shape[0])], n_workers)
+
+        self.model.set_sparse_embeddings(True)
+        self.model.share_memory()
+
+    def loss_kwargs(self):
+        return dict(margin=self.margin, energy_based=self.energy_based, average=self.average_loss,
+                    adversarial_temperature=self.adversarial_temperature)
+
+    def snapshot(self):
+        """
+        Private copy of the current (shared) model, safe to evaluate while the
+        workers keep updating the shared parameters.
+        """
+        model = copy.deepcopy(self.model)
+        model.eval()
+        return model
+
+    def train(self, n_epoch, eval_fn=None, max_batches=None, verbose=True):
+        """
+        Params:
+        -------
+        n_epoch: int
+            Number of epochs, every worker does one pass over its shard per
+            epoch.
+
+        eval_fn: function (model, epoch) -> any, default: None
+            Called in the parent with a snapshot of the model once all workers
+            finished an epoch.
+
+        max_batches: int, default: None
+            Cap the number of minibatches per worker and epoch. Useful for
+            benchmarking.
+
+        Returns:
+        --------
+        stats: list of dict
+            Per epoch wall time and throughput (triples/s), from the first
+            step of the workers to the last, mean loss, the result of
+            `eval_fn` and 'startup', the time from spawning the workers to
+            their first step.
+        """
+        queue = mp.SimpleQueue()
+        procs = []
+
+        start = time()
+
+        for rank in range(self.n_workers):
+            p = mp.Process(target=_worker, args=(
+                rank, self.model, self.shards[rank], self.n_e, n_epoch,
+                self.mb_size, self.C, self.lr, self.lr_decay_every,
+                self.weight_decay, self.loss, self.loss_kwargs(), self.normalize_embed,
+                self.forward_fn, self.sampler, self.randseed, queue, max_batches
+            ))
+            p.start()
+            procs.append(p)
+
+        stats = []
+        done = [[] for _ in range(n_epoch)]
+        startup = None
+
+        for _ in range(n_epoch * self.n_workers):
+            rank, epoch, it, n_triples, t_start, t_end, loss = queue.get()
+            done[epoch].append((n_triples, t_start, t_end, loss))
+
+            if len(done[epoch]) < self.n_workers:
+                continue
+
+            if startup is None:
+                startup = min(t for _, t, _, _ in done[epoch]) - start
+
+            wall = max(t for _, _, t, _ in done[epoch]) - min(t for _, t, _, _ in done[epoch])
+            epoch_triples = sum(n for n, _, _, _ in done[epoch])
+            epoch_loss = np.mean([l for _, _, _, l in done[epoch]])
+
+            result = eval_fn(self.snapshot(), epoch) if eval_fn is not None else None
+
+            stats.append({
+                'epoch': epoch, 'time': wall, 'triples_per_sec': epoch_triples / wall,
+                'loss': epoch_loss, 'eval': result, 'startup': startup
+            })
+
+            if verbose:
+                print('Epoch-{}; loss: {:.4f}; {:.0f} triples/s with {} workers'
+                      .format(epoch+1, epoch_loss, epoch_triples / wall, self.n_workers))
+
+        for p in procs:
+            p.join()
+
+        return stats
+
+
+def scaling_report(make_model, X_train, n_e, workers=(1, 2, 4, 8), max_batches=200, verbose=True, **kwargs):
+    """
+    Measure Hogwild training throughput from 1 to N workers. Throughput is
+    timed from the first step of the workers, the cost of spawning them is
+    reported separately.
+
+    Params:
+    -------
+    make_model: function () -> kga.models.base.Model
+        Builds a fresh model for every run.
+
+    X_train: np.array of M x 3
+        Training triples.
+
+    n_e: int
+        Number of entities.
+
+    workers: list of int, default: (1, 2, 4, 8)
+        Worker counts to benchmark.
+
+    max_batches: int, default: 200
+        Number of minibatches per worker in each run.
+
+    kwargs:
+        Passed to `HogwildTrainer`.
+
+    Returns:
+    --------
+    report: list of (n_workers, triples_per_sec, speedup, efficiency, startup)
+        Efficiency is speedup / n_workers relative to the first entry,
+        startup the seconds from spawning the workers to their first step.
+    """
+    report = []
+    base = None
+
+    for n in workers:
+        trainer = HogwildTrainer(make_model(), X_train, n_e, n, **kwargs)
+        stats = trainer.train(1, max_batches=max_batches, verbose=False)
+        thr, startup = stats[0]['triples_per_sec'], stats[0]['startup']
+
+        if base is None:
+            base = thr / workers[0]
+
+        speedup = thr / base
+        report.append((n, thr, speedup, speedup / n, startup))
+
+        if verbose:
+            print('workers: {}; {:.0f} triples/s; speedup: {:.2f}x; efficiency: {:.2f}; startup: {:.2f}s'
+                  .format(n, thr, speedup, speedup / n, startup))
+
+    return report
@@ -44,6 +44,23 @@ def auc(y_pred, y_true):
     return roc_auc_score(y_true, y_pred)
 
 
+def _to_model(model, X):
+    """
+    Dense array X as a tensor on the device of the model, so that it is
+    converted once up front rather than on every predict call. Int arrays
+    become LongTensors; None, tensors and sparse matrices are passed through.
+    """
+    if not isinstance(X, np.ndarray):
+        return X
+
+    if np.issubdtype(X.dtype, np.integer):
+        X = X.astype(np.int64, copy=False)
+
+    X = torch.from_numpy(np.ascontiguousarray(X))
+
+    return X.cuda() if getattr(model, 'gpu', False) else X
+
+
 def eval_embeddings(model, X_test, n_e, k, n_sample=1000, X_lit_s_ori=None, X_lit_o_ori=None, X_txt_s=None, X_txt_o=None, X_lit_img=None):
     """
     Compute Mean Reciprocal Rank and Hits@k score of embedding model.
@@ -68,8 +85,12 @@ def eval_embeddings(model, X_test, n_e, k, n_sample=1000, X_lit_s_ori=None, X_li
         samples are randomly picked w/o replacement from [0, n_e). Consider
         setting this to get the (fast) approximation of mrr and hits@k.
 
-    X_lit: n_e x n_l matrix
-        Matrix containing all literals for all entities.
+    X_lit_s_ori, X_lit_o_ori: n_e x n_l matrix
+        Matrix containing all literals for all entities, looked up by the
+        subject and object ids. Usually the same matrix is passed twice.
+
+    X_txt_s, X_txt_o: n_e x ... matrix
+        Same, for text literals.
 
 
     Returns:
@@ -82,8 +103,13 @@ def eval_embeddings(model, X_test, n_e, k, n_sample=1000, X_lit_s_ori=None, X_li
     """
     M = X_test.shape[0]
 
-    X_corr_h = np.copy(X_test)
-    X_corr_t = np.copy(X_test)
+    X_test = _to_model(model, X_test)
+    X_lit_s_ori, X_lit_o_ori = _to_model(model, X_lit_s_ori), _to_model(model, X_lit_o_ori)
+    X_txt_s, X_txt_o = _to_model(model, X_txt_s), _to_model(model, X_txt_o)
+    X_lit_img = _to_model(model, X_lit_img)
+
+    X_corr_h = X_test.clone()
+    X_corr_t = X_test.clone()
 
     N = n_sample+1 if n_sample is not None else n_e+1
 
@@ -94,10 +120,11 @@ def eval_embeddings(model, X_test, n_e, k, n_sample=1000, X_lit_s_ori=None, X_li
     if X_lit_s_ori is None and X_lit_o_ori is None:
         y = model.predict(X_test).ravel()
     elif X_lit_img is None and X_txt_s is None and X_txt_o is None:
-        y = model.predict(X_test, X_lit_s_ori, X_lit_o_ori)
+        y = model.predict(X_test, X_lit_s_ori[X_test[:, 0]], X_lit_o_ori[X_test[:, 2]])
         y = y.ravel()
     elif X_lit_img is None:
-        y = model.predict(X_test, X_lit_s_ori, X_lit_o_ori, X_txt_s, X_txt_o)
+        y = model.predict(X_test, X_lit_s_ori[X_test[:, 0]], X_lit_o_ori[X_test[:, 2]],
+                          X_txt_s[X_test[:, 0]], X_txt_o[X_test[:, 2]])
         y = y.ravel()
     else:
         X_lit_s_ori = X_lit[X_test[:, 0]]
@@ -125,25 +152,20 @@ def eval_embeddings(model, X_test, n_e, k, n_sample=1000, X_lit_s_ori=None, X_li
     for i, e in enumerate(ents):
         idx = i+1  # as i == 0 is for correct triplet score
 
-        X_corr_h[:, 0] = e
-        X_corr_t[:, 2] = e
+        X_corr_h[:, 0] = int(e)
+        X_corr_t[:, 2] = int(e)
 
         if X_lit_s_ori is None and X_lit_o_ori is None:
             y_h = model.predict(X_corr_h).ravel()
             y_t = model.predict(X_corr_t).ravel()
         elif X_lit_img is None and X_txt_s is None and X_txt_o is None:
-            X_lit_s = X_lit_s_ori[X_corr_h[:, 0]]
-            X_lit_o = X_lit_o_ori[X_corr_t[:, 2]]
-            y_h = model.predict(X_corr_h, X_lit_s, X_lit_o_ori).ravel()
-            y_t = model.predict(X_corr_t, X_lit_s_ori, X_lit_o).ravel()
+            y_h = model.predict(X_corr_h, X_lit_s_ori[X_corr_h[:, 0]], X_lit_o_ori[X_corr_h[:, 2]]).ravel()
+            y_t = model.predict(X_corr_t, X_lit_s_ori[X_corr_t[:, 0]], X_lit_o_ori[X_corr_t[:, 2]]).ravel()
         elif X_lit_img is None:
-            X_lit_s = X_lit_s_ori[X_corr_h[:, 0]]
-            X_lit_o = X_lit_o_ori[X_corr_t[:, 2]]
-            X_lit_s_txt = X_txt_s[X_corr_h[:, 0]]
-            X_lit_o_txt = X_txt_o[X_corr_t[:, 2]]
-
-            y_h = model.predict(X_corr_h, X_lit_s, X_lit_o_ori, X_lit_s_txt, X_txt_o).ravel()
-            y_t = model.predict(X_corr_t, X_lit_s_ori, X_lit_o, X_txt_s, X_lit_o_txt).ravel()
+            y_h = model.predict(X_corr_h, X_lit_s_ori[X_corr_h[:, 0]], X_lit_o_ori[X_corr_h[:, 2]],
+                                X_txt_s[X_corr_h[:, 0]], X_txt_o[X_corr_h[:, 2]]).ravel()
+            y_t = model.predict(X_corr_t, X_lit_s_ori[X_corr_t[:, 0]], X_lit_o_ori[X_corr_t[:, 2]],
+                                X_txt_s[X_corr_t[:, 0]], X_txt_o[X_corr_t[:, 2]]).ravel()
 
         else:
             X_lit_s = X_lit[X_corr_h[:, 0]]
@@ -192,11 +214,14 @@ def eval_embeddings_vertical(model, X_test, n_e, k, filter_h=None, filter_t=None
     ranks_h = np.zeros(sample_idxs.shape[0], dtype=int)
     ranks_t = np.zeros(sample_idxs.shape[0], dtype=int)
 
+    # Converted once, each test triple is then a view of X
+    X = _to_model(model, X_test)
+    kwargs = {key: _to_model(model, value) for key, value in kwargs.items()}
+
     for i, idx in tqdm(enumerate(sample_idxs)):
-        x = X_test[idx]
-        h, t = int(x[0]), int(x[2])
+        h, t = int(X_test[idx, 0]), int(X_test[idx, 2])
 
-        x = x.reshape(1, -1)
+        x = X[idx:idx+1]
 
         if len(kwargs) == 0:
             y_h, y_t = model.predict_all(x)
@@ -274,21 +299,25 @@ def eval_embeddings_rel(model, X_test, n_r, k, descending=True, X_lit_s=None, X_
     """
     M = X_test.shape[0]
 
-    X_corr_r = np.copy(X_test)
+    X = _to_model(model, X_test)
+    X_lit_s, X_lit_o = _to_model(model, X_lit_s), _to_model(model, X_lit_o)
+    X_lit_img, X_lit_txt = _to_model(model, X_lit_img), _to_model(model, X_lit_txt)
+
+    X_corr_r = X.clone()
     scores_r = np.zeros([M, n_r])
 
     # Gather scores for correct entities
     if X_lit_s is None or X_lit_o is None:
-        y = model.predict(X_test).ravel()
+        y = model.predict(X).ravel()
     elif X_lit_img is None and X_lit_txt is None:
-        y = model.predict(X_test, X_lit_s, X_lit_o).ravel()
+        y = model.predict(X, X_lit_s, X_lit_o).ravel()
     else:
-        y = model.predict(X_test, X_lit_s, X_lit_o, X_lit_img, X_lit_txt).ravel()
+        y = model.predict(X, X_lit_s, X_lit_o, X_lit_img, X_lit_txt).ravel()
 
     scores_r[:, 0] = y
 
     for i, r in enumerate(np.arange(n_r)):  # [0 ... 4]
-        X_corr_r[:, 1] = r
+        X_corr_r[:, 1] = int(r)
 
         if X_lit_s is None or X_lit_o is None:
             y_r = model.predict(X_corr_r).ravel()
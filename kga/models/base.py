@@ -2,7 +2,6 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.autograd import Variable
 
 import kga.op as op
 import kga.util as util
@@ -26,10 +25,12 @@ class Model(nn.Module):
 
         Params:
         -------
-        X: int matrix of M x 3, where M is the (mini)batch size
+        X: int matrix or LongTensor of M x 3, where M is the (mini)batch size
             First row contains index of head entities.
             Second row contains index of relationships.
             Third row contains index of tail entities.
+            NumPy input is converted on every call, a LongTensor on the device
+            of the model is used as is.
 
         Returns:
         --------
@@ -38,13 +39,27 @@ class Model(nn.Module):
         """
         raise NotImplementedError
 
+    def as_tensor(self, X, dtype=None):
+        """
+        Input of forward, predict or predict_all, e.g. literals, as a tensor on
+        the device of the model. NumPy arrays are converted, tensors are used as
+        they are, see `kga.util.to_tensor`.
+        """
+        return util.to_tensor(X, dtype, self.gpu)
+
+    def as_long_tensor(self, X):
+        """
+        Triples or entity ids as a LongTensor on the device of the model.
+        """
+        return util.to_tensor(X, torch.long, self.gpu)
+
     def predict(self, X, sigmoid=False):
         """
         Predict the score of test batch.
 
         Params:
         -------
-        X: int matrix of M x 3, where M is the (mini)batch size
+        X: int matrix or LongTensor of M x 3, where M is the (mini)batch size
             First row contains index of head entities.
             Second row contains index of relationships.
             Third row contains index of tail entities.
@@ -86,10 +101,7 @@ class Model(nn.Module):
         --------
         loss: float
         """
-        if self.gpu:
-            y_true = Variable(torch.from_numpy(y_true.astype(np.float32)).cuda())
-        else:
-            y_true = Variable(torch.from_numpy(y_true.astype(np.float32)))
+        y_true = self.as_tensor(y_true, torch.float32)
 
         nll = F.binary_cross_entropy_with_logits(y_pred, y_true, size_average=average)
 
@@ -106,17 +118,54 @@ class Model(nn.Module):
 
         return nll + self.lam*nlp1 + self.lam*nlp2
 
-    def ranking_loss(self, y_pos, y_neg, margin=1, C=1, energy_based=False, average=True):
+    def _negative_matrix(self, y_neg, C):
+        """
+        View the C x M stacked negative scores, as built by
+        `np.vstack([sample_negatives(X_mb, n_e) for _ in range(C)])`, as an
+        M x C matrix: row i holds the negatives of positive i. No copy.
+        """
+        return y_neg.view(C, -1).t()
+
+    def negative_weights(self, scores_neg, temperature=None):
+        """
+        Self-adversarial weights of the negatives (Sun et al., 2019): softmax
+        over each positive's C negatives of their plausibility, scaled to sum
+        to C per positive. Harder negatives weigh more; with temperature None
+        all weights are 1. Detached, i.e. treated as constants.
+
+        Params:
+        -------
+        scores_neg: M x C plausibility scores, higher is more plausible
+
+        temperature: float, default: None
+            Softmax inverse temperature alpha. None disables the weighting.
+
+        Returns:
+        --------
+        weights: M x C, or None if disabled
+        """
+        if temperature is None:
+            return None
+
+        C = scores_neg.size(1)
+        return C * F.softmax(temperature * scores_neg.detach(), dim=1)
+
+    def ranking_loss(self, y_pos, y_neg, margin=1, C=1, energy_based=False, average=True, adversarial_temperature=None):
         """
-        Compute loss max margin ranking loss.
+        Compute loss max margin ranking loss, in one pass over the M x C
+        matrix of negative scores: no repeated positives, no target tensor.
+
+        Without weighting, equals
+        `F.margin_ranking_loss(y_pos.repeat(C), y_neg, target, margin)` with
+        target all ones (-1 if energy based).
 
         Params:
         -------
         y_pos: vector of size Mx1
             Contains scores for positive samples.
 
-        y_neg: np.array of size Mx1 (binary)
-            Contains the true labels.
+        y_neg: vector of size (M*C)x1
+            Contains scores for negative samples, C blocks of M.
 
         margin: float, default: 1
             Margin used for the loss.
@@ -130,27 +179,166 @@ class Model(nn.Module):
         average: bool, default: True
             Whether to average the loss or just summing it.
 
+        adversarial_temperature: float, default: None
+            Self-adversarial weighting of the negatives, see
+            `negative_weights`. None for the plain loss.
+
         Returns:
         --------
         loss: float
         """
-        M = y_pos.size(0)
+        y_pos = y_pos.view(-1, 1)
+        y_neg = self._negative_matrix(y_neg, C)
 
-        y_pos = y_pos.view(-1).repeat(C)  # repeat to match y_neg
-        y_neg = y_neg.view(-1)
+        if energy_based:
+            # y_neg should be higher than y_pos
+            losses = F.relu(margin + y_pos - y_neg)
+            weights = self.negative_weights(-y_neg, adversarial_temperature)
+        else:
+            losses = F.relu(margin - y_pos + y_neg)
+            weights = self.negative_weights(y_neg, adversarial_temperature)
 
-        target = Variable(torch.ones(M*C))
-        target = target.cuda() if self.gpu else target
+        if weights is not None:
+            losses = weights * losses
 
-        if energy_based:
-            # target = [-1, ..., -1], i.e. y_neg should be higher than y_pos
-            target = -target
+        return losses.mean() if average else losses.sum()
 
-        loss = F.margin_ranking_loss(
-            y_pos, y_neg, target, margin=margin, size_average=average
-        )
+    def logistic_loss(self, y_pos, y_neg, C=1, energy_based=False, average=True, adversarial_temperature=None, margin=0):
+        """
+        Logistic (softplus) loss over positives and their C negatives:
+
+            softplus(-(s_pos - margin)) + 1/C sum_j w_j softplus(s_neg_j - margin)
+
+        with s the plausibility scores (minus the energies if energy based)
+        and w the self-adversarial weights, all 1 without weighting.
+
+        Params:
+        -------
+        y_pos: vector of size Mx1
+            Contains scores for positive samples.
+
+        y_neg: vector of size (M*C)x1
+            Contains scores for negative samples, C blocks of M.
+
+        C: int, default: 1
+            Number of negative samples per positive sample.
+
+        energy_based: bool, default: False
+            Whether to treat score as energy => minimizing score.
+
+        average: bool, default: True
+            Whether to average the loss over the positives or just summing it.
+
+        adversarial_temperature: float, default: None
+            Self-adversarial weighting of the negatives, see
+            `negative_weights`. None for uniform weights.
+
+        margin: float, default: 0
+            Offset of the scores, e.g. gamma of distance-based models.
+
+        Returns:
+        --------
+        loss: float
+        """
+        sign = -1 if energy_based else 1
+
+        s_pos = sign * y_pos.view(-1) - margin
+        s_neg = sign * self._negative_matrix(y_neg, C) - margin
+
+        neg = F.softplus(s_neg)
+        weights = self.negative_weights(s_neg, adversarial_temperature)
 
-        return loss
+        if weights is not None:
+            neg = weights * neg
+
+        losses = F.softplus(-s_pos) + neg.mean(1)
+
+        return losses.mean() if average else losses.sum()
+
+    def negative_loss(self, name, y_pos, y_neg, **kwargs):
+        """
+        Loss of positive vs. negative scores by name: {'margin', 'logistic'},
+        see `ranking_loss` and `logistic_loss` for kwargs.
+        """
+        losses = {'margin': self.ranking_loss, 'logistic': self.logistic_loss}
+
+        if name not in losses:
+            raise ValueError('Unknown loss: {}'.format(name))
+
+        return losses[name](y_pos, y_neg, **kwargs)
+
+    # Batch-level unique-entity lookup, see `set_unique_lookup`
+    unique_lookup = False
+
+    def set_unique_lookup(self, unique=True):
+        """
+        Look up, and project, every distinct entity of a minibatch once, and
+        expand the results to the triples with the inverse index. With C
+        negatives per positive, heads or tails repeat up to C+1 times in a
+        batch, so this saves lookups and, for the literal models, the
+        projection of their literals. Scores are unchanged.
+        """
+        self.unique_lookup = unique
+
+    def unique_entities(self, s, o):
+        """
+        Distinct entities of the heads s and tails o of a minibatch.
+
+        Returns:
+        --------
+        uniq: LongTensor of n_u
+            Sorted distinct entities.
+
+        inv_s, inv_o: LongTensor of M
+            Position of every s, resp. o, in uniq, i.e. uniq[inv_s] == s.
+
+        rep: LongTensor of n_u
+            One position in torch.cat([s, o]) of every entity of uniq, to
+            gather per-triple inputs, e.g. literals, for uniq.
+        """
+        ents = torch.cat([s, o])
+        uniq, inv = torch.unique(ents, return_inverse=True)
+
+        positions = torch.arange(ents.size(0), device=ents.device)
+        rep = torch.zeros_like(uniq).scatter_(0, inv, positions)
+
+        return uniq, inv[:s.size(0)], inv[s.size(0):], rep
+
+    def embed_pair(self, emb, s, o):
+        """
+        emb(s), emb(o); a single lookup of the distinct entities if
+        `unique_lookup` is set.
+        """
+        if not self.unique_lookup:
+            return emb(s), emb(o)
+
+        uniq, inv_s, inv_o, _ = self.unique_entities(s, o)
+        e = emb(uniq)
+
+        return e[inv_s], e[inv_o]
+
+    def set_sparse_embeddings(self, sparse=True):
+        """
+        Make all `nn.Embedding` modules produce sparse gradients, i.e. only the
+        rows looked up in the minibatch are touched by the backward pass.
+        """
+        for m in self.modules():
+            if isinstance(m, nn.Embedding):
+                m.sparse = sparse
+
+    def sparse_parameters(self):
+        """
+        Parameters of the embedding modules that produce sparse gradients.
+        """
+        return [m.weight for m in self.modules()
+                if isinstance(m, nn.Embedding) and m.sparse]
+
+    def dense_parameters(self):
+        """
+        All parameters not returned by `sparse_parameters()`.
+        """
+        sparse = set(id(p) for p in self.sparse_parameters())
+        return [p for p in self.parameters() if id(p) not in sparse]
 
     def normalize_embeddings(self):
         for e in self.embeddings:
@@ -219,15 +407,15 @@ class RESCAL(Model):
             self.cuda()
 
     def forward(self, X):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
 
         # Project to embedding, each is M x k
-        e_hs = self.emb_E(hs).view(-1, self.k, 1)
-        e_ts = self.emb_E(ts).view(-1, self.k, 1)
+        e_hs, e_ts = self.embed_pair(self.emb_E, hs, ts)
+        e_hs = e_hs.view(-1, self.k, 1)
+        e_ts = e_ts.view(-1, self.k, 1)
         W = self.emb_R(ls).view(-1, self.k, self.k)  # M x k x k
 
         # Forward
@@ -238,8 +426,7 @@ class RESCAL(Model):
         return out
 
     def predict_all(self, X):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
@@ -310,15 +497,13 @@ class DistMult(Model):
             self.cuda()
 
     def forward(self, X):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
 
         # Project to embedding, each is M x k
-        e_hs = self.emb_E(hs)
-        e_ts = self.emb_E(ts)
+        e_hs, e_ts = self.embed_pair(self.emb_E, hs, ts)
         W = self.emb_R(ls)
 
         # Forward
@@ -327,8 +512,7 @@ class DistMult(Model):
         return f.view(-1, 1)
 
     def predict_all(self, X):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
@@ -420,16 +604,14 @@ class ERMLP(Model):
             self.cuda()
 
     def forward(self, X):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
 
         # Project to embedding, each is M x k
-        e_hs = self.emb_E(hs)
+        e_hs, e_ts = self.embed_pair(self.emb_E, hs, ts)
         e_ls = self.emb_R(ls)
-        e_ts = self.emb_E(ts)
 
         # Forward
         phi = torch.cat([e_hs, e_ls, e_ts], 1)  # M x 3k
@@ -443,8 +625,7 @@ class ERMLP(Model):
             - list of (s, p, all_others)
             - list of (all_others, p, o)
         """
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, p, o = X[:, 0], X[:, 1], X[:, 2]
@@ -527,20 +708,34 @@ class TransE(Model):
             self.cuda()
 
     def forward(self, X):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
 
-        e_hs = self.emb_E(hs)
-        e_ts = self.emb_E(ts)
+        e_hs, e_ts = self.embed_pair(self.emb_E, hs, ts)
         e_ls = self.emb_R(ls)
 
         f = self.energy(e_hs, e_ls, e_ts).view(-1, 1)
 
         return f
 
+    def predict_all(self, X):
+        X = self.as_long_tensor(X)
+
+        # Decompose X into head, relationship, tail
+        hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
+
+        e_hs = self.emb_E(hs)
+        e_ts = self.emb_E(ts)
+        e_ls = self.emb_R(ls)
+
+        # 1 x k against n_e x k, energies of n_e
+        y_s = self.energy(self.emb_E.weight, e_ls, e_ts).view(-1)
+        y_o = self.energy(e_hs, e_ls, self.emb_E.weight).view(-1)
+
+        return y_s, y_o
+
     def energy(self, h, l, t):
         if self.d == 'l1':
             out = torch.sum(torch.abs(h + l - t), 1)
@@ -609,8 +804,7 @@ class NTN(Model):
             self.cuda()
 
     def forward(self, X):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
@@ -704,8 +898,7 @@ class TransH(Model):
             self.cuda()
 
     def forward(self, X):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
@@ -2,7 +2,6 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.autograd import Variable
 
 import kga.op as op
 import kga.util as util
@@ -130,8 +129,7 @@ class MTKGNN_MovieLens(Model):
         y_sa: score for subject literal-pred task.
         y_oa: score for object literal-pred task.
         """
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, p, o = X[:, 0], X[:, 1], X[:, 2]
@@ -146,10 +144,8 @@ class MTKGNN_MovieLens(Model):
         y_er = self.ermlp(phi_er)
 
         if usr_attrs is not None or mov_attrs is not None:
-            usr_attrs = Variable(torch.from_numpy(usr_attrs))
-            usr_attrs = usr_attrs.cuda() if self.gpu else usr_attrs
-            mov_attrs = Variable(torch.from_numpy(mov_attrs))
-            mov_attrs = mov_attrs.cuda() if self.gpu else mov_attrs
+            usr_attrs = self.as_tensor(usr_attrs)
+            mov_attrs = self.as_tensor(mov_attrs)
 
             e_lit_usr = self.emb_lit_usr(usr_attrs)
             e_lit_mov = self.emb_lit_mov(mov_attrs)
@@ -282,8 +278,7 @@ class MTKGNN_YAGO(Model):
         y_sa: score for subject literal-pred task.
         y_oa: score for object literal-pred task.
         """
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, p, o = X[:, 0], X[:, 1], X[:, 2]
@@ -298,10 +293,8 @@ class MTKGNN_YAGO(Model):
         y_er = self.ermlp(phi_er)
 
         if s_attrs is not None or o_attrs is not None:
-            s_attrs = Variable(torch.from_numpy(s_attrs))
-            s_attrs = s_attrs.cuda() if self.gpu else s_attrs
-            o_attrs = Variable(torch.from_numpy(o_attrs))
-            o_attrs = o_attrs.cuda() if self.gpu else o_attrs
+            s_attrs = self.as_tensor(s_attrs)
+            o_attrs = self.as_tensor(o_attrs)
 
             e_lit_s = self.emb_lit(s_attrs)
             e_lit_o = self.emb_lit(o_attrs)
@@ -324,8 +317,7 @@ class MTKGNN_YAGO(Model):
             - list of (s, p, all_others)
             - list of (all_others, p, o)
         """
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, p, o = X[:, 0], X[:, 1], X[:, 2]
@@ -2,7 +2,6 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.autograd import Variable
 from torch.nn.init import xavier_normal, xavier_uniform
 import kga.op as op
 import kga.util as util
@@ -12,6 +11,85 @@ from kga.models.base import Model
 import pdb
 
 
+def embed_literal_bag(emb_bag, bag, gpu=False):
+    """
+    Value-weighted sum of attribute embeddings over sparse literals, i.e. the
+    dense product X_lit[ents] @ emb_bag.weight without materializing X_lit.
+
+    Params:
+    -------
+    emb_bag: nn.EmbeddingBag of n_l x d, mode='sum'
+
+    bag: tuple of (attrs, offsets, values)
+        See `kga.util.literal_bags`.
+
+    Returns:
+    --------
+    e_lit: torch.FloatTensor of M x d
+    """
+    attrs, offsets, values = [util.to_tensor(a, gpu=gpu) for a in bag]
+
+    return emb_bag(attrs, offsets, per_sample_weights=values)
+
+
+def sparse_literal_matmul(X_lit, W, gpu=False):
+    """
+    Sparse-dense product of a CSR literal table with `W`, for all entities at
+    once.
+
+    Params:
+    -------
+    X_lit: scipy.sparse matrix of n_e x n_l
+
+    W: torch.FloatTensor of n_l x d
+
+    Returns:
+    --------
+    e_lit: torch.FloatTensor of n_e x d
+    """
+    X = X_lit.tocoo()
+    idx = torch.from_numpy(np.vstack([X.row, X.col])).long()
+    S = torch.sparse_coo_tensor(idx, torch.from_numpy(X.data.astype(np.float32)), X.shape)
+    S = S.cuda() if gpu else S
+
+    return torch.sparse.mm(S, W)
+
+
+def unique_rows(X_s, X_o, rep):
+    """
+    Rows `rep` of np.concatenate([X_s, X_o]) without the concatenation, i.e.
+    the per-entity literals of the distinct entities of a minibatch, see
+    `Model.unique_entities`.
+    """
+    if torch.is_tensor(X_s):
+        return torch.cat([X_s, X_o])[rep.to(X_s.device)]
+
+    rep = rep.cpu().numpy()
+    from_s = rep < X_s.shape[0]
+
+    out = np.empty((len(rep),) + X_s.shape[1:], dtype=X_s.dtype)
+    out[from_s] = X_s[rep[from_s]]
+    out[~from_s] = X_o[rep[~from_s] - X_s.shape[0]]
+
+    return out
+
+
+def project_literals(fn, X_s, X_o, gpu=False, unique=None):
+    """
+    fn(X_s), fn(X_o) for the dense literal arrays of the heads and tails of a
+    minibatch. Given unique = (inv_s, inv_o, rep) of `Model.unique_entities`,
+    fn is applied once per distinct entity and expanded with the inverse
+    index.
+    """
+    if unique is None:
+        return fn(util.to_tensor(X_s, gpu=gpu)), fn(util.to_tensor(X_o, gpu=gpu))
+
+    inv_s, inv_o, rep = unique
+    e = fn(util.to_tensor(unique_rows(X_s, X_o, rep), gpu=gpu))
+
+    return e[inv_s], e[inv_o]
+
+
 @inherit_docstrings
 class ERLMLP_MovieLens(Model):
     """
@@ -73,8 +151,7 @@ class ERLMLP_MovieLens(Model):
     def forward(self, X, X_lit_usr, X_lit_mov, X_lit_img=None, X_lit_txt=None):
         M = X.shape[0]
 
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, r, o = X[:, 0], X[:, 1], X[:, 2]
@@ -87,27 +164,23 @@ class ERLMLP_MovieLens(Model):
         phi = torch.cat([e_usr, e_rat, e_mov], 1)
 
         if self.usr_lit:
-            X_lit_usr = Variable(torch.from_numpy(X_lit_usr))
-            X_lit_usr = X_lit_usr.cuda() if self.gpu else X_lit_usr
+            X_lit_usr = self.as_tensor(X_lit_usr)
 
             phi = torch.cat([phi, X_lit_usr], 1)
 
         if self.mov_lit:
-            X_lit_mov = Variable(torch.from_numpy(X_lit_mov))
-            X_lit_mov = X_lit_mov.cuda() if self.gpu else X_lit_mov
+            X_lit_mov = self.as_tensor(X_lit_mov)
 
             phi = torch.cat([phi, X_lit_mov], 1)
 
         if self.img_lit:
-            X_lit_img = Variable(torch.from_numpy(X_lit_img))
-            X_lit_img = X_lit_img.cuda() if self.gpu else X_lit_img
+            X_lit_img = self.as_tensor(X_lit_img)
             e_img = self.emb_img(X_lit_img)
 
             phi = torch.cat([phi, e_img], 1)
 
         if self.txt_lit:
-            X_lit_txt = Variable(torch.from_numpy(X_lit_txt))
-            X_lit_txt = X_lit_txt.cuda() if self.gpu else X_lit_txt
+            X_lit_txt = self.as_tensor(X_lit_txt)
             e_txt = self.emb_txt(X_lit_txt)
 
             phi = torch.cat([phi, e_txt], 1)
@@ -132,7 +205,15 @@ class ERLMLP(Model):
     ---------------------------------------------------
     """
 
-    def __init__(self, n_ent, n_rel, n_lit, k, h_dim, gpu=False, num_lit=False, img_lit=False, txt_lit=False):
+    def __init__(self, n_ent, n_rel, n_lit, k, h_dim, gpu=False, num_lit=False, img_lit=False, txt_lit=False, sparse_lit=False):
+        """
+        Params:
+        -------
+            sparse_lit: bool, default: False
+                Numerical literals are given as sparse (attribute, value)
+                bags, see `kga.util.literal_bags`, and projected to k dims by
+                an embedding bag instead of being concatenated densely.
+        """
         super(ERLMLP, self).__init__(gpu)
 
         # Hyperparams
@@ -144,11 +225,15 @@ class ERLMLP(Model):
         self.num_lit = num_lit
         self.img_lit = img_lit
         self.txt_lit = txt_lit
+        self.sparse_lit = sparse_lit
 
         # Nets
         self.emb_ent = nn.Embedding(n_ent, k)
         self.emb_rel = nn.Embedding(n_rel, k)
 
+        if sparse_lit:
+            self.emb_num = nn.EmbeddingBag(n_lit, k, mode='sum')
+
         self.emb_img = nn.Linear(512, self.k)
         self.emb_txt = nn.Linear(384, self.k)
 
@@ -156,7 +241,7 @@ class ERLMLP(Model):
         n_input = 3*k
 
         if num_lit:
-            n_input += 2*n_lit
+            n_input += 2*k if sparse_lit else 2*n_lit
         if img_lit:
             n_input += 2*k
         if txt_lit:
@@ -180,47 +265,43 @@ class ERLMLP(Model):
     def forward(self, X, X_lit_s, X_lit_o, X_lit_s_img, X_lit_o_img, X_lit_s_txt, X_lit_o_txt):
         M = X.shape[0]
 
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, r, o = X[:, 0], X[:, 1], X[:, 2]
 
-        # Project to embedding, each is M x k
-        e_s = self.emb_ent(s)
+        # Project to embedding, each is M x k. In unique mode, entities and
+        # their literals are projected once per distinct entity.
+        if self.unique_lookup:
+            uniq, inv_s, inv_o, rep = self.unique_entities(s, o)
+            unique = (inv_s, inv_o, rep)
+            e = self.emb_ent(uniq)
+            e_s, e_o = e[inv_s], e[inv_o]
+        else:
+            unique = None
+            e_s, e_o = self.emb_ent(s), self.emb_ent(o)
+
         e_r = self.emb_rel(r)
-        e_o = self.emb_ent(o)
 
         phi = torch.cat([e_s, e_r, e_o], 1)
 
-        if self.num_lit:
-            X_lit_s = Variable(torch.from_numpy(X_lit_s))
-            X_lit_s = X_lit_s.cuda() if self.gpu else X_lit_s
+        if self.num_lit and self.sparse_lit:
+            e_lit_s = embed_literal_bag(self.emb_num, X_lit_s, self.gpu)
+            e_lit_o = embed_literal_bag(self.emb_num, X_lit_o, self.gpu)
 
-            X_lit_o = Variable(torch.from_numpy(X_lit_o))
-            X_lit_o = X_lit_o.cuda() if self.gpu else X_lit_o
+            phi = torch.cat([phi, e_lit_s, e_lit_o], 1)
+        elif self.num_lit:
+            X_lit_s, X_lit_o = project_literals(lambda x: x, X_lit_s, X_lit_o, self.gpu, unique)
 
             phi = torch.cat([phi, X_lit_s, X_lit_o], 1)
 
         if self.img_lit:
-            X_img_s = Variable(torch.from_numpy(X_lit_s_img))
-            X_img_s = X_img_s.cuda() if self.gpu else X_img_s
-            e_img_s = self.emb_img(X_img_s)
-
-            X_img_o = Variable(torch.from_numpy(X_lit_o_img))
-            X_img_o = X_img_o.cuda() if self.gpu else X_img_o
-            e_img_o = self.emb_img(X_img_o)
+            e_img_s, e_img_o = project_literals(self.emb_img, X_lit_s_img, X_lit_o_img, self.gpu, unique)
 
             phi = torch.cat([phi, e_img_s, e_img_o], 1)
 
         if self.txt_lit:
-            X_txt_s = Variable(torch.from_numpy(X_lit_s_txt))
-            X_txt_s = X_txt_s.cuda() if self.gpu else X_txt_s
-            e_txt_s = self.emb_txt(X_txt_s)
-
-            X_txt_o = Variable(torch.from_numpy(X_lit_o_txt))
-            X_txt_o = X_txt_o.cuda() if self.gpu else X_txt_o
-            e_txt_o = self.emb_txt(X_txt_o)
+            e_txt_s, e_txt_o = project_literals(self.emb_txt, X_lit_s_txt, X_lit_o_txt, self.gpu, unique)
 
             phi = torch.cat([phi, e_txt_s, e_txt_o], 1)
 
@@ -238,8 +319,7 @@ class ERLMLP(Model):
             return y_pred.data.numpy()
 
     def predict_all(self, X, **kwargs):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, p, o = X[:, 0], X[:, 1], X[:, 2]
@@ -258,8 +338,10 @@ class ERLMLP(Model):
         phi_o = torch.cat([e_s_rep, e_r_rep, self.emb_ent.weight], 1)  # n_ent x 3k
 
         if self.num_lit:
-            X_lit = Variable(torch.from_numpy(kwargs['X_lit']))
-            X_lit = X_lit.cuda() if self.gpu else X_lit
+            if self.sparse_lit:
+                X_lit = sparse_literal_matmul(kwargs['X_lit'], self.emb_num.weight, self.gpu)
+            else:
+                X_lit = self.as_tensor(kwargs['X_lit'])
 
             X_lit_s_rep = X_lit[s].repeat(self.n_ent, 1)
             X_lit_o_rep = X_lit[o].repeat(self.n_ent, 1)
@@ -268,8 +350,7 @@ class ERLMLP(Model):
             phi_o = torch.cat([phi_o, X_lit_s_rep, X_lit], 1)
 
         if self.img_lit:
-            X_img = Variable(torch.from_numpy(kwargs['X_lit_img']))
-            X_img = X_img.cuda() if self.gpu else X_img
+            X_img = self.as_tensor(kwargs['X_lit_img'])
             e_img = self.emb_img(X_img)
 
             e_img_s_rep = e_img[s].repeat(self.n_ent, 1)
@@ -279,8 +360,7 @@ class ERLMLP(Model):
             phi_o = torch.cat([phi_o, e_img_s_rep, e_img], 1)
 
         if self.txt_lit:
-            X_txt = Variable(torch.from_numpy(kwargs['X_lit_txt']))
-            X_txt = X_txt.cuda() if self.gpu else X_txt
+            X_txt = self.as_tensor(kwargs['X_lit_txt'])
             e_txt = self.emb_txt(X_txt)
 
             e_txt_s_rep = e_txt[s].repeat(self.n_ent, 1)
@@ -328,8 +408,7 @@ class DistMult_MovieLens(Model):
             self.cuda()
 
     def forward(self, X):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, r, o = X[:, 0], X[:, 1], X[:, 2]
@@ -351,9 +430,22 @@ class ERMLP_literal1(Model):
     ER-MLP: Entity-Relation MLP
     ---------------------------
     Dong, Xin, et al. "Knowledge vault: A web-scale approach to probabilistic knowledge fusion." KDD, 2014.
+
+    Text literals are n_text x dim_text representations per entity, pooled
+    with learned attention weights. Pooling is a broadcast matmul over the
+    distinct entities of a batch. In eval mode the pooled vectors of all
+    entities are computed once and cached until the model goes back to
+    training mode or new weights are loaded.
     """
 
-    def __init__(self, n_e, n_r, k, h_dim, p, lam, n_numeric, n_text, dim_text, numeric=True, text=True, gpu=False):
+    def __init__(self, n_e, n_r, k, h_dim, p, lam, n_numeric, n_text, dim_text, text_literals=None, numeric=True, text=True, gpu=False):
+        """
+        Params:
+        -------
+            text_literals: np.array of n_e x n_text x dim_text, default: None
+                Text representations of every entity, zeros for entities
+                without text. Required if `text` is True.
+        """
         super(ERMLP_literal1, self).__init__(gpu)
 
         # Hyperparams
@@ -383,6 +475,12 @@ class ERMLP_literal1(Model):
             self.attn_weights_o = nn.Parameter(torch.randn(self.n_text, 1))
             n_input += 2*dim_text
 
+            # Not a parameter, hence not part of the state dict
+            self.text_literals = torch.from_numpy(np.asarray(text_literals, dtype=np.float32))
+            self.text_literals = self.text_literals.cuda() if self.gpu else self.text_literals
+
+        self._text_cache = None
+
         self.mlp = nn.Sequential(
             nn.Linear(n_input, h_dim),
             nn.ReLU(),
@@ -403,9 +501,49 @@ class ERMLP_literal1(Model):
         if self.gpu:
             self.cuda()
 
-    def forward(self, X, numeric_lit_s, numeric_lit_o, text_lit_s, text_lit_o):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+    def train(self, mode=True):
+        # The cached pooled vectors are only valid for the current weights
+        self._text_cache = None
+        return super(ERMLP_literal1, self).train(mode)
+
+    def load_state_dict(self, state_dict, *args, **kwargs):
+        self._text_cache = None
+        return super(ERMLP_literal1, self).load_state_dict(state_dict, *args, **kwargs)
+
+    def pool_text(self, attn_weights, ents):
+        """
+        Attention pooling of the text literals of `ents`, computed once per
+        distinct entity: (1 x n_text) broadcast against (u x n_text x dim_text).
+
+        Returns:
+        --------
+        pooled: torch.FloatTensor of len(ents) x dim_text
+        """
+        uniq, inverse = torch.unique(ents, return_inverse=True)
+        pooled = torch.matmul(attn_weights.t(), self.text_literals[uniq]).squeeze(1)
+        return pooled[inverse]
+
+    def text_cache(self):
+        """
+        Pooled text of all entities as subject and as object, each
+        n_e x dim_text. Only kept in eval mode.
+        """
+        if self._text_cache is not None:
+            return self._text_cache
+
+        with torch.no_grad():
+            cache = (
+                torch.einsum('t,etd->ed', self.attn_weights_s.view(-1), self.text_literals),
+                torch.einsum('t,etd->ed', self.attn_weights_o.view(-1), self.text_literals)
+            )
+
+        if not self.training:
+            self._text_cache = cache
+
+        return cache
+
+    def forward(self, X, numeric_lit_s, numeric_lit_o):
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
@@ -419,23 +557,18 @@ class ERMLP_literal1(Model):
         phi = torch.cat([e_hs, e_ts, e_ls], 1)
 
         if self.numeric:
-            numeric_lit_s = Variable(torch.from_numpy(numeric_lit_s))
-            numeric_lit_s = numeric_lit_s.cuda() if self.gpu else numeric_lit_s
-
-            numeric_lit_o = Variable(torch.from_numpy(numeric_lit_o))
-            numeric_lit_o = numeric_lit_o.cuda() if self.gpu else numeric_lit_o
+            numeric_lit_s = self.as_tensor(numeric_lit_s)
+            numeric_lit_o = self.as_tensor(numeric_lit_o)
 
             phi = torch.cat([phi, numeric_lit_s, numeric_lit_o], 1)
 
         if self.text:
-            text_lit_s = Variable(torch.from_numpy(text_lit_s))
-            text_lit_s = text_lit_s.cuda() if self.gpu else text_lit_s
-
-            text_lit_o = Variable(torch.from_numpy(text_lit_o))
-            text_lit_o = text_lit_o.cuda() if self.gpu else text_lit_o
-
-            weighted_text_s = torch.bmm(self.attn_weights_s.t().unsqueeze(0).repeat(len(X), 1, 1), text_lit_s).view(len(X), self.dim_text)
-            weighted_text_o = torch.bmm(self.attn_weights_o.t().unsqueeze(0).repeat(len(X), 1, 1), text_lit_o).view(len(X), self.dim_text)
+            if self.training:
+                weighted_text_s = self.pool_text(self.attn_weights_s, hs)
+                weighted_text_o = self.pool_text(self.attn_weights_o, ts)
+            else:
+                pooled_s, pooled_o = self.text_cache()
+                weighted_text_s, weighted_text_o = pooled_s[hs], pooled_o[ts]
 
             phi = torch.cat([phi, weighted_text_s, weighted_text_o], 1)
 
@@ -443,8 +576,8 @@ class ERMLP_literal1(Model):
 
         return y.view(-1, 1)
 
-    def predict(self, X, numeric_lit_s, numeric_lit_o, text_lit_s, text_lit_o):
-        y_pred = self.forward(X, numeric_lit_s, numeric_lit_o, text_lit_s, text_lit_o).view(-1, 1)
+    def predict(self, X, numeric_lit_s, numeric_lit_o):
+        y_pred = self.forward(X, numeric_lit_s, numeric_lit_o).view(-1, 1)
 
         if self.gpu:
             return y_pred.cpu().data.numpy()
@@ -452,70 +585,44 @@ class ERMLP_literal1(Model):
             return y_pred.data.numpy()
 
     def predict_all(self, X, **kwargs):
-        # WIP!
         """
         Let X be a triple (s, p, o), i.e. tensor of 1x3, return two lists:
             - list of (s, p, all_others)
             - list of (all_others, p, o)
-        Pass all of the (full matrix of) literals into kwargs.
+        Pass the n_e x n_numeric matrix of numerical literals as `X_lit`.
         """
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, p, o = X[:, 0], X[:, 1], X[:, 2]
 
-        # Load literals
-        if self.numeric:
-            num_lit_s = Variable(kwargs['numeric_lit_s'])
-            num_lit_s = num_lit_s.cuda() if self.gpu else num_lit_s
-            num_lit_o = Variable(kwargs['numeric_lit_o'])
-            num_lit_o = num_lit_o.cuda() if self.gpu else num_lit_o
-
-        if self.text:
-            txt_lit_s = Variable(kwargs['text_lit_s'])
-            txt_lit_s = txt_lit_s.cuda() if self.gpu else txt_lit_s
-            txt_lit_o = Variable(kwargs['text_lit_o'])
-            txt_lit_o = txt_lit_o.cuda() if self.gpu else txt_lit_o
-
-            weighted_text_s = torch.bmm(self.attn_weights_s.t().unsqueeze(0).repeat(len(X), 1, 1), text_lit_s).view(len(X), self.dim_text)
-            weighted_text_o = torch.bmm(self.attn_weights_o.t().unsqueeze(0).repeat(len(X), 1, 1), text_lit_o).view(len(X), self.dim_text)
-
         # Project to embedding, each is M x k
-        e_s = self.emb_ent(s)
-        e_r = self.emb_rel(p)
-        e_o = self.emb_ent(o)
+        e_s = self.emb_E(s)
+        e_r = self.emb_R(p)
+        e_o = self.emb_E(o)
 
-        # Predict o
         e_s_rep = e_s.repeat(self.n_e, 1)  # n_e x k
         e_r_rep = e_r.repeat(self.n_e, 1)  # n_e x k
+        e_o_rep = e_o.repeat(self.n_e, 1)  # n_e x k
 
-        phi_o = torch.cat([e_s_rep, e_r_rep, self.emb_E.weight], 1)
+        # Same feature order as in forward: s, o, p, literals of s, literals of o
+        phi_s = torch.cat([self.emb_E.weight, e_o_rep, e_r_rep], 1)
+        phi_o = torch.cat([e_s_rep, self.emb_E.weight, e_r_rep], 1)
 
         if self.numeric:
-            num_lit_s_rep = num_lit_s[s].repeat(self.n_e, 1)
-            phi_o = torch.cat([phi_o, num_lit_s_rep, num_lit_o], 1)
-
-        if self.text:
-            txt_lit_s_rep = weighted_text_s[s].repeat(self.n_e, 1)
-            phi_o = torch.cat([phi_o, txt_lit_s_rep, weighted_text_o], 1)
+            X_lit = self.as_tensor(kwargs['X_lit'])
 
-        y_o = self.ermlp(phi_o).view(-1)
-
-        # Predict s
-        e_o_rep = e_o.repeat(self.n_e, 1)
-
-        phi_s = torch.cat([self.emb_E.weight, e_r_rep, e_o_rep], 1)
-
-        if self.numeric:
-            num_lit_o_rep = num_lit_o[o].repeat(self.n_e, 1)
-            phi_s = torch.cat([phi_s, num_lit_s, num_lit_o_rep], 1)
+            phi_s = torch.cat([phi_s, X_lit, X_lit[o].repeat(self.n_e, 1)], 1)
+            phi_o = torch.cat([phi_o, X_lit[s].repeat(self.n_e, 1), X_lit], 1)
 
         if self.text:
-            txt_lit_o_rep = weighted_text_o[o].repeat(self.n_e, 1)
-            phi_s = torch.cat([phi_s, weighted_text_s, txt_lit_o_rep], 1)
+            pooled_s, pooled_o = self.text_cache()
 
-        y_s = self.ermlp(phi_s).view(-1)
+            phi_s = torch.cat([phi_s, pooled_s, pooled_o[o].repeat(self.n_e, 1)], 1)
+            phi_o = torch.cat([phi_o, pooled_s[s].repeat(self.n_e, 1), pooled_o], 1)
+
+        y_s = self.mlp(phi_s).view(-1)
+        y_o = self.mlp(phi_o).view(-1)
 
         return y_s, y_o
 
@@ -526,9 +633,32 @@ class ERMLP_literal2(Model):
     ER-MLP: Entity-Relation MLP
     ---------------------------
     Dong, Xin, et al. "Knowledge vault: A web-scale approach to probabilistic knowledge fusion." KDD, 2014.
+
+    Text literals are encoded by an LSTM over the entity descriptions in
+    `text_tokens`, packed by their true lengths so that the LSTM stops at the
+    end of every description. Entities without description are not encoded
+    and use a learned "no text" vector instead. During training, only the
+    unique entities of a batch are encoded. In eval mode, all descriptions
+    are encoded once into an n_e x k cache, which is dropped as soon as the
+    model goes back to training mode or new weights are loaded.
     """
 
-    def __init__(self, n_e, n_r, k, h_dim, p, lam, n_numeric, vocab_size, dim_text, pretrained_embeddings, batch_size, text_length, numeric=True, text=True, gpu=False):
+    def __init__(self, n_e, n_r, k, h_dim, p, lam, n_numeric, vocab_size, dim_text, pretrained_embeddings, text_tokens, text_lengths=None, numeric=True, text=True, gpu=False):
+        """
+        Params:
+        -------
+            pretrained_embeddings: np.array of vocab_size x dim_text or string
+                Initial word embeddings, or the path of the .npy matrix of
+                prepare_pretrained_text.py, which is memory-mapped.
+
+            text_tokens: np.array of n_e x text_length
+                Token ids of the description of every entity, padded. Any
+                integer dtype, e.g. the uint16 table of prepare_text_lstm.py.
+
+            text_lengths: np.array of n_e, default: None
+                Number of tokens of every description, 0 for entities without
+                text. Defaults to the full text_length for all entities.
+        """
         super(ERMLP_literal2, self).__init__(gpu)
 
         # Hyperparams
@@ -543,8 +673,6 @@ class ERMLP_literal2(Model):
         self.dim_text = dim_text
         self.numeric = numeric
         self.text = text
-        self.batch_size = batch_size
-        self.text_length = text_length
 
         # Nets
         self.emb_E = nn.Embedding(self.n_e, self.k)
@@ -558,12 +686,27 @@ class ERMLP_literal2(Model):
         if text:
             n_input += 2*self.k
             self.word_embeddings = nn.Embedding(self.vocab_size, self.dim_text)
-            self.word_embeddings.weight.data.copy_(torch.from_numpy(pretrained_embeddings))
+            if isinstance(pretrained_embeddings, str):
+                pretrained_embeddings = np.load(pretrained_embeddings, mmap_mode='r')
+            self.word_embeddings.weight.data.copy_(torch.tensor(np.asarray(pretrained_embeddings, dtype=np.float32)))
 
             self.lstm_s = nn.LSTM(self.dim_text, self.k)
             self.lstm_o = nn.LSTM(self.dim_text, self.k)
 
-            self.hidden = self.init_hidden()
+            self.no_text_s = nn.Parameter(torch.zeros(self.k))
+            self.no_text_o = nn.Parameter(torch.zeros(self.k))
+
+            if text_lengths is None:
+                text_lengths = np.full(len(text_tokens), np.shape(text_tokens)[1])
+
+            # Not parameters, hence not part of the state dict
+            # Token ids may be stored as uint16, which torch cannot wrap
+            self.text_tokens = torch.from_numpy(np.asarray(text_tokens, dtype=np.int64))
+            self.text_tokens = self.text_tokens.cuda() if self.gpu else self.text_tokens
+            self.text_lengths = torch.from_numpy(np.asarray(text_lengths)).long()
+            self.text_lengths = self.text_lengths.cuda() if self.gpu else self.text_lengths
+
+        self._text_cache = None
 
         self.mlp = nn.Sequential(
             nn.Linear(n_input, h_dim),
@@ -585,19 +728,88 @@ class ERMLP_literal2(Model):
         if self.gpu:
             self.cuda()
 
-    def init_hidden(self):
-        # the first is the hidden h
-        # the second is the cell  c
-        h = Variable(torch.zeros(1, self.batch_size, self.k))
-        h = h.cuda() if self.gpu else h
-        c = Variable(torch.zeros(1, self.batch_size, self.k))
-        c = c.cuda() if self.gpu else c
+    def train(self, mode=True):
+        # The cached encodings are only valid for the current weights
+        self._text_cache = None
+        return super(ERMLP_literal2, self).train(mode)
+
+    def load_state_dict(self, state_dict, *args, **kwargs):
+        self._text_cache = None
+        return super(ERMLP_literal2, self).load_state_dict(state_dict, *args, **kwargs)
+
+    def encode_text(self, ents, role):
+        """
+        Encode the descriptions of entities `ents`.
+
+        Params:
+        -------
+        ents: torch.LongTensor of m
+            Entity ids.
+
+        role: {'s', 'o'}
+            Whether to use the subject or the object encoder.
+
+        Returns:
+        --------
+        h: torch.FloatTensor of m x k
+            Hidden state at the last token of every description, or the "no
+            text" vector.
+        """
+        lstm, no_text = (self.lstm_s, self.no_text_s) if role == 's' else (self.lstm_o, self.no_text_o)
+
+        h = no_text.unsqueeze(0).repeat(ents.size(0), 1)
+
+        lengths = self.text_lengths[ents]
+        has_text = torch.nonzero(lengths > 0).view(-1)
+
+        if has_text.numel() == 0:
+            return h
 
-        return (h, c)
+        lengths = lengths[has_text]
+        tokens = self.text_tokens[ents[has_text], :int(lengths.max())]
 
-    def forward(self, X, numeric_lit_s, numeric_lit_o, text_lit_s, text_lit_o):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        # max_length x m x dim_text, packed so that padding is skipped
+        x = self.word_embeddings(tokens.t())
+        x = nn.utils.rnn.pack_padded_sequence(x, lengths.cpu(), enforce_sorted=False)
+        _, (h_n, _) = lstm(x)
+
+        return h.index_copy(0, has_text, h_n[-1])
+
+    def text_features(self, ents, role):
+        """
+        Like `encode_text`, but every distinct entity of `ents` is encoded only
+        once and the result is scattered back to the rows of the batch.
+        """
+        uniq, inverse = torch.unique(ents, return_inverse=True)
+        return self.encode_text(uniq, role)[inverse]
+
+    def text_cache(self, chunk_size=4096):
+        """
+        Encodings of all entities as subject and as object, each n_e x k,
+        computed once for the current weights. Only kept in eval mode.
+        """
+        if self._text_cache is not None:
+            return self._text_cache
+
+        with torch.no_grad():
+            h_s, h_o = [], []
+
+            for i in range(0, self.n_e, chunk_size):
+                ents = torch.arange(i, min(i + chunk_size, self.n_e)).long()
+                ents = ents.cuda() if self.gpu else ents
+
+                h_s.append(self.encode_text(ents, 's'))
+                h_o.append(self.encode_text(ents, 'o'))
+
+        cache = (torch.cat(h_s), torch.cat(h_o))
+
+        if not self.training:
+            self._text_cache = cache
+
+        return cache
+
+    def forward(self, X, numeric_lit_s, numeric_lit_o):
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
@@ -610,30 +822,18 @@ class ERMLP_literal2(Model):
         phi = torch.cat([e_hs, e_ts, e_ls], 1)
 
         if self.numeric:
-            numeric_lit_s = Variable(torch.from_numpy(numeric_lit_s))
-            numeric_lit_s = numeric_lit_s.cuda() if self.gpu else numeric_lit_s
-
-            numeric_lit_o = Variable(torch.from_numpy(numeric_lit_o))
-            numeric_lit_o = numeric_lit_o.cuda() if self.gpu else numeric_lit_o
+            numeric_lit_s = self.as_tensor(numeric_lit_s)
+            numeric_lit_o = self.as_tensor(numeric_lit_o)
 
             phi = torch.cat([phi, numeric_lit_s, numeric_lit_o], 1)
 
         if self.text:
-            text_lit_s = Variable(torch.from_numpy(text_lit_s))
-            text_lit_s = text_lit_s.cuda() if self.gpu else text_lit_s
-            text_lit_o = Variable(torch.from_numpy(text_lit_o))
-            text_lit_o = text_lit_o.cuda() if self.gpu else text_lit_o
-
-            embed_lit_s = self.word_embeddings(text_lit_s.t())
-            embed_lit_o = self.word_embeddings(text_lit_o.t())
-
-            x_s = embed_lit_s.view(self.text_length, self.batch_size, -1)
-            lstm_s_out, self.hidden = self.lstm_s(x_s, self.hidden)
-            lstm_s_out = lstm_s_out[-1]
-
-            x_p = embed_lit_o.view(self.text_length, self.batch_size, -1)
-            lstm_o_out, self.hidden = self.lstm_o(x_p, self.hidden)
-            lstm_o_out = lstm_o_out[-1]
+            if self.training:
+                lstm_s_out = self.text_features(hs, 's')
+                lstm_o_out = self.text_features(ts, 'o')
+            else:
+                h_s, h_o = self.text_cache()
+                lstm_s_out, lstm_o_out = h_s[hs], h_o[ts]
 
             phi = torch.cat([phi, lstm_s_out, lstm_o_out], 1)
 
@@ -641,8 +841,8 @@ class ERMLP_literal2(Model):
 
         return y.view(-1, 1)
 
-    def predict(self, X, numeric_lit_s, numeric_lit_o, text_lit_s, text_lit_o):
-        y_pred = self.forward(X, numeric_lit_s, numeric_lit_o, text_lit_s, text_lit_o).view(-1, 1)
+    def predict(self, X, numeric_lit_s, numeric_lit_o):
+        y_pred = self.forward(X, numeric_lit_s, numeric_lit_o).view(-1, 1)
 
         if self.gpu:
             return y_pred.cpu().data.numpy()
@@ -650,78 +850,44 @@ class ERMLP_literal2(Model):
             return y_pred.data.numpy()
 
     def predict_all(self, X, **kwargs):
-        # WIP!
         """
         Let X be a triple (s, p, o), i.e. tensor of 1x3, return two lists:
             - list of (s, p, all_others)
             - list of (all_others, p, o)
-        Pass all of the (full matrix of) literals into kwargs.
+        Pass the n_e x n_numeric matrix of numerical literals as `X_lit`.
         """
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         s, p, o = X[:, 0], X[:, 1], X[:, 2]
 
-        # Load literals
-        if self.numeric:
-            num_lit_s = Variable(kwargs['numeric_lit_s'])
-            num_lit_s = num_lit_s.cuda() if self.gpu else num_lit_s
-            num_lit_o = Variable(kwargs['numeric_lit_o'])
-            num_lit_o = num_lit_o.cuda() if self.gpu else num_lit_o
-
-        if self.text:
-            txt_lit_s = Variable(kwargs['text_lit_s'])
-            txt_lit_s = txt_lit_s.cuda() if self.gpu else txt_lit_s
-            txt_lit_o = Variable(kwargs['text_lit_o'])
-            txt_lit_o = txt_lit_o.cuda() if self.gpu else txt_lit_o
-
-            embed_lit_s = self.word_embeddings(txt_lit_s.t())
-            embed_lit_o = self.word_embeddings(txt_lit_o.t())
-
-            x_s = embed_lit_s.view(self.text_length, len(txt_lit_s), -1)
-            lstm_s_out, self.hidden = self.lstm_s(x_s, self.hidden)
-            lstm_s_out = lstm_s_out[-1]
-
-            x_p = embed_lit_o.view(self.text_length, len(txt_lit_o), -1)
-            lstm_o_out, self.hidden = self.lstm_o(x_p, self.hidden)
-            lstm_o_out = lstm_o_out[-1]
-
         # Project to embedding, each is M x k
-        e_s = self.emb_ent(s)
-        e_r = self.emb_rel(p)
-        e_o = self.emb_ent(o)
+        e_s = self.emb_E(s)
+        e_r = self.emb_R(p)
+        e_o = self.emb_E(o)
 
-        # Predict o
         e_s_rep = e_s.repeat(self.n_e, 1)  # n_e x k
         e_r_rep = e_r.repeat(self.n_e, 1)  # n_e x k
+        e_o_rep = e_o.repeat(self.n_e, 1)  # n_e x k
 
-        phi_o = torch.cat([e_s_rep, e_r_rep, self.emb_E.weight], 1)
+        # Same feature order as in forward: s, o, p, literals of s, literals of o
+        phi_s = torch.cat([self.emb_E.weight, e_o_rep, e_r_rep], 1)
+        phi_o = torch.cat([e_s_rep, self.emb_E.weight, e_r_rep], 1)
 
         if self.numeric:
-            num_lit_s_rep = num_lit_s[s].repeat(self.n_e, 1)
-            phi_o = torch.cat([phi_o, num_lit_s_rep, num_lit_o], 1)
-
-        if self.text:
-            txt_lit_s_rep = lstm_s_out[s].repeat(self.n_e, 1)
-            phi_o = torch.cat([phi_o, txt_lit_s_rep, lstm_o_out], 1)
-
-        y_o = self.ermlp(phi_o).view(-1)
-
-        # Predict s
-        e_o_rep = e_o.repeat(self.n_e, 1)
+            X_lit = self.as_tensor(kwargs['X_lit'])
 
-        phi_s = torch.cat([self.emb_E.weight, e_r_rep, e_o_rep], 1)
-
-        if self.numeric:
-            num_lit_o_rep = num_lit_o[o].repeat(self.n_e, 1)
-            phi_s = torch.cat([phi_s, num_lit_s, num_lit_o_rep], 1)
+            phi_s = torch.cat([phi_s, X_lit, X_lit[o].repeat(self.n_e, 1)], 1)
+            phi_o = torch.cat([phi_o, X_lit[s].repeat(self.n_e, 1), X_lit], 1)
 
         if self.text:
-            txt_lit_o_rep = lstm_o_out[o].repeat(self.n_e, 1)
-            phi_s = torch.cat([phi_s, lstm_s_out, txt_lit_o_rep], 1)
+            h_s, h_o = self.text_cache()
 
-        y_s = self.ermlp(phi_s).view(-1)
+            phi_s = torch.cat([phi_s, h_s, h_o[o].repeat(self.n_e, 1)], 1)
+            phi_o = torch.cat([phi_o, h_s[s].repeat(self.n_e, 1), h_o], 1)
+
+        y_s = self.mlp(phi_s).view(-1)
+        y_o = self.mlp(phi_o).view(-1)
 
         return y_s, y_o
 
@@ -767,22 +933,17 @@ class RESCAL_literal(Model):
             self.cuda()
 
     def forward(self, X, s_lit=None, o_lit=None, text_s=None, text_o=None):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         # Decompose X into head, relationship, tail
         hs, ls, ts = X[:, 0], X[:, 1], X[:, 2]
 
         if self.n_l is not None:
-            s_lit = Variable(torch.from_numpy(s_lit))
-            s_lit = s_lit.cuda() if self.gpu else s_lit
-            o_lit = Variable(torch.from_numpy(o_lit))
-            o_lit = o_lit.cuda() if self.gpu else o_lit
+            s_lit = self.as_tensor(s_lit)
+            o_lit = self.as_tensor(o_lit)
         if self.n_text is not None:
-            text_s = Variable(torch.from_numpy(text_s))
-            text_s = text_s.cuda() if self.gpu else text_s
-            text_o = Variable(torch.from_numpy(text_o))
-            text_o = text_o.cuda() if self.gpu else text_o
+            text_s = self.as_tensor(text_s)
+            text_o = self.as_tensor(text_o)
 
         # Project to embedding, each is M x k
         e_hs = self.emb_E(hs)
@@ -840,7 +1001,16 @@ class DistMultLiteral(Model):
     neural-embedding models." arXiv:1411.4072 (2014).
     """
 
-    def __init__(self, n_e, n_r, n_l, k, gpu=False):
+    def __init__(self, n_e, n_r, n_l, k, gpu=False, sparse_lit=False):
+        """
+        Params:
+        -------
+            sparse_lit: bool, default: False
+                Literals are given as sparse (attribute, value) bags, see
+                `kga.util.literal_bags`. The literal part of the projection is
+                then an embedding bag, which computes the same function as the
+                dense Linear(k+n_l, k).
+        """
         super(DistMultLiteral, self).__init__(gpu)
 
         # Hyperparams
@@ -848,11 +1018,17 @@ class DistMultLiteral(Model):
         self.n_r = n_r
         self.n_l = n_l
         self.k = k
+        self.sparse_lit = sparse_lit
 
         # Nets
         self.emb_E = nn.Embedding(self.n_e, self.k)
         self.emb_R = nn.Embedding(self.n_r, self.k)
-        self.emb_E_lit = nn.Linear(k+n_l, self.k)
+
+        if sparse_lit:
+            self.emb_E_lit = nn.Linear(k, self.k)
+            self.emb_lit = nn.EmbeddingBag(n_l, self.k, mode='sum')
+        else:
+            self.emb_E_lit = nn.Linear(k+n_l, self.k)
 
         self.embeddings = [self.emb_E, self.emb_R]
         self.initialize_embeddings()
@@ -861,20 +1037,38 @@ class DistMultLiteral(Model):
         if self.gpu:
             self.cuda()
 
+    def embed_entities(self, e, X_lit):
+        """
+        Combine entity embeddings `e` (M x k) with their literals, either a
+        dense M x n_l array or a sparse bag.
+        """
+        if self.sparse_lit:
+            return self.emb_E_lit(e) + embed_literal_bag(self.emb_lit, X_lit, self.gpu)
+
+        X_lit = self.as_tensor(X_lit)
+
+        return self.emb_E_lit(torch.cat([e, X_lit], 1))
+
     def forward(self, X, X_lit_s, X_lit_o):
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         s, p, o = X[:, 0], X[:, 1], X[:, 2]
 
-        X_lit_s = Variable(torch.from_numpy(X_lit_s))
-        X_lit_s = X_lit_s.cuda() if self.gpu else X_lit_s
-        X_lit_o = Variable(torch.from_numpy(X_lit_o))
-        X_lit_o = X_lit_o.cuda() if self.gpu else X_lit_o
-
         # Project to embedding, each is M x k
-        s = self.emb_E_lit(torch.cat([self.emb_E(s), X_lit_s], 1))
-        o = self.emb_E_lit(torch.cat([self.emb_E(o), X_lit_o], 1))
+        if self.unique_lookup and not self.sparse_lit:
+            uniq, inv_s, inv_o, rep = self.unique_entities(s, o)
+            e = self.embed_entities(self.emb_E(uniq), unique_rows(X_lit_s, X_lit_o, rep))
+            s, o = e[inv_s], e[inv_o]
+        elif self.unique_lookup:
+            # Literal bags are per triple, only the entity part is shared
+            uniq, inv_s, inv_o, _ = self.unique_entities(s, o)
+            e = self.emb_E_lit(self.emb_E(uniq))
+            s = e[inv_s] + embed_literal_bag(self.emb_lit, X_lit_s, self.gpu)
+            o = e[inv_o] + embed_literal_bag(self.emb_lit, X_lit_o, self.gpu)
+        else:
+            s = self.embed_entities(self.emb_E(s), X_lit_s)
+            o = self.embed_entities(self.emb_E(o), X_lit_o)
+
         W = self.emb_R(p)
 
         # Forward
@@ -895,26 +1089,33 @@ class DistMultLiteral(Model):
 
     def predict_all(self, X, **kwargs):
         # Relations
-        X = Variable(torch.from_numpy(X)).long()
-        X = X.cuda() if self.gpu else X
+        X = self.as_long_tensor(X)
 
         s, p, o = X[:, 0], X[:, 1], X[:, 2]
+        W = self.emb_R(p)
 
         # Literals
         X_lit = kwargs['X_lit']
-        X_lit = Variable(torch.from_numpy(X_lit))
-        X_lit = X_lit.cuda() if self.gpu else X_lit
 
-        X_lit_s = X_lit[s]
-        X_lit_o = X_lit[o]
+        if self.sparse_lit:
+            # n_e x k, the CSR table is multiplied without densifying it
+            all_ents = self.emb_E_lit(self.emb_E.weight) \
+                + sparse_literal_matmul(X_lit, self.emb_lit.weight, self.gpu)
 
-        # 1 x k
-        s = self.emb_E_lit(torch.cat([self.emb_E(s), X_lit_s], 1))
-        o = self.emb_E_lit(torch.cat([self.emb_E(o), X_lit_o], 1))
-        W = self.emb_R(p)
+            # 1 x k
+            s, o = all_ents[s], all_ents[o]
+        else:
+            X_lit = self.as_tensor(X_lit)
+
+            X_lit_s = X_lit[s]
+            X_lit_o = X_lit[o]
+
+            # 1 x k
+            s = self.emb_E_lit(torch.cat([self.emb_E(s), X_lit_s], 1))
+            o = self.emb_E_lit(torch.cat([self.emb_E(o), X_lit_o], 1))
 
-        # n_e x k
-        all_ents = self.emb_E_lit(torch.cat([self.emb_E.weight, X_lit], 1))
+            # n_e x k
+            all_ents = self.emb_E_lit(torch.cat([self.emb_E.weight, X_lit], 1))
 
         # <(1xk \odot 1xk), k x n_e> = 1 x n_e
         y_s = torch.mm(W * o, all_ents.t()).view(-1)
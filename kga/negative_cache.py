@@ -0,0 +1,232 @@
+import numpy as np
+import torch
+from time import time
+
+from kga.hogwild import default_forward
+from kga.util import relation_statistics
+
+
+class NegativeCache(object):
+    """
+    NSCaching-style hard negatives (Zhang et al., 2019). For every (s, r) key
+    of the training triples, a cache holds N1 tail candidates, and for every
+    (r, o) key N1 head candidates, all in two preallocated int arrays.
+    Negatives are drawn from the cache row of their triple, mixed with
+    uniform corruptions.
+
+    Cache rows are refreshed lazily: every `refresh_every` calls, the rows of
+    the current batch are re-scored together with N2 fresh random entities,
+    and N1 of them are kept, sampled by their softmax score. Only keys that
+    are trained on get refreshed, so the cost is amortized over training;
+    see `report()`.
+
+    Works with any model scoring triples through `forward_fn(model, X)`,
+    e.g. DistMult, TransE (energy_based=True) or ERLMLP with a `forward_fn`
+    gathering its literals.
+
+    Example usage:
+    --------------
+    sampler = NegativeCache(model, X_train, n_e, n_r, refresh_every=C)
+    X_neg_mb = np.vstack([sampler(X_mb) for _ in range(C)])
+    """
+
+    def __init__(self, model, X_train, n_e, n_r, N1=50, N2=50, p_uniform=0.1, refresh_every=1,
+                 temperature=1., energy_based=False, bern=False, forward_fn=None, score_batch=65536):
+        """
+        Params:
+        -------
+        model: kga.models.base.Model
+
+        X_train: int matrix of M x 3
+
+        n_e, n_r: int
+            Number of entities and relations in dataset.
+
+        N1: int, default: 50
+            Cache size per key.
+
+        N2: int, default: 50
+            Random candidates scored per key and refresh.
+
+        p_uniform: float, default: 0.1
+            Fraction of negatives drawn uniformly instead of from the cache.
+
+        refresh_every: int, default: 1
+            Refresh the cache rows of the sampled batch every n calls, e.g. C
+            to refresh once per minibatch of C negative blocks.
+
+        temperature: float, default: 1
+            Softmax temperature of the cache update. Lower keeps the highest
+            scoring candidates more greedily.
+
+        energy_based: bool, default: False
+            Whether lower scores are more plausible, as for TransE.
+
+        bern: bool, default: False
+            Corrupt head/tail with the per-relation probabilities of
+            `kga.util.BernSampler` instead of a fair coin.
+
+        forward_fn: function (model, X) -> scores, default: None
+            Defaults to `model.forward(X)`.
+
+        score_batch: int, default: 65536
+            Number of triples scored at once on refresh.
+        """
+        X_train = np.asarray(X_train)
+
+        self.model = model
+        self.n_e = n_e
+        self.n_r = n_r
+        self.N1 = N1
+        self.N2 = N2
+        self.p_uniform = p_uniform
+        self.refresh_every = refresh_every
+        self.temperature = temperature
+        self.sign = -1. if energy_based else 1.
+        self.forward_fn = forward_fn if forward_fn is not None else default_forward
+        self.score_batch = score_batch
+
+        if bern:
+            tph, hpt = relation_statistics(X_train, n_r)
+            total = tph + hpt
+            self.p_head = np.where(total > 0, tph / np.maximum(total, 1e-12), 0.5)
+        else:
+            self.p_head = np.full(n_r, 0.5)
+
+        # Sorted int64 codes of the (s, r) and (r, o) keys, looked up with
+        # searchsorted instead of dicts
+        self.keys_sr = np.unique(X_train[:, 0].astype(np.int64) * n_r + X_train[:, 1])
+        self.keys_ro = np.unique(X_train[:, 2].astype(np.int64) * n_r + X_train[:, 1])
+
+        dtype = np.int32 if n_e <= np.iinfo(np.int32).max else np.int64
+        self.tail_cache = np.random.randint(n_e, size=(len(self.keys_sr), N1)).astype(dtype)
+        self.head_cache = np.random.randint(n_e, size=(len(self.keys_ro), N1)).astype(dtype)
+
+        self.n_calls = 0
+        self.n_refreshes = 0
+        self.n_keys_refreshed = 0
+        self.refresh_time = 0.
+        self.sample_time = 0.
+
+    def _lookup(self, keys, codes):
+        idx = np.minimum(np.searchsorted(keys, codes), len(keys)-1)
+        return idx, keys[idx] == codes
+
+    def __call__(self, X):
+        """
+        Returns:
+        --------
+        X_corr: int matrix of M x 3
+            Copy of X with either the head or the tail of every triple
+            replaced.
+        """
+        start = time()
+
+        if self.refresh_every > 0 and self.n_calls % self.refresh_every == 0:
+            self.refresh(X)
+
+        self.n_calls += 1
+
+        M = X.shape[0]
+        X = np.asarray(X)
+        h, r, t = X[:, 0].astype(np.int64), X[:, 1].astype(np.int64), X[:, 2].astype(np.int64)
+
+        corrupt_head = np.random.random(M) < self.p_head[r]
+        col = np.random.randint(self.N1, size=M)
+
+        idx_sr, found_sr = self._lookup(self.keys_sr, h * self.n_r + r)
+        idx_ro, found_ro = self._lookup(self.keys_ro, t * self.n_r + r)
+
+        cached = np.where(corrupt_head, self.head_cache[idx_ro, col], self.tail_cache[idx_sr, col])
+
+        # Uniform draws: on purpose, and for keys not in the training set
+        uniform = (np.random.random(M) < self.p_uniform) | ~np.where(corrupt_head, found_ro, found_sr)
+        corr = np.where(uniform, np.random.randint(self.n_e, size=M), cached)
+
+        X_corr = np.copy(X)
+        X_corr[corrupt_head, 0] = corr[corrupt_head]
+        X_corr[~corrupt_head, 2] = corr[~corrupt_head]
+
+        self.sample_time += time() - start
+
+        return X_corr
+
+    def _score(self, X):
+        scores = []
+
+        for i in range(0, X.shape[0], self.score_batch):
+            y = self.forward_fn(self.model, X[i:i+self.score_batch])
+            scores.append(y.view(-1).cpu().numpy())
+
+        return self.sign * np.concatenate(scores)
+
+    def _refresh_rows(self, cache, keys, idx, head):
+        n = len(idx)
+        if n == 0:
+            return
+
+        candidates = np.hstack([cache[idx], np.random.randint(self.n_e, size=(n, self.N2))])
+
+        # Entity and relation of the key, the candidate fills the other slot
+        e = np.repeat(keys[idx] // self.n_r, candidates.shape[1])
+        r = np.repeat(keys[idx] % self.n_r, candidates.shape[1])
+        c = candidates.ravel()
+
+        X = np.stack([c, r, e] if head else [e, r, c], axis=1)
+        scores = self._score(X).reshape(n, -1)
+
+        # Gumbel top-k: N1 candidates sampled without replacement by softmax
+        # of their scores
+        gumbel = -np.log(-np.log(np.random.uniform(1e-12, 1., size=scores.shape)))
+        perturbed = scores / self.temperature + gumbel
+        top = np.argpartition(-perturbed, self.N1-1, axis=1)[:, :self.N1]
+
+        cache[idx] = np.take_along_axis(candidates, top, axis=1)
+
+    def refresh(self, X):
+        """
+        Re-score and update the cache rows of the keys of the triples X.
+        """
+        start = time()
+
+        X = np.asarray(X)
+        h, r, t = X[:, 0].astype(np.int64), X[:, 1].astype(np.int64), X[:, 2].astype(np.int64)
+
+        idx_sr, found_sr = self._lookup(self.keys_sr, h * self.n_r + r)
+        idx_ro, found_ro = self._lookup(self.keys_ro, t * self.n_r + r)
+        idx_sr, idx_ro = np.unique(idx_sr[found_sr]), np.unique(idx_ro[found_ro])
+
+        training = self.model.training
+        self.model.eval()
+
+        with torch.no_grad():
+            self._refresh_rows(self.tail_cache, self.keys_sr, idx_sr, head=False)
+            self._refresh_rows(self.head_cache, self.keys_ro, idx_ro, head=True)
+
+        self.model.train(training)
+
+        self.n_refreshes += 1
+        self.n_keys_refreshed += len(idx_sr) + len(idx_ro)
+        self.refresh_time += time() - start
+
+    def report(self, reset=True):
+        """
+        Refresh cost since the last report.
+
+        Returns:
+        --------
+        report: string
+        """
+        n_keys = len(self.keys_sr) + len(self.keys_ro)
+        report = ('neg. cache: {} refreshes; {} keys refreshed ({:.1f}% of {}); refresh {:.2f}s of {:.2f}s sampling'
+                  .format(self.n_refreshes, self.n_keys_refreshed,
+                          100. * self.n_keys_refreshed / max(n_keys, 1), n_keys,
+                          self.refresh_time, self.sample_time))
+
+        if reset:
+            self.n_refreshes = 0
+            self.n_keys_refreshed = 0
+            self.refresh_time = 0.
+            self.sample_time = 0.
+
+        return report
@@ -0,0 +1,414 @@
+import json
+import numpy as np
+import os
+import torch
+import torch.nn as nn
+from time import time
+
+from kga.models.base import DistMult, TransE
+from kga.models.literals import DistMultLiteral
+from kga.util import get_minibatches, literal_bags
+
+
+class PartitionedEmbeddingStore(object):
+    """
+    Entity embedding table split into `n_parts` contiguous buckets, each one
+    persisted as a memory-mapped `.npy` file together with its (row-wise
+    Adagrad) optimizer state. Only the partitions being trained on need to be
+    in memory.
+
+    Layout of `path`:
+        meta.json            n_e, k, n_parts
+        embeddings_{p}.npy   part_size x k, float32
+        adagrad_{p}.npy      part_size, float32
+    """
+
+    def __init__(self, path):
+        """
+        Open an existing store, see `PartitionedEmbeddingStore.create`.
+        """
+        self.path = path.rstrip('/')
+
+        with open('{}/meta.json'.format(self.path)) as f:
+            meta = json.load(f)
+
+        self.n_e = meta['n_e']
+        self.k = meta['k']
+        self.n_parts = meta['n_parts']
+        self.part_size = -(-self.n_e // self.n_parts)  # ceil
+
+    @classmethod
+    def create(cls, path, n_e, k, n_parts, randseed=9999):
+        """
+        Create a store with the same initialization as
+        `Model.initialize_embeddings`: uniform in [-6/sqrt(k), 6/sqrt(k)] and
+        renormalized into the unit ball. Partitions are written one by one.
+        """
+        path = path.rstrip('/')
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        with open('{}/meta.json'.format(path), 'w') as f:
+            json.dump({'n_e': n_e, 'k': k, 'n_parts': n_parts}, f)
+
+        store = cls(path)
+        rng = np.random.RandomState(randseed)
+        r = 6/np.sqrt(k)
+
+        for p in range(n_parts):
+            n = store.size(p)
+
+            W = rng.uniform(-r, r, size=[n, k]).astype(np.float32)
+            W /= np.maximum(np.linalg.norm(W, axis=1, keepdims=True), 1)
+
+            np.save(store._file('embeddings', p), W)
+            np.save(store._file('adagrad', p), np.zeros(n, dtype=np.float32))
+
+        return store
+
+    def _file(self, name, p):
+        return '{}/{}_{}.npy'.format(self.path, name, p)
+
+    def offset(self, p):
+        return p * self.part_size
+
+    def size(self, p):
+        return max(0, min(self.part_size, self.n_e - self.offset(p)))
+
+    def bucket(self, e):
+        """
+        Partition of each entity in `e`.
+        """
+        return e // self.part_size
+
+    def weight(self, p, mode='r'):
+        """
+        Memory-mapped embeddings of partition `p`.
+        """
+        return np.load(self._file('embeddings', p), mmap_mode=mode)
+
+    def load(self, p):
+        """
+        Read partition `p` and its optimizer state into memory.
+
+        Returns:
+        --------
+        W: torch.FloatTensor of size(p) x k
+        state: torch.FloatTensor of size(p)
+        """
+        W = torch.from_numpy(np.array(self.weight(p)))
+        state = torch.from_numpy(np.load(self._file('adagrad', p)))
+        return W, state
+
+    def save(self, p, W, state):
+        """
+        Write partition `p` and its optimizer state back to disk.
+        """
+        out = self.weight(p, mode='r+')
+        out[:] = W.numpy()
+        out.flush()
+        del out
+
+        np.save(self._file('adagrad', p), state.numpy())
+
+    def lookup(self, e):
+        """
+        Gather rows of arbitrary entities, reading only the needed rows.
+        """
+        e = np.asarray(e)
+        out = np.zeros([len(e), self.k], dtype=np.float32)
+        b = self.bucket(e)
+
+        for p in np.unique(b):
+            mask = b == p
+            out[mask] = self.weight(p)[e[mask] - self.offset(p)]
+
+        return torch.from_numpy(out)
+
+
+def bucket_triples(X, store, out_dir, chunk_size=1000000):
+    """
+    Pre-sort triples into bucket-pair shards `shard_{i}_{j}.npy` holding all
+    (s, p, o) with s in partition i and o in partition j. Two streaming passes
+    over `X` (count, then fill), so `X` can itself be memory-mapped.
+
+    Returns:
+    --------
+    counts: np.array of n_parts x n_parts
+        Number of triples in each shard.
+    """
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    P = store.n_parts
+    counts = np.zeros(P*P, dtype=np.int64)
+
+    for i in range(0, X.shape[0], chunk_size):
+        x = X[i:i+chunk_size]
+        pair = store.bucket(x[:, 0]) * P + store.bucket(x[:, 2])
+        counts += np.bincount(pair, minlength=P*P)
+
+    shards = [np.lib.format.open_memmap(
+        '{}/shard_{}_{}.npy'.format(out_dir, q // P, q % P), mode='w+',
+        dtype=np.int32, shape=(int(counts[q]), 3)) for q in range(P*P)]
+    cursor = np.zeros(P*P, dtype=np.int64)
+
+    for i in range(0, X.shape[0], chunk_size):
+        x = X[i:i+chunk_size]
+        pair = store.bucket(x[:, 0]) * P + store.bucket(x[:, 2])
+
+        for q in np.unique(pair):
+            rows = x[pair == q]
+            shards[q][cursor[q]:cursor[q]+len(rows)] = rows
+            cursor[q] += len(rows)
+
+    for shard in shards:
+        shard.flush()
+
+    return counts.reshape(P, P)
+
+
+def default_forward(model, X, X_global):
+    return model.forward(X)
+
+
+class PartitionedTrainer(object):
+    """
+    Train the entity embeddings of `DistMult`, `TransE` or `DistMultLiteral`
+    out of core. The epoch iterates over bucket pairs (i, j): partitions i and
+    j are loaded into a small local embedding table that temporarily replaces
+    `model.emb_E`, the (i, j) shard is trained with negatives drawn from the
+    loaded partitions, then both partitions and their row-wise Adagrad state
+    are written back. Relation embeddings and other dense weights stay in
+    memory and are trained with Adam.
+
+    Build the model with a small `n_e` (e.g. 1), as its own `emb_E` is
+    discarded anyway.
+    """
+
+    def __init__(self, model, store, shard_dir, mb_size=100, C=10, lr=0.01, weight_decay=0, margin=1, energy_based=False, average_loss=False, forward_fn=None):
+        """
+        Params:
+        -------
+            model: DistMult, TransE or DistMultLiteral
+                CPU model.
+
+            store: PartitionedEmbeddingStore
+                Entity embeddings.
+
+            shard_dir: string
+                Output directory of `bucket_triples`.
+
+            forward_fn: function (model, X_local, X_global) -> scores
+                How to score a batch. `X_local` contains entity ids into the
+                loaded partitions, `X_global` the original ids, e.g. to gather
+                the literals of `DistMultLiteral`. Default: model.forward(X_local).
+
+            The remaining params are the usual training hyperparameters.
+        """
+        self.model = model
+        self.store = store
+        self.shard_dir = shard_dir.rstrip('/')
+        self.mb_size = mb_size
+        self.C = C
+        self.lr = lr
+        self.margin = margin
+        self.energy_based = energy_based
+        self.average_loss = average_loss
+        self.forward_fn = forward_fn if forward_fn is not None else default_forward
+        self.eps = 1e-10
+
+        # Drop the in-memory entity table
+        old = model.emb_E
+        model.emb_E = nn.Embedding(1, store.k)
+        model.embeddings = [e for e in model.embeddings if e is not old]
+
+        params = [p for name, p in model.named_parameters() if not name.startswith('emb_E.')]
+        self.solver = torch.optim.Adam(params, lr=lr, weight_decay=weight_decay)
+
+    def _shard(self, i, j):
+        return np.load('{}/shard_{}_{}.npy'.format(self.shard_dir, i, j), mmap_mode='r')
+
+    def _corrupt(self, X, n_i, base_j, n_j):
+        # Corrupt heads within partition i and tails within partition j
+        M = X.shape[0]
+        X_corr = np.copy(X)
+        heads = np.random.rand(M) < 0.5
+
+        X_corr[heads, 0] = np.random.randint(n_i, size=heads.sum())
+        X_corr[~heads, 2] = base_j + np.random.randint(n_j, size=(~heads).sum())
+
+        return X_corr
+
+    def _adagrad_step(self, emb, state):
+        # Sparse gradient: only the rows looked up in the minibatch, summed
+        # over their occurrences by coalesce
+        g = emb.weight.grad
+        if g is None:
+            return
+
+        g = g.coalesce()
+        rows, g = g.indices()[0], g.values()
+
+        if rows.numel() == 0:
+            return
+
+        state[rows] += (g ** 2).mean(1)
+        emb.weight.data[rows] -= self.lr * g / (state[rows].sqrt() + self.eps).unsqueeze(1)
+        emb.weight.grad = None
+
+    def train_pair(self, i, j):
+        """
+        One pass over shard (i, j).
+
+        Returns:
+        --------
+        loss: float
+            Summed loss over the shard.
+        """
+        X = self._shard(i, j)
+
+        if X.shape[0] == 0:
+            return 0
+
+        off_i, off_j = self.store.offset(i), self.store.offset(j)
+        n_i, n_j = self.store.size(i), self.store.size(j)
+
+        W_i, state_i = self.store.load(i)
+
+        if i == j:
+            W, state, base_j = W_i, state_i, 0
+        else:
+            W_j, state_j = self.store.load(j)
+            W, state, base_j = torch.cat([W_i, W_j]), torch.cat([state_i, state_j]), n_i
+
+        emb = nn.Embedding(W.size(0), self.store.k, sparse=True)
+        emb.weight.data.copy_(W)
+        self.model.emb_E = emb
+
+        # Global -> local ids, and the inverse map for corrupted triples
+        to_global = np.concatenate([off_i + np.arange(n_i), off_j + np.arange(n_j)]) if i != j else off_i + np.arange(n_i)
+
+        loss_sum = 0
+
+        for X_mb in get_minibatches(np.asarray(X), self.mb_size, shuffle=True):
+            X_mb = X_mb.astype(np.int64)
+            X_mb[:, 0] -= off_i
+            X_mb[:, 2] += base_j - off_j
+
+            m = X_mb.shape[0]
+            X_neg_mb = np.vstack([self._corrupt(X_mb, n_i, base_j, n_j) for _ in range(self.C)])
+            X_local = np.vstack([X_mb, X_neg_mb])
+
+            X_global = np.copy(X_local)
+            X_global[:, 0] = to_global[X_local[:, 0]]
+            X_global[:, 2] = to_global[X_local[:, 2]]
+
+            y = self.forward_fn(self.model, X_local, X_global)
+            y_pos, y_neg = y[:m], y[m:]
+
+            loss = self.model.ranking_loss(
+                y_pos, y_neg, margin=self.margin, C=self.C,
+                energy_based=self.energy_based, average=self.average_loss
+            )
+
+            self.solver.zero_grad()
+            emb.weight.grad = None
+
+            loss.backward()
+
+            self.solver.step()
+            self._adagrad_step(emb, state)
+
+            loss_sum += loss.item()
+
+        W = emb.weight.data
+
+        self.store.save(i, W[:n_i], state[:n_i])
+        if i != j:
+            self.store.save(j, W[n_i:], state[n_i:])
+
+        return loss_sum
+
+    def train_epoch(self, verbose=True):
+        """
+        Visit all bucket pairs in random order.
+        """
+        P = self.store.n_parts
+        start = time()
+        loss_sum = 0
+
+        for q in np.random.permutation(P*P):
+            loss_sum += self.train_pair(q // P, q % P)
+
+        if verbose:
+            print('loss: {:.4f}; time: {:.2f}s'.format(loss_sum, time()-start))
+
+        return loss_sum
+
+
+class PartitionedScorer(object):
+    """
+    Batched all-entity scoring that streams the partitions of the store, one
+    at a time. Exposes `predict_all` so that it can be passed to
+    `kga.metrics.eval_embeddings_vertical` in place of the model. For `TransE`
+    the scores are energies, evaluate with `descending=False`.
+    """
+
+    def __init__(self, model, store, X_lit=None):
+        """
+        Params:
+        -------
+            model: DistMult, TransE or DistMultLiteral
+                Trained model (its `emb_E` is ignored).
+
+            store: PartitionedEmbeddingStore
+                Entity embeddings.
+
+            X_lit: np.array or scipy.sparse.csr_matrix of n_e x n_l, default: None
+                Entity literals, required for `DistMultLiteral`. CSR if the
+                model uses sparse literals.
+        """
+        self.model = model
+        self.store = store
+        self.X_lit = X_lit
+        self.n_e = store.n_e
+
+    def _entities(self, E, idxs):
+        if isinstance(self.model, DistMultLiteral):
+            if self.model.sparse_lit:
+                return self.model.embed_entities(E, literal_bags(self.X_lit, np.asarray(idxs)))
+            return self.model.embed_entities(E, np.asarray(self.X_lit[idxs], dtype=np.float32))
+
+        return E
+
+    def _score(self, q, W, E, side):
+        if isinstance(self.model, TransE):
+            # energy of (q + W - e) for tails, (e + W - q) for heads
+            diff = (q + W) - E if side == 'o' else E + (W - q)
+            if self.model.d == 'l1':
+                return diff.abs().sum(1)
+            return (diff ** 2).sum(1).sqrt()
+
+        return torch.mm(q * W, E.t()).view(-1)
+
+    def predict_all(self, X, **kwargs):
+        s, p, o = int(X[0, 0]), int(X[0, 1]), int(X[0, 2])
+
+        with torch.no_grad():
+            W = self.model.emb_R(torch.LongTensor([p]))
+            e_s = self._entities(self.store.lookup([s]), [s])
+            e_o = self._entities(self.store.lookup([o]), [o])
+
+            y_s, y_o = [], []
+
+            for part in range(self.store.n_parts):
+                off, n = self.store.offset(part), self.store.size(part)
+                idxs = np.arange(off, off+n)
+                E = self._entities(torch.from_numpy(np.array(self.store.weight(part))), idxs)
+
+                y_s.append(self._score(e_o, W, E, 's'))
+                y_o.append(self._score(e_s, W, E, 'o'))
+
+        return torch.cat(y_s), torch.cat(y_o)
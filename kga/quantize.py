@@ -0,0 +1,383 @@
+import numpy as np
+import os
+import torch
+import torch.nn as nn
+
+from kga.metrics import eval_embeddings_vertical
+
+
+class QuantizedTable(object):
+    """
+    Read-only n x d table stored as fp16, or as int8 with one float32 scale
+    per row (symmetric, scale = max |row| / 127). Rows are dequantized to
+    float32 when they are gathered, so only the rows of the current batch or
+    chunk ever exist in full precision.
+    """
+
+    DTYPES = ('fp32', 'fp16', 'int8')
+
+    def __init__(self, data, scale=None):
+        self.data = data
+        self.scale = scale
+
+    @classmethod
+    def quantize(cls, W, dtype='int8'):
+        """
+        Params:
+        -------
+        W: torch.Tensor or np.array of n x d
+
+        dtype: string, default: 'int8'
+            One of {'fp32', 'fp16', 'int8'}.
+
+        Returns:
+        --------
+        table: QuantizedTable
+        """
+        if dtype not in cls.DTYPES:
+            raise ValueError('Unknown dtype: {}, expected one of {}'.format(dtype, cls.DTYPES))
+
+        if not torch.is_tensor(W):
+            W = torch.from_numpy(np.ascontiguousarray(W))
+
+        W = W.detach().float().cpu()
+
+        if dtype == 'fp32':
+            return cls(W.clone())
+        if dtype == 'fp16':
+            return cls(W.half())
+
+        scale = W.abs().max(1)[0] / 127.
+        scale[scale == 0] = 1.
+
+        data = torch.round(W / scale.unsqueeze(1)).clamp(-127, 127).to(torch.int8)
+
+        return cls(data, scale)
+
+    @property
+    def shape(self):
+        return tuple(self.data.shape)
+
+    @property
+    def nbytes(self):
+        n = self.data.numel() * self.data.element_size()
+        if self.scale is not None:
+            n += self.scale.numel() * self.scale.element_size()
+        return n
+
+    def to(self, device):
+        scale = self.scale.to(device) if self.scale is not None else None
+        return QuantizedTable(self.data.to(device), scale)
+
+    def rows(self, idx):
+        """
+        Dequantized rows `idx` (LongTensor or slice), as float32.
+        """
+        W = self.data[idx].float()
+
+        if self.scale is not None:
+            W = W * self.scale[idx].unsqueeze(-1)
+
+        return W
+
+    def state(self):
+        return {'data': self.data, 'scale': self.scale}
+
+
+class QuantizedModel(object):
+    """
+    Inference-only copy of a trained model whose large tables, i.e. the
+    entity embeddings, the literal tables and the relation matrices of
+    RESCAL, are quantized with `QuantizedTable`. The remaining small modules
+    (relation embeddings, MLPs, literal projections) are kept in fp32.
+
+    Every model is reduced to an entity representation, computed from the
+    dequantized rows of the entities, and a score of (head, relation, tail)
+    representations that broadcasts over a chunk of entities. `predict_all`
+    scores all entities chunk by chunk, dequantizing on the fly, so it
+    plugs into `kga.metrics.eval_embeddings_vertical` like the fp32 model.
+
+    Supported: DistMult, RESCAL, TransE, ERMLP, DistMultLiteral and ERLMLP,
+    both with dense literals.
+
+    Example usage:
+    --------------
+    qmodel = QuantizedModel.from_model(model, dtype='int8', literals={'X_lit': X_lit})
+    qmodel.save('models/fb15k/distmult_literal.int8.pt')
+
+    qmodel = QuantizedModel.load('models/fb15k/distmult_literal.int8.pt')
+    y_s, y_o = qmodel.predict_all(X_test[:1])
+    """
+
+    def __init__(self, kind, tables, modules, config, chunk_size=4096, gpu=False):
+        self.kind = kind
+        self.tables = tables
+        self.modules = modules
+        self.config = config
+        self.chunk_size = chunk_size
+        self.gpu = gpu
+
+        self.n_e = tables['E'].shape[0]
+
+        for m in modules.values():
+            m.eval()
+
+        if gpu:
+            self.tables = {name: t.to('cuda') for name, t in tables.items()}
+            self.modules = {name: m.cuda() for name, m in modules.items()}
+
+    @classmethod
+    def from_model(cls, model, dtype='int8', literals=None, **kwargs):
+        """
+        Params:
+        -------
+        model: kga.models.base.Model
+            Trained fp32 model.
+
+        dtype: string, default: 'int8'
+            Storage of the tables: {'fp32', 'fp16', 'int8'}.
+
+        literals: dict, default: None
+            Entity-level literal tables of the literal models: 'X_lit' for
+            DistMultLiteral, 'X_lit', 'X_lit_img' and 'X_lit_txt' for ERLMLP,
+            as passed to their predict_all.
+
+        kwargs:
+            chunk_size, gpu, see `QuantizedModel`.
+
+        Returns:
+        --------
+        qmodel: QuantizedModel
+        """
+        literals = literals or {}
+        kind = type(model).__name__
+        config = {}
+
+        def q(W):
+            return QuantizedTable.quantize(W, dtype)
+
+        if kind in ('DistMult', 'ERMLP', 'TransE'):
+            tables = {'E': q(model.emb_E.weight)}
+            modules = {'rel': model.emb_R}
+            if kind == 'ERMLP':
+                modules['mlp'] = model.mlp
+            if kind == 'TransE':
+                config['d'] = model.d
+        elif kind == 'RESCAL':
+            tables = {'E': q(model.emb_E.weight), 'R': q(model.emb_R.weight)}
+            modules = {}
+            config['k'] = model.k
+        elif kind == 'DistMultLiteral':
+            if model.sparse_lit:
+                raise ValueError('Sparse literals are not supported')
+            tables = {'E': q(model.emb_E.weight), 'X_lit': q(literals['X_lit'])}
+            modules = {'rel': model.emb_R, 'lit': model.emb_E_lit}
+        elif kind == 'ERLMLP':
+            if model.sparse_lit:
+                raise ValueError('Sparse literals are not supported')
+            tables = {'E': q(model.emb_ent.weight)}
+            modules = {'rel': model.emb_rel, 'mlp': model.mlp}
+
+            for flag, name, module in [('num_lit', 'X_lit', None),
+                                       ('img_lit', 'X_lit_img', 'emb_img'),
+                                       ('txt_lit', 'X_lit_txt', 'emb_txt')]:
+                config[flag] = bool(getattr(model, flag))
+                if config[flag]:
+                    tables[name] = q(literals[name])
+                    if module is not None:
+                        modules[module] = getattr(model, module)
+        else:
+            raise ValueError('Quantization is not supported for {}'.format(kind))
+
+        return cls(kind, tables, modules, config, **kwargs)
+
+    def save(self, path):
+        """
+        Write tables, modules and config with `torch.save`. Only torch
+        classes are pickled, so it loads without the kga model classes.
+        """
+        state = {
+            'kind': self.kind,
+            'tables': {name: t.to('cpu').state() for name, t in self.tables.items()},
+            'modules': {name: m.cpu() for name, m in self.modules.items()},
+            'config': self.config
+        }
+
+        tmp = '{}.tmp'.format(path)
+        torch.save(state, tmp)
+        os.replace(tmp, path)
+
+        if self.gpu:
+            self.modules = {name: m.cuda() for name, m in self.modules.items()}
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        # Pickled modules and config, not a plain state dict
+        state = torch.load(path, map_location=lambda storage, loc: storage, weights_only=False)
+        tables = {name: QuantizedTable(t['data'], t['scale']) for name, t in state['tables'].items()}
+
+        return cls(state['kind'], tables, state['modules'], state['config'], **kwargs)
+
+    def nbytes(self):
+        """
+        Resident bytes of the tables and modules.
+        """
+        n = sum(t.nbytes for t in self.tables.values())
+        n += sum(p.numel() * p.element_size() for m in self.modules.values() for p in m.parameters())
+        return n
+
+    # Entity representations and scores
+    # ---------------------------------
+
+    def entities(self, idx):
+        """
+        Representation of the entities `idx`: a tensor, or a list of tensors
+        for ERLMLP (embedding, then one per literal kind).
+        """
+        e = self.tables['E'].rows(idx)
+
+        if self.kind == 'DistMultLiteral':
+            return self.modules['lit'](torch.cat([e, self.tables['X_lit'].rows(idx)], 1))
+
+        if self.kind == 'ERLMLP':
+            reps = [e]
+            if self.config['num_lit']:
+                reps.append(self.tables['X_lit'].rows(idx))
+            if self.config['img_lit']:
+                reps.append(self.modules['emb_img'](self.tables['X_lit_img'].rows(idx)))
+            if self.config['txt_lit']:
+                reps.append(self.modules['emb_txt'](self.tables['X_lit_txt'].rows(idx)))
+            return reps
+
+        return e
+
+    def relations(self, r):
+        if self.kind == 'RESCAL':
+            k = self.config['k']
+            return self.tables['R'].rows(r).view(-1, k, k)
+        return self.modules['rel'](r)
+
+    def score(self, h, r, t):
+        """
+        Scores of head, relation and tail representations of M or 1 rows,
+        broadcast to M.
+        """
+        if self.kind in ('DistMult', 'DistMultLiteral'):
+            return torch.sum(h * r * t, 1)
+
+        if self.kind == 'RESCAL':
+            return torch.sum(torch.matmul(h.unsqueeze(1), r).squeeze(1) * t, 1)
+
+        if self.kind == 'TransE':
+            if self.config['d'] == 'l1':
+                return torch.sum(torch.abs(h + r - t), 1)
+            return torch.sqrt(torch.sum((h + r - t)**2, 1))
+
+        if self.kind == 'ERMLP':
+            h, r, t = torch.broadcast_tensors(h, r, t)
+            return self.modules['mlp'](torch.cat([h, r, t], 1)).view(-1)
+
+        # ERLMLP: [e_s, e_r, e_o, lit_s, lit_o, ...]
+        M = max(h[0].size(0), r.size(0), t[0].size(0))
+        parts = [h[0], r, t[0]]
+        for lit_h, lit_t in zip(h[1:], t[1:]):
+            parts += [lit_h, lit_t]
+        parts = [x.expand(M, x.size(1)) for x in parts]
+
+        return self.modules['mlp'](torch.cat(parts, 1)).view(-1)
+
+    def _to_long(self, X):
+        if not torch.is_tensor(X):
+            X = torch.from_numpy(np.asarray(X))
+        X = X.long()
+        return X.cuda() if self.gpu else X
+
+    def forward(self, X):
+        X = self._to_long(X)
+
+        with torch.no_grad():
+            return self.score(self.entities(X[:, 0]), self.relations(X[:, 1]), self.entities(X[:, 2])).view(-1, 1)
+
+    def predict(self, X):
+        return self.forward(X).cpu().numpy()
+
+    def predict_all(self, X, **kwargs):
+        """
+        Scores of (e, r, o) and (s, r, e) for all entities e of the triple X
+        of 1 x 3, as in the predict_all of the fp32 models. Literal kwargs are
+        ignored, the quantized tables are used instead.
+        """
+        X = self._to_long(X)
+        s, r, o = X[:, 0], X[:, 1], X[:, 2]
+
+        y_s = torch.empty(self.n_e, device=X.device)
+        y_o = torch.empty(self.n_e, device=X.device)
+
+        with torch.no_grad():
+            h, rel, t = self.entities(s), self.relations(r), self.entities(o)
+
+            for start in range(0, self.n_e, self.chunk_size):
+                end = min(start + self.chunk_size, self.n_e)
+                ents = self.entities(slice(start, end))
+
+                y_s[start:end] = self.score(ents, rel, t)
+                y_o[start:end] = self.score(h, rel, ents)
+
+        return y_s, y_o
+
+
+def model_nbytes(model, literals=None):
+    """
+    Resident bytes of an fp32 model and the literal tables it is served with.
+    """
+    n = sum(p.numel() * p.element_size() for p in model.parameters())
+    n += sum(np.asarray(X).nbytes for X in (literals or {}).values() if X is not None)
+    return n
+
+
+def accuracy_report(model, qmodels, X_test, n_e, filter_h=None, filter_t=None, k=[1, 3, 10],
+                    descending=True, n_sample=None, literals=None, randseed=9999):
+    """
+    Filtered MR, MRR and Hits@k of the fp32 model and its quantized copies,
+    with `eval_embeddings_vertical` on the same test triples, and their
+    memory.
+
+    Params:
+    -------
+    model: kga.models.base.Model
+
+    qmodels: dict
+        Name, e.g. the dtype, to QuantizedModel.
+
+    descending: bool, default: True
+        False for energy-based models, e.g. TransE.
+
+    n_sample: int, default: None
+        Number of test triples, all if None.
+
+    literals: dict, default: None
+        Literal kwargs of model.predict_all, e.g. {'X_lit': X_lit}.
+
+    Returns:
+    --------
+    report: string
+    """
+    literals = literals or {}
+    rows = []
+
+    base = model_nbytes(model, literals)
+
+    for name, m, nbytes in [('fp32', model, base)] + [(n, q, q.nbytes()) for n, q in qmodels.items()]:
+        # Same test triples for every model
+        np.random.seed(randseed)
+
+        mr, mrr, hits = eval_embeddings_vertical(
+            m, X_test, n_e, k, filter_h, filter_t, descending=descending, n_sample=n_sample, **literals
+        )
+
+        rows.append('{:>5}: {:8.1f} MiB ({:.2f}x); MR: {:.2f}; MRR: {:.4f}; {}'.format(
+            name, nbytes / 2.**20, base / nbytes, mr, mrr,
+            '; '.join('Hits@{}: {:.4f}'.format(r, h) for r, h in zip(k, hits))
+        ))
+
+    return '\n'.join(rows)
@@ -0,0 +1,296 @@
+import numpy as np
+import os
+from time import time
+
+
+RELATION_TYPES = ['1-1', '1-N', 'N-1', 'N-N']
+
+
+def power_law_cdf(n, alpha):
+    """
+    Cumulative distribution of a truncated power law over `n` ranks, i.e.
+    p(i) is proportional to (i+1)^(-alpha).
+
+    Params:
+    -------
+    n: int
+        Number of ranks (entities or relations).
+
+    alpha: float
+        Exponent of the power law. Zero gives uniform distribution.
+
+    Returns:
+    --------
+    cdf: np.array of n, float64
+        Can be used with `np.searchsorted` to draw ranks.
+    """
+    w = np.arange(1, n+1, dtype=np.float64) ** -alpha
+    cdf = np.cumsum(w)
+    cdf /= cdf[-1]
+    return cdf
+
+
+class SyntheticKG(object):
+    """
+    Generator of synthetic knowledge graphs with literals. Everything is
+    computed on the fly from a handful of per-relation parameters, so that
+    the triples can be emitted chunk by chunk without ever holding the whole
+    graph in memory.
+
+    Entity degrees follow a power law. Each relation is assigned one of the
+    cardinality types in `RELATION_TYPES`:
+        - '1-1': tail is a bijection of the head.
+        - '1-N': every tail has exactly one head, heads have ~fanout tails.
+        - 'N-1': every head has exactly one tail, tails have ~fanout heads.
+        - 'N-N': head and tail are drawn independently.
+    """
+
+    def __init__(self, n_e, n_r, alpha=1.0, rel_alpha=0.5, cardinality=(0.1, 0.2, 0.2, 0.5), fanout=10, seed=9999):
+        """
+        Params:
+        -------
+            n_e: int
+                Number of entities.
+
+            n_r: int
+                Number of relations.
+
+            alpha: float, default: 1.0
+                Power law exponent of the entity degree distribution.
+
+            rel_alpha: float, default: 0.5
+                Power law exponent of the relation frequency distribution.
+
+            cardinality: tuple of 4 floats, default: (0.1, 0.2, 0.2, 0.5)
+                Proportion of relations of type 1-1, 1-N, N-1, N-N.
+
+            fanout: int, default: 10
+                Average number of tails per head (1-N) or heads per tail (N-1).
+
+            seed: int, default: 9999
+                Random seed.
+        """
+        self.n_e = n_e
+        self.n_r = n_r
+        self.alpha = alpha
+        self.rel_alpha = rel_alpha
+        self.fanout = fanout
+        self.rng = np.random.RandomState(seed)
+
+        # Shuffle ranks so that entity/relation ids are not sorted by degree
+        self.ent_perm = self.rng.permutation(n_e)
+        self.rel_perm = self.rng.permutation(n_r)
+        self.ent_cdf = power_law_cdf(n_e, alpha)
+        self.rel_cdf = power_law_cdf(n_r, rel_alpha)
+
+        p = np.asarray(cardinality, dtype=np.float64)
+        self.rel_type = self.rng.choice(len(RELATION_TYPES), size=n_r, p=p/p.sum())
+
+        # Per relation affine map x -> (a*x + b) mod n_e, with gcd(a, n_e) = 1
+        # so that it is a bijection over the entities.
+        self.rel_a = np.array([self._coprime(n_e) for _ in range(n_r)], dtype=np.int64)
+        self.rel_b = self.rng.randint(n_e, size=n_r).astype(np.int64)
+        self.n_pool = max(1, n_e // fanout)
+
+        self._vocab_cdf = None
+
+    def _coprime(self, n):
+        while True:
+            a = self.rng.randint(1, max(2, n))
+            if np.gcd(a, n) == 1:
+                return a
+
+    def _draw_entities(self, size):
+        ranks = np.searchsorted(self.ent_cdf, self.rng.random_sample(size))
+        return self.ent_perm[np.minimum(ranks, self.n_e-1)]
+
+    def _draw_relations(self, size):
+        ranks = np.searchsorted(self.rel_cdf, self.rng.random_sample(size))
+        return self.rel_perm[np.minimum(ranks, self.n_r-1)]
+
+    def _bijection(self, x, r):
+        return (self.rel_a[r] * x + self.rel_b[r]) % self.n_e
+
+    def _parent(self, x, r):
+        # Many-to-one map into a pool of n_e / fanout entities
+        return self.ent_perm[self._bijection(x, r) % self.n_pool]
+
+    def triples(self, size):
+        """
+        Draw `size` triples.
+
+        Returns:
+        --------
+        X: np.array of size x 3, int32
+        """
+        r = self._draw_relations(size)
+        h = self._draw_entities(size)
+        t = self._draw_entities(size)
+
+        types = self.rel_type[r]
+
+        m = types == 0  # 1-1
+        t[m] = self._bijection(h[m], r[m])
+        m = types == 1  # 1-N
+        h[m] = self._parent(t[m], r[m])
+        m = types == 2  # N-1
+        t[m] = self._parent(h[m], r[m])
+
+        return np.stack([h, r, t], axis=1).astype(np.int32)
+
+    def numerical_literals(self, start, end, n_lit, density):
+        """
+        Dense numerical literals for entities [start, end). Missing values are
+        zero, as in the preprocessed FB15k/YAGO literal matrices.
+        """
+        n = end - start
+        X = self.rng.lognormal(mean=0, sigma=2, size=[n, n_lit]).astype(np.float32)
+        X[self.rng.random_sample([n, n_lit]) >= density] = 0
+        return X
+
+    def text_tokens(self, start, end, text_len, vocab_size, coverage):
+        """
+        Token ids of entity descriptions for entities [start, end), padded
+        with 0 (the `<PAD/>` id). Entities without description have length 0.
+        """
+        n = end - start
+        lengths = np.minimum(self.rng.geometric(min(1, 2/text_len), size=n), text_len)
+        lengths[self.rng.random_sample(n) >= coverage] = 0
+
+        if self._vocab_cdf is None or len(self._vocab_cdf) != vocab_size-1:
+            self._vocab_cdf = power_law_cdf(vocab_size-1, 1.0)
+
+        tokens = np.searchsorted(self._vocab_cdf, self.rng.random_sample([n, text_len])) + 1
+        tokens = np.minimum(tokens, vocab_size-1)
+        tokens[np.arange(text_len)[None, :] >= lengths[:, None]] = 0
+
+        return tokens.astype(np.int32), lengths.astype(np.int32)
+
+    def image_literals(self, start, end, dim=512):
+        """
+        Non-negative dense features mimicking ResNet-18 pooled activations.
+        """
+        return np.abs(self.rng.randn(end-start, dim)).astype(np.float32)
+
+
+def _open(path, shape, dtype):
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+
+def _write_triples(kg, path, n, chunk_size):
+    X = _open(path, (n, 3), np.int32)
+
+    for i in range(0, n, chunk_size):
+        j = min(i + chunk_size, n)
+        X[i:j] = kg.triples(j - i)
+
+    X.flush()
+    del X
+
+
+def generate(out_dir, n_e, n_r, n_triples, n_val=5000, n_test=5000, n_lit=0, lit_density=0.05, text_len=0, vocab_size=10000, text_coverage=0.8, image=False, chunk_size=1000000, verbose=True, **kwargs):
+    """
+    Generate a synthetic knowledge graph with literals and write it in the
+    same `bin/*.npy` layout as the bundled datasets, so that it can be loaded
+    with e.g. `run_baselines.py --dataset <name>`.
+
+    All arrays are written through memory-mapped `.npy` files in chunks of
+    `chunk_size` rows, hence memory usage does not depend on `n_triples`.
+
+    Params:
+    -------
+    out_dir: string
+        Dataset directory, e.g. `data/synthetic-10m`. Files go to `out_dir/bin`.
+
+    n_e, n_r: int
+        Number of entities and relations.
+
+    n_triples: int
+        Number of training triples.
+
+    n_val, n_test: int, default: 5000
+        Number of validation and test triples.
+
+    n_lit: int, default: 0
+        Number of numerical literal attributes. Zero to skip.
+
+    lit_density: float, default: 0.05
+        Fraction of present (non-zero) numerical literals.
+
+    text_len: int, default: 0
+        Max number of tokens of text literals. Zero to skip.
+
+    vocab_size: int, default: 10000
+        Vocabulary size of text literals, id 0 is reserved for padding.
+
+    text_coverage: float, default: 0.8
+        Fraction of entities having a text literal.
+
+    image: bool, default: False
+        Whether to generate 512-d image literals.
+
+    chunk_size: int, default: 1000000
+        Number of rows generated and written at once.
+
+    kwargs:
+        Passed to `SyntheticKG`: alpha, rel_alpha, cardinality, fanout, seed.
+    """
+    bin_dir = '{}/bin'.format(out_dir.rstrip('/'))
+
+    if not os.path.exists(bin_dir):
+        os.makedirs(bin_dir)
+
+    start = time()
+    kg = SyntheticKG(n_e, n_r, **kwargs)
+
+    # Dictionaries
+    width = len(str(n_e))
+    idx2ent = _open('{}/idx2ent.npy'.format(bin_dir), (n_e,), '<U{}'.format(width+1))
+    for i in range(0, n_e, chunk_size):
+        j = min(i + chunk_size, n_e)
+        idx2ent[i:j] = np.char.add('e', np.arange(i, j).astype(str))
+    idx2ent.flush()
+    del idx2ent
+
+    np.save('{}/idx2rel.npy'.format(bin_dir), np.array(['r{}'.format(r) for r in range(n_r)]))
+    np.save('{}/relation_types.npy'.format(bin_dir), np.array(RELATION_TYPES)[kg.rel_type])
+
+    # Triples
+    for name, n in [('val', n_val), ('test', n_test), ('train', n_triples)]:
+        _write_triples(kg, '{}/{}.npy'.format(bin_dir, name), n, chunk_size)
+
+        if verbose:
+            print('{}: {} triples written ({:.1f}s)'.format(name, n, time()-start))
+
+    # Literals
+    tables = []
+
+    if n_lit > 0:
+        X_lit = _open('{}/numerical_literals.npy'.format(bin_dir), (n_e, n_lit), np.float32)
+        tables.append(X_lit)
+    if text_len > 0:
+        X_tok = _open('{}/text_tokens.npy'.format(bin_dir), (n_e, text_len), np.int32)
+        X_len = _open('{}/text_lengths.npy'.format(bin_dir), (n_e,), np.int32)
+        tables += [X_tok, X_len]
+    if image:
+        X_img = _open('{}/image_literals.npy'.format(bin_dir), (n_e, 512), np.float32)
+        tables.append(X_img)
+
+    # Literal rows are much wider than triples
+    lit_chunk = max(1, chunk_size // 64)
+
+    for i in range(0, n_e, lit_chunk):
+        j = min(i + lit_chunk, n_e)
+
+        if n_lit > 0:
+            X_lit[i:j] = kg.numerical_literals(i, j, n_lit, lit_density)
+        if text_len > 0:
+            X_tok[i:j], X_len[i:j] = kg.text_tokens(i, j, text_len, vocab_size, text_coverage)
+        if image:
+            X_img[i:j] = kg.image_literals(i, j)
+
+    for X in tables:
+        X.flush()
+
+    if verbose:
+        print('Done in {:.1f}s'.format(time()-start))
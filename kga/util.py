@@ -1,5 +1,8 @@
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+import torch
+from functools import partial
 from inspect import getmembers, isfunction
 from sklearn.utils import shuffle as skshuffle
 from time import time
@@ -7,6 +10,38 @@ from time import time
 import kga.metrics
 
 
+def to_tensor(X, dtype=None, gpu=False):
+    """
+    X as a torch tensor, e.g. the triples or literals of a minibatch. Tensors
+    already of `dtype` and on the device are returned as is, without a copy;
+    NumPy arrays are converted, sharing their memory where possible.
+
+    Params:
+    -------
+    X: np.array or torch.Tensor
+
+    dtype: torch.dtype, default: None
+        Keep the dtype of X if None.
+
+    gpu: bool, default: False
+        Move X to the GPU.
+
+    Returns:
+    --------
+    X: torch.Tensor
+    """
+    if not torch.is_tensor(X):
+        X = torch.from_numpy(np.asarray(X))
+
+    if dtype is not None:
+        X = X.to(dtype)
+
+    if gpu and not X.is_cuda:
+        X = X.cuda()
+
+    return X
+
+
 def sample_negatives(X, n_e):
     """
     Perform negative sampling by corrupting head or tail of each triplets in
@@ -142,6 +177,180 @@ def sample_negatives_rel(X, n_r):
     return np.array(X_corr, dtype=int)
 
 
+class AliasTable(object):
+    """
+    Walker's alias method: O(n) setup, then O(1) vectorized draws from a
+    discrete distribution over n items.
+
+    Params:
+    -------
+    weights: np.array of n
+        Non-negative, unnormalized probabilities.
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        n = len(weights)
+
+        prob = weights * n / weights.sum()
+        alias = np.arange(n)
+
+        small = list(np.where(prob < 1)[0])
+        large = list(np.where(prob >= 1)[0])
+
+        while small and large:
+            s, l = small.pop(), large.pop()
+            alias[s] = l
+            prob[l] -= 1 - prob[s]
+            (small if prob[l] < 1 else large).append(l)
+
+        # Leftovers are 1 up to rounding
+        prob[small + large] = 1
+
+        self.prob = prob
+        self.alias = alias
+
+    def draw(self, size):
+        i = np.random.randint(len(self.prob), size=size)
+        return np.where(np.random.random(size) < self.prob[i], i, self.alias[i])
+
+
+def relation_statistics(X, n_r):
+    """
+    Average number of tails per head (tph) and heads per tail (hpt) of every
+    relation, as in the "bern" sampling of Wang et al., 2014.
+
+    Params:
+    -------
+    X: int matrix of M x 3
+        Training triples.
+
+    n_r: int
+        Number of relations in dataset.
+
+    Returns:
+    --------
+    tph, hpt: np.array of n_r
+        Zero for relations not in X.
+    """
+    X = np.asarray(X)
+    n_triples = np.bincount(X[:, 1], minlength=n_r).astype(np.float64)
+
+    # Distinct (r, h) and (r, t) pairs per relation
+    n_heads = np.bincount(np.unique(X[:, [1, 0]], axis=0)[:, 0], minlength=n_r)
+    n_tails = np.bincount(np.unique(X[:, [1, 2]], axis=0)[:, 0], minlength=n_r)
+
+    tph = n_triples / np.maximum(n_heads, 1)
+    hpt = n_triples / np.maximum(n_tails, 1)
+
+    return tph, hpt
+
+
+class BernSampler(object):
+    """
+    Degree-aware corruption: the head of a triple of relation r is corrupted
+    with probability tph / (tph + hpt), its tail otherwise. 1-N relations then
+    mostly get corrupted heads and N-1 ones corrupted tails, which avoids
+    false and trivially easy negatives. Statistics are computed once from the
+    training triples; drawing is fully vectorized.
+
+    Example usage:
+    --------------
+    sampler = BernSampler(X_train, n_e, n_r)
+    X_neg_mb = np.vstack([sampler(X_mb) for _ in range(C)])
+    """
+
+    def __init__(self, X_train, n_e, n_r, n_s=None, n_o=None, bern=True, weighting='uniform'):
+        """
+        Params:
+        -------
+        X_train: int matrix of M x 3
+
+        n_e: int
+            Number of entities in dataset.
+
+        n_r: int
+            Number of relations in dataset.
+
+        n_s, n_o: int, default: None
+            Number of subjects and objects, if their sets differ, as in
+            `sample_negatives_decoupled`. Default to n_e.
+
+        bern: bool, default: True
+            Whether to corrupt head/tail with the per-relation probabilities,
+            or with a fair coin as `sample_negatives`.
+
+        weighting: {'uniform', 'frequency'}, default: 'uniform'
+            Replacement entities uniformly, or by their (add-one smoothed)
+            frequency as head, resp. tail, in X_train.
+        """
+        X_train = np.asarray(X_train)
+
+        self.n_s = n_e if n_s is None else n_s
+        self.n_o = n_e if n_o is None else n_o
+
+        if bern:
+            tph, hpt = relation_statistics(X_train, n_r)
+            total = tph + hpt
+            # Relations unseen in training: fair coin
+            self.p_head = np.where(total > 0, tph / np.maximum(total, 1e-12), 0.5)
+        else:
+            self.p_head = np.full(n_r, 0.5)
+
+        if weighting == 'frequency':
+            self.heads = AliasTable(np.bincount(X_train[:, 0], minlength=self.n_s)[:self.n_s] + 1)
+            self.tails = AliasTable(np.bincount(X_train[:, 2], minlength=self.n_o)[:self.n_o] + 1)
+        elif weighting == 'uniform':
+            self.heads = self.tails = None
+        else:
+            raise ValueError('Unknown weighting: {}'.format(weighting))
+
+    def _draw(self, table, n, size):
+        return np.random.randint(n, size=size) if table is None else table.draw(size)
+
+    def __call__(self, X):
+        """
+        Returns:
+        --------
+        X_corr: int matrix of M x 3
+            Copy of X with either the head or the tail of every triple
+            replaced.
+        """
+        M = X.shape[0]
+
+        corrupt_head = np.random.random(M) < self.p_head[X[:, 1]]
+        idx_s = np.where(corrupt_head)[0]
+        idx_o = np.where(~corrupt_head)[0]
+
+        X_corr = np.copy(X)
+        X_corr[idx_s, 0] = self._draw(self.heads, self.n_s, len(idx_s))
+        X_corr[idx_o, 2] = self._draw(self.tails, self.n_o, len(idx_o))
+
+        return X_corr
+
+
+def make_sampler(name, X_train, n_e, n_r, model=None, **kwargs):
+    """
+    Negative sampler of the `--sampler` flags: {'uniform', 'bern',
+    'bern_freq', 'nscaching'}. Returns a picklable function of a minibatch X,
+    as `sample_negatives` with n_e bound.
+
+    'nscaching' needs the `model`, kwargs go to
+    `kga.negative_cache.NegativeCache`.
+    """
+    if name == 'uniform':
+        return partial(sample_negatives, n_e=n_e)
+    if name == 'bern':
+        return BernSampler(X_train, n_e, n_r)
+    if name == 'bern_freq':
+        return BernSampler(X_train, n_e, n_r, weighting='frequency')
+    if name == 'nscaching':
+        from kga.negative_cache import NegativeCache
+        return NegativeCache(model, X_train, n_e, n_r, **kwargs)
+
+    raise ValueError('Unknown sampler: {}'.format(name))
+
+
 def get_dictionary(dataset_dir):
     """
     Let X be file consists of triples, return idx2ent and idx2rel dictionaries.
@@ -251,6 +460,128 @@ def load_data(file_path, idx2ent, idx2rel):
         return X
 
 
+def load_literals(dataset_dir, name='numerical_literals', mmap_mode='r'):
+    """
+    Load an entity-level literal table and its present/missing mask. Rows are
+    indexed by entity id, e.g. `X_lit[X_mb[:, 0]]` for the subjects of a
+    minibatch.
+
+    Params:
+    -------
+    dataset_dir: string
+        Directory containing `{name}.npy` and optionally `{name}_mask.npy`,
+        e.g. `data/fb15k-literal/bin`.
+
+    name: string, default: 'numerical_literals'
+        Name of the table.
+
+    mmap_mode: {None, 'r'}, default: 'r'
+        Memory-map the table instead of reading it, so that load time does
+        not depend on its size.
+
+    Returns:
+    --------
+    X_lit: np.array of n_e x n_l
+
+    mask: np.array of n_e x n_l, bool
+        True where the literal is present. Derived from the non-zero entries
+        if there is no mask file.
+    """
+    dataset_dir = dataset_dir.rstrip('/')
+
+    X_lit = np.load('{}/{}.npy'.format(dataset_dir, name), mmap_mode=mmap_mode)
+
+    try:
+        mask = np.load('{}/{}_mask.npy'.format(dataset_dir, name), mmap_mode=mmap_mode)
+    except IOError:
+        mask = X_lit != 0
+
+    return X_lit, mask
+
+
+def load_sparse_literals(dataset_dir, name='numerical_literals'):
+    """
+    Load an entity-level literal table stored as CSR, `{name}.npz`. Only the
+    present (entity, attribute, value) entries are stored, so memory scales
+    with the number of literals instead of n_e x n_l.
+
+    Returns:
+    --------
+    X_lit: scipy.sparse.csr_matrix of n_e x n_l
+    """
+    return sp.load_npz('{}/{}.npz'.format(dataset_dir.rstrip('/'), name)).tocsr()
+
+
+def literal_bags(X_lit, ents):
+    """
+    Gather the sparse literals of `ents` as flat (attribute id, value) pairs,
+    the input format of `nn.EmbeddingBag` with per-sample weights.
+
+    Params:
+    -------
+    X_lit: scipy.sparse.csr_matrix of n_e x n_l
+        Entity-level literals.
+
+    ents: np.array of M
+        Entity ids.
+
+    Returns:
+    --------
+    bag: tuple of (attrs, offsets, values)
+        attrs, values: np.array of the total number of literals of `ents`.
+        offsets: np.array of M, start of the literals of each entity.
+    """
+    starts = X_lit.indptr[ents]
+    counts = X_lit.indptr[ents+1] - starts
+
+    offsets = np.zeros(len(ents), dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)[:-1]
+
+    # Position of every literal inside X_lit.indices/data
+    pos = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+    return X_lit.indices[pos].astype(np.int64), offsets, X_lit.data[pos].astype(np.float32)
+
+
+def sample_literals(X_lit, ents):
+    """
+    Sample one present attribute per entity, e.g. as regression target of the
+    attribute nets of MT-KGNN.
+
+    Params:
+    -------
+    X_lit: scipy.sparse.csr_matrix of n_e x n_l
+        Entity-level literals.
+
+    ents: np.array of M
+        Entity ids.
+
+    Returns:
+    --------
+    attrs: np.array of M
+        Sampled attribute ids, 0 for entities without literals.
+
+    values: np.array of M, float32
+        Values of the sampled attributes, 0 for entities without literals.
+
+    has_lit: np.array of M, bool
+        Whether the entity has any literal, i.e. whether the sample is valid.
+    """
+    starts = X_lit.indptr[ents]
+    counts = X_lit.indptr[ents+1] - starts
+    has_lit = counts > 0
+
+    pos = starts + (np.random.rand(len(ents)) * counts).astype(np.int64)
+    pos = pos[has_lit]
+
+    attrs = np.zeros(len(ents), dtype=np.int64)
+    values = np.zeros(len(ents), dtype=np.float32)
+    attrs[has_lit] = X_lit.indices[pos]
+    values[has_lit] = X_lit.data[pos]
+
+    return attrs, values, has_lit
+
+
 def get_minibatches(X, mb_size, shuffle=True):
     """
     Generate minibatches from given dataset for training.
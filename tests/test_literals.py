@@ -0,0 +1,68 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+torch = pytest.importorskip('torch')
+sp = pytest.importorskip('scipy.sparse')
+
+from kga.models.literals import DistMultLiteral
+from kga.util import literal_bags
+
+
+n_e, n_r, n_l, k = 12, 3, 6, 4
+
+
+@pytest.fixture
+def X_lit():
+    rng = np.random.RandomState(0)
+    X = sp.random(n_e, n_l, density=0.3, format='csr', random_state=rng, dtype=np.float32)
+
+    # A present literal of value 0 is still a stored entry
+    X[0, 0] = 0
+
+    return X
+
+
+def test_sparse_predict_all_equals_forward(X_lit):
+    torch.manual_seed(0)
+    model = DistMultLiteral(n_e=n_e, n_r=n_r, n_l=n_l, k=k, sparse_lit=True)
+    model.eval()
+
+    X = np.array([[1, 2, 5]])
+
+    with torch.no_grad():
+        y_s, y_o = model.predict_all(X, X_lit=X_lit)
+
+        ents = np.arange(n_e)
+
+        X_s = np.repeat(X, n_e, 0)
+        X_s[:, 0] = ents
+        X_o = np.repeat(X, n_e, 0)
+        X_o[:, 2] = ents
+
+        y_s_fwd = model.forward(X_s, literal_bags(X_lit, X_s[:, 0]), literal_bags(X_lit, X_s[:, 2])).view(-1)
+        y_o_fwd = model.forward(X_o, literal_bags(X_lit, X_o[:, 0]), literal_bags(X_lit, X_o[:, 2])).view(-1)
+
+    assert y_s.shape == (n_e,) and y_o.shape == (n_e,)
+    assert torch.allclose(y_s, y_s_fwd, atol=1e-5)
+    assert torch.allclose(y_o, y_o_fwd, atol=1e-5)
+
+
+def test_sparse_predict_all_equals_dense(X_lit):
+    torch.manual_seed(0)
+    sparse = DistMultLiteral(n_e=n_e, n_r=n_r, n_l=n_l, k=k, sparse_lit=True)
+    dense = DistMultLiteral(n_e=n_e, n_r=n_r, n_l=n_l, k=k)
+
+    # Linear(k+n_l, k) on [e, x] == Linear(k, k) on e + x @ emb_lit.weight
+    with torch.no_grad():
+        dense.emb_E.weight.copy_(sparse.emb_E.weight)
+        dense.emb_R.weight.copy_(sparse.emb_R.weight)
+        dense.emb_E_lit.weight.copy_(torch.cat([sparse.emb_E_lit.weight, sparse.emb_lit.weight.t()], 1))
+        dense.emb_E_lit.bias.copy_(sparse.emb_E_lit.bias)
+
+        X = np.array([[3, 0, 7]])
+
+        y_s, y_o = sparse.predict_all(X, X_lit=X_lit)
+        y_s_dense, y_o_dense = dense.predict_all(X, X_lit=X_lit.toarray())
+
+    assert torch.allclose(y_s, y_s_dense, atol=1e-5)
+    assert torch.allclose(y_o, y_o_dense, atol=1e-5)
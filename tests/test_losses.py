@@ -0,0 +1,84 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+F = torch.nn.functional
+
+from kga.models.base import DistMult
+
+
+M, C = 7, 5
+
+
+@pytest.fixture
+def model():
+    return DistMult(n_e=10, n_r=3, k=4, lam=0)
+
+
+@pytest.fixture
+def scores():
+    torch.manual_seed(0)
+    return torch.randn(M, 1), torch.randn(M*C, 1)
+
+
+@pytest.mark.parametrize('energy_based', [False, True])
+@pytest.mark.parametrize('average', [False, True])
+def test_ranking_loss_equals_margin_ranking_loss(model, scores, energy_based, average):
+    y_pos, y_neg = scores
+    margin = 1.
+
+    target = -torch.ones(M*C) if energy_based else torch.ones(M*C)
+    expected = F.margin_ranking_loss(
+        y_pos.repeat(C, 1).view(-1), y_neg.view(-1), target, margin=margin,
+        reduction='mean' if average else 'sum'
+    )
+
+    loss = model.ranking_loss(y_pos, y_neg, margin=margin, C=C, energy_based=energy_based,
+                              average=average, adversarial_temperature=None)
+
+    assert torch.allclose(loss, expected, atol=1e-6)
+
+
+@pytest.mark.parametrize('energy_based', [False, True])
+@pytest.mark.parametrize('average', [False, True])
+def test_ranking_loss_uniform_weights(model, scores, energy_based, average):
+    y_pos, y_neg = scores
+    kwargs = dict(margin=1., C=C, energy_based=energy_based, average=average)
+
+    # Zero temperature: softmax of the negatives is uniform, all weights 1
+    loss = model.ranking_loss(y_pos, y_neg, adversarial_temperature=None, **kwargs)
+    loss_uniform = model.ranking_loss(y_pos, y_neg, adversarial_temperature=0., **kwargs)
+
+    assert torch.allclose(loss, loss_uniform, atol=1e-6)
+
+
+@pytest.mark.parametrize('energy_based', [False, True])
+@pytest.mark.parametrize('average', [False, True])
+def test_logistic_loss_uniform_weights(model, scores, energy_based, average):
+    y_pos, y_neg = scores
+    sign = -1 if energy_based else 1
+
+    # Reference on the repeated positives: C pairs of one positive and one negative
+    s_pos = sign * y_pos.repeat(C, 1).view(-1)
+    s_neg = sign * y_neg.view(-1)
+    losses = (F.softplus(-s_pos) + F.softplus(s_neg)).view(C, M).mean(0)
+    expected = losses.mean() if average else losses.sum()
+
+    kwargs = dict(C=C, energy_based=energy_based, average=average)
+
+    loss = model.logistic_loss(y_pos, y_neg, adversarial_temperature=None, **kwargs)
+    loss_uniform = model.logistic_loss(y_pos, y_neg, adversarial_temperature=0., **kwargs)
+
+    assert torch.allclose(loss, expected, atol=1e-6)
+    assert torch.allclose(loss_uniform, expected, atol=1e-6)
+
+
+def test_negative_loss_dispatch(model, scores):
+    y_pos, y_neg = scores
+
+    assert torch.allclose(model.negative_loss('margin', y_pos, y_neg, C=C),
+                          model.ranking_loss(y_pos, y_neg, C=C))
+    assert torch.allclose(model.negative_loss('logistic', y_pos, y_neg, C=C),
+                          model.logistic_loss(y_pos, y_neg, C=C))
+
+    with pytest.raises(ValueError):
+        model.negative_loss('hinge', y_pos, y_neg, C=C)